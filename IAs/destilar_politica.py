@@ -0,0 +1,84 @@
+"""
+Destila la política del modelo predictivo en una tabla de acciones: evalúa la
+red una vez sobre una grilla del espacio de observación de EquipoEnt y guarda
+la acción de cada punto (ver ``servidor/motor_tabla.py``). Al final informa
+qué porcentaje de observaciones aleatorias recibe la misma acción que el
+modelo completo.
+
+Uso:
+    python destilar_politica.py                        # grilla por defecto
+    python destilar_politica.py --puntos 201 101 501   # grilla más fina
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(os.path.dirname(DIRECTORIO), 'servidor'))
+from motor_numpy import MotorNumpy
+from motor_tabla import MotorTabla
+
+# Límites del espacio de observación de EquipoEnt: temperatura, vibración, presión
+LIMITES = np.array([[0, 0, 0], [100, 10, 500]], dtype=np.float32)
+
+# Puntos por eje de la grilla por defecto (pasos de 0.5 °C, 0.05 y 1)
+PUNTOS = (201, 201, 501)
+
+
+def cargar_politica(ruta_modelo):
+    """Política completa: la exportación NumPy si existe, si no el PPO original"""
+    ruta_npz = ruta_modelo + '.npz'
+    if os.path.exists(ruta_npz):
+        return MotorNumpy.cargar(ruta_npz)
+    from stable_baselines3 import PPO
+    return PPO.load(ruta_modelo, device='cpu')
+
+
+def evaluar_grilla(politica, puntos, bloque=1 << 18):
+    """Acción de la política en cada punto de la grilla, forma ``puntos``"""
+    ejes = [np.linspace(LIMITES[0, i], LIMITES[1, i], n, dtype=np.float32) for i, n in enumerate(puntos)]
+    total = int(np.prod(puntos))
+    acciones = np.empty(total, dtype=np.uint8)
+
+    # Se evalúa por bloques para no armar la grilla completa de observaciones
+    for inicio in range(0, total, bloque):
+        indices = np.unravel_index(np.arange(inicio, min(inicio + bloque, total)), puntos)
+        observaciones = np.stack([eje[i] for eje, i in zip(ejes, indices)], axis=1)
+        acciones[inicio:inicio + len(observaciones)], _ = politica.predict(observaciones, deterministic=True)
+    return acciones.reshape(puntos)
+
+
+def medir_coincidencia(politica, motor, n=200000, semilla=0):
+    """Fracción de observaciones aleatorias en que la tabla coincide con la política"""
+    rng = np.random.default_rng(semilla)
+    observaciones = rng.uniform(LIMITES[0], LIMITES[1], size=(n, 3)).astype(np.float32)
+    esperadas, _ = politica.predict(observaciones, deterministic=True)
+    obtenidas, _ = motor.predict(observaciones)
+    return float((np.asarray(esperadas) == obtenidas).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Destila la política PPO en una tabla de acciones")
+    parser.add_argument('--modelo', default=os.path.join(DIRECTORIO, 'modelo_predictivo'))
+    parser.add_argument('--salida', default=os.path.join(DIRECTORIO, 'modelo_predictivo_tabla.npz'))
+    parser.add_argument('--puntos', type=int, nargs=3, default=PUNTOS,
+                        metavar=('TEMPERATURA', 'VIBRACION', 'PRESION'),
+                        help="puntos de la grilla en cada eje")
+    parser.add_argument('--muestras', type=int, default=200000,
+                        help="observaciones aleatorias para medir la coincidencia")
+    args = parser.parse_args()
+
+    politica = cargar_politica(args.modelo)
+    acciones = evaluar_grilla(politica, tuple(args.puntos))
+    np.savez_compressed(args.salida, acciones=acciones, minimos=LIMITES[0], maximos=LIMITES[1])
+
+    coincidencia = medir_coincidencia(politica, MotorTabla(acciones, LIMITES[0], LIMITES[1]), args.muestras)
+    print(f"Tabla {'x'.join(map(str, acciones.shape))} guardada en {args.salida} "
+          f"({os.path.getsize(args.salida) / 1024:.1f} KB)")
+    print(f"Coincidencia con el modelo completo: {coincidencia:.4%} ({args.muestras} observaciones)")
+
+
+if __name__ == '__main__':
+    main()
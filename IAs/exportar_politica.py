@@ -0,0 +1,98 @@
+"""
+Exporta la red de política de ``modelo_predictivo.zip`` a un ``.npz`` que el
+servidor puede evaluar solo con NumPy (ver ``servidor/motor_numpy.py``).
+Después de escribirlo compara las acciones del ``.npz`` con las del PPO
+original y, si alguna difiere, borra la exportación y falla.
+
+Uso:
+    python exportar_politica.py                    # genera y verifica modelo_predictivo.npz
+    python exportar_politica.py --muestras 1000000 # verificación con más observaciones
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(os.path.dirname(DIRECTORIO), 'servidor'))
+from motor_numpy import MotorNumpy
+
+# Límites del espacio de observación de EquipoEnt: temperatura, vibración, presión
+LIMITES = np.array([[0, 0, 0], [100, 10, 500]], dtype=np.float32)
+
+
+def leer_politica(modelo):
+    """Devuelve (pesos, sesgos, activacion) de la política de un PPO cargado"""
+    from torch import nn
+
+    estado = modelo.policy.state_dict()
+    # Capas lineales de policy_net en orden, y al final action_net
+    capas = sorted(
+        {int(k.split('.')[2]) for k in estado if k.startswith('mlp_extractor.policy_net.')}
+    )
+    nombres = [f'mlp_extractor.policy_net.{i}' for i in capas] + ['action_net']
+    pesos = [estado[f'{n}.weight'].numpy() for n in nombres]
+    sesgos = [estado[f'{n}.bias'].numpy() for n in nombres]
+
+    # La activación con que se armó la red (Tanh por defecto en MlpPolicy)
+    activaciones = {nn.Tanh: 'tanh', nn.ReLU: 'relu'}
+    clase = modelo.policy.activation_fn
+    if clase not in activaciones:
+        raise ValueError(f"Activación no soportada por el motor NumPy: {clase.__name__}")
+    return pesos, sesgos, activaciones[clase]
+
+
+def exportar(ruta_zip, ruta_npz, muestras=100000):
+    """Exporta la política y verifica que el ``.npz`` dé las mismas acciones que el PPO"""
+    from stable_baselines3 import PPO
+
+    modelo = PPO.load(ruta_zip, device='cpu')
+    pesos, sesgos, activacion = leer_politica(modelo)
+    arreglos = {'n_capas': len(pesos), 'activacion': activacion}
+    for i, (w, b) in enumerate(zip(pesos, sesgos)):
+        arreglos[f'peso_{i}'] = w.astype(np.float32)
+        arreglos[f'sesgo_{i}'] = b.astype(np.float32)
+    np.savez_compressed(ruta_npz, **arreglos)
+    print(f"Política exportada a {ruta_npz} ({len(pesos)} capas, {activacion})")
+
+    diferencias = verificar(modelo, ruta_npz, muestras)
+    if diferencias:
+        os.remove(ruta_npz)
+        raise RuntimeError(f"La exportación difiere del PPO en {diferencias}/{muestras} acciones; se borró {ruta_npz}")
+
+
+def verificar(modelo, ruta_npz, n=100000, semilla=0):
+    """
+    Compara las acciones del motor NumPy con ``PPO.predict(deterministic=True)``
+    sobre ``n`` observaciones aleatorias dentro del espacio de observación.
+    Devuelve la cantidad de acciones que difieren.
+    """
+    motor = MotorNumpy.cargar(ruta_npz)
+
+    rng = np.random.default_rng(semilla)
+    observaciones = rng.uniform(LIMITES[0], LIMITES[1], size=(n, 3)).astype(np.float32)
+    esperadas, _ = modelo.predict(observaciones, deterministic=True)
+    obtenidas, _ = motor.predict(observaciones)
+
+    diferencias = int((np.asarray(esperadas) != obtenidas).sum())
+    print(f"Verificación: {n - diferencias}/{n} acciones coinciden")
+    return diferencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta la política PPO a NumPy")
+    parser.add_argument('--modelo', default=os.path.join(DIRECTORIO, 'modelo_predictivo.zip'))
+    parser.add_argument('--salida', default=os.path.join(DIRECTORIO, 'modelo_predictivo.npz'))
+    parser.add_argument('--muestras', type=int, default=100000, help="observaciones para comparar contra el PPO")
+    args = parser.parse_args()
+
+    try:
+        exportar(args.modelo, args.salida, args.muestras)
+    except (ValueError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -84,4 +84,24 @@ class SimulacionEstado(db.Model):
     Uso = db.Column(db.Float)
     Recompensa = db.Column(db.Float)
     Comentario = db.Column(db.Text)
-    vibracion = db.Column(db.Float) 
+    vibracion = db.Column(db.Float)
+
+class AgregadoBase:
+    """Columnas de una cubeta de agregados (ver servidor/agregados.py)"""
+    
+    maquina_id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)  # -1 = sensor sin máquina
+    sensor_id = db.Column(db.String(100), primary_key=True)
+    campo = db.Column(db.String(20), primary_key=True)
+    inicio = db.Column(db.DateTime, primary_key=True)
+    minimo = db.Column(db.Float)
+    maximo = db.Column(db.Float)
+    suma = db.Column(db.Float)
+    cantidad = db.Column(db.BigInteger)
+    ultimo = db.Column(db.Float)
+    ts_ultimo = db.Column(db.DateTime)
+
+class AgregadoMinuto(AgregadoBase, db.Model):
+    __tablename__ = 'Agregado_Minuto'
+
+class AgregadoHora(AgregadoBase, db.Model):
+    __tablename__ = 'Agregado_Hora'
@@ -0,0 +1,122 @@
+"""
+Exportación masiva de lecturas y simulaciones en CSV o NDJSON.
+
+Las filas se leen con un cursor del lado del servidor (``stream_results``) y
+se escriben por bloques a medida que llegan, así que la memoria no depende
+de la cantidad de filas y los primeros datos salen enseguida. El servidor
+usa las mismas funciones en ``/api/exportar``.
+
+    python bd/exportar_datos.py lecturas --desde 2025-06-01 --hasta 2025-06-02 --maquinas 1 2 > lecturas.csv
+    python bd/exportar_datos.py simulaciones --formato ndjson -o simulaciones.ndjson
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import date, datetime
+
+from sqlalchemy import create_engine, select
+
+try:
+    from Modelos import SimulacionEstado
+except ImportError:
+    from .Modelos import SimulacionEstado
+
+# Filas por bloque leído del cursor y escrito en la salida
+TAM_BLOQUE = 5000
+
+# Tipo de exportación -> columnas de Simulacion_estado
+TIPOS = {
+    'lecturas': ('linea_id', 'Fecha', 'Temperatura', 'vibracion', 'Presion'),
+    'simulaciones': tuple(c.name for c in SimulacionEstado.__table__.columns),
+}
+
+FORMATOS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def consulta(tipo, desde=None, hasta=None, maquinas=None):
+    """SELECT de la exportación, ordenado por fecha"""
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de exportación desconocido: {tipo!r} (disponibles: {', '.join(TIPOS)})")
+    tabla = SimulacionEstado.__table__
+    sentencia = select(*[tabla.c[c] for c in TIPOS[tipo]])
+    if desde is not None:
+        sentencia = sentencia.where(tabla.c.Fecha >= desde)
+    if hasta is not None:
+        sentencia = sentencia.where(tabla.c.Fecha <= hasta)
+    if maquinas:
+        sentencia = sentencia.where(tabla.c.linea_id.in_(maquinas))
+    return sentencia.order_by(tabla.c.Fecha, tabla.c.id_simulacion)
+
+
+def bloques(conexion, sentencia, tam_bloque=TAM_BLOQUE):
+    """Filas del resultado en bloques de ``tam_bloque``, con un cursor del lado del servidor"""
+    resultado = conexion.execution_options(stream_results=True, yield_per=tam_bloque).execute(sentencia)
+    try:
+        yield from resultado.partitions()
+    finally:
+        resultado.close()
+
+
+def _valor(valor):
+    return valor.isoformat() if isinstance(valor, (datetime, date)) else valor
+
+
+def exportar(conexion, tipo, formato='csv', desde=None, hasta=None, maquinas=None, tam_bloque=TAM_BLOQUE):
+    """
+    Genera la exportación como bloques de texto. La cabecera del CSV sale
+    antes de ejecutar la consulta.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido: {formato!r} (disponibles: {', '.join(FORMATOS)})")
+    sentencia = consulta(tipo, desde, hasta, maquinas)
+    columnas = TIPOS[tipo]
+    if formato == 'csv':
+        salida = io.StringIO()
+        escritor = csv.writer(salida, lineterminator='\n')
+        escritor.writerow(columnas)
+        yield salida.getvalue()
+        for filas in bloques(conexion, sentencia, tam_bloque):
+            salida.seek(0)
+            salida.truncate()
+            escritor.writerows([[_valor(v) for v in fila] for fila in filas])
+            yield salida.getvalue()
+    else:
+        for filas in bloques(conexion, sentencia, tam_bloque):
+            yield ''.join(json.dumps(dict(zip(columnas, map(_valor, fila))), ensure_ascii=False) + '\n'
+                          for fila in filas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exportar lecturas o simulaciones de la base de datos')
+    parser.add_argument('tipo', choices=TIPOS)
+    parser.add_argument('--formato', choices=FORMATOS, default='csv')
+    parser.add_argument('--desde', type=datetime.fromisoformat, help='Fecha ISO inicial (inclusive)')
+    parser.add_argument('--hasta', type=datetime.fromisoformat, help='Fecha ISO final (inclusive)')
+    parser.add_argument('--maquinas', type=int, nargs='+', help='Ids de máquinas (por defecto todas)')
+    parser.add_argument('--url', help='URL de la base de datos (por defecto la de database.py)')
+    parser.add_argument('-o', '--salida', help='Archivo de salida (por defecto la salida estándar)')
+    args = parser.parse_args()
+
+    if args.url is None:
+        try:
+            from database import get_database_uri
+        except ImportError:
+            from .database import get_database_uri
+        args.url = get_database_uri()
+
+    motor = create_engine(args.url)
+    salida = open(args.salida, 'w', encoding='utf-8', newline='') if args.salida else sys.stdout
+    try:
+        with motor.connect() as conexion:
+            for bloque in exportar(conexion, args.tipo, args.formato, args.desde, args.hasta, args.maquinas):
+                salida.write(bloque)
+    finally:
+        if salida is not sys.stdout:
+            salida.close()
+        motor.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,18 @@ from datetime import datetime
 # Añadir el directorio del servidor al path para importar los módulos
 server_path = os.path.join(os.path.dirname(__file__), '..', 'servidor')
 sys.path.append(server_path)
+from formato_binario import CodificadorBinario
 # Definir funciones de respaldo
 class Config:
     HOST = 'localhost'
     PORT = 5000
+    SENSOR_ID = os.environ.get('SENSOR_ID', 'sensor-1')
+    MAQUINA_ID = int(os.environ.get('MAQUINA_ID', 1))  # MaquinasCerveceria.id
+    PERIODO_MUESTREO = 1.0  # segundos entre lecturas
+    TAMANO_LOTE = 1         # lecturas por envío (1 = un evento 'datos_sensor' por lectura)
+    INTERVALO_FLUSH = 1.0   # segundos máximos que una lectura espera en el lote
+    MAX_LOTE_PAUSADO = 600  # lecturas que se guardan mientras el servidor pide frenar
+    FORMATO = os.environ.get('FORMATO', 'json')  # 'json' o 'binario' (ver servidor/formato_binario.py)
 
 def generar_datos_tiempo_real():
     return {
@@ -29,9 +37,15 @@ sio = socketio.Client(reconnection=True, reconnection_attempts=10,
 # Estado de conexión
 conectado = False
 
+# Codificador del formato binario (se reinicia en cada conexión)
+codificador = CodificadorBinario()
+
 # Estado de la máquina
 maquina_encendida = True
 
+# El servidor pide frenar el envío cuando su base de datos va atrasada
+envio_pausado = False
+
 # Estado de simulación de falla
 simulando_falla = False
 tiempo_falla_restante = 0
@@ -43,9 +57,16 @@ valores_actuales = {'temperatura': 0, 'vibracion': 0, 'presion': 0}
 
 @sio.event
 def connect():
-    global conectado
+    global conectado, codificador
     conectado = True
+    codificador = CodificadorBinario()
     print('Conexión establecida con el servidor')
+    # Registrarse como sensor activo en cada (re)conexión
+    registrar_sensor(True)
+
+def registrar_sensor(estado):
+    """Informa al servidor el estado del sensor con su identificador y su máquina"""
+    sio.emit('sensor_activo', {'estado': estado, 'sensor_id': Config.SENSOR_ID, 'maquina_id': Config.MAQUINA_ID})
 
 @sio.event
 def disconnect():
@@ -58,6 +79,10 @@ def handle_command(data):
     """Recibir comandos para cambiar el estado de la máquina"""
     global maquina_encendida, simulando_falla, valores_actuales
     
+    # Ignorar comandos dirigidos a otros sensores
+    if data.get('sensor_id') not in (None, Config.SENSOR_ID):
+        return
+    
     # Obtener el nuevo estado de la máquina
     nuevo_estado = data.get('encender', False)
     
@@ -118,10 +143,51 @@ def simular_valores_falla():
     
     return nuevos_valores
 
-def enviar_datos_sensores():
-    """Genera y envía datos de sensores simulados al servidor cada segundo"""
+@sio.on('control_flujo')
+def handle_flow_control(data):
+    """Pausar o reanudar el envío: mientras tanto las lecturas se acumulan en el lote"""
+    global envio_pausado
+    envio_pausado = bool(data.get('pausar'))
+    print(f"[CONTROL DE FLUJO] Envío {'pausado' if envio_pausado else 'reanudado'} "
+          f"({data.get('pendientes')} filas pendientes en el servidor)")
+
+def enviar_lote(lote, tamano_lote):
+    """Envía las lecturas acumuladas en un solo evento 'datos_sensor_batch' (formato columnar)"""
+    if not lote:
+        return
+    if Config.FORMATO == 'binario':
+        # Un dato o un lote en un solo mensaje binario, con los campos sin cambios omitidos
+        columnas = {campo: [datos[campo] for datos in lote]
+                    for campo in ('timestamp', 'temperatura', 'vibracion', 'presion')}
+        columnas['sensor_id'] = Config.SENSOR_ID
+        _, mensaje = codificador.codificar('nuevos_datos_lote', columnas)
+        sio.emit('datos_sensor_bin', mensaje)
+    elif tamano_lote <= 1:
+        for datos in lote:
+            sio.emit('datos_sensor', datos)
+    else:
+        sio.emit('datos_sensor_batch', {
+            campo: [datos[campo] for datos in lote]
+            for campo in ('timestamp', 'temperatura', 'vibracion', 'presion')
+        })
+    lote.clear()
+
+def enviar_datos_sensores(tamano_lote=None, intervalo_flush=None, periodo_muestreo=None):
+    """
+    Genera datos de sensores simulados cada ``periodo_muestreo`` segundos y los
+    envía al servidor en lotes de ``tamano_lote`` lecturas, o antes si la lectura
+    más antigua del lote lleva ``intervalo_flush`` segundos esperando.
+    """
     global valores_actuales, valores_normales, simulando_falla, tiempo_falla_restante, conectado
     
+    tamano_lote = tamano_lote or Config.TAMANO_LOTE
+    intervalo_flush = intervalo_flush if intervalo_flush is not None else Config.INTERVALO_FLUSH
+    periodo_muestreo = periodo_muestreo or Config.PERIODO_MUESTREO
+    
+    # Lecturas pendientes de envío y momento límite para enviarlas
+    lote = []
+    limite_flush = None
+    
     # Generar valores normales de referencia
     datos_ref = generar_datos_tiempo_real()
     valores_normales = {
@@ -137,18 +203,19 @@ def enviar_datos_sensores():
     contador_eventos = 0
     
     # Control de tiempo
-    proximo_envio = time.time() + 1.0
+    proximo_envio = time.time() + periodo_muestreo
     
     # Agregar variable para control de heartbeats
     proximo_heartbeat = time.time()
     
-    print("Enviando datos al servidor cada segundo...")
+    print(f"Enviando datos al servidor cada {periodo_muestreo} s en lotes de hasta {tamano_lote} lecturas...")
     
     while True:
         if conectado:
             tiempo_actual = time.time()
             
-            # Enviar heartbeat cada 2 segundos para que el servidor sepa que estamos vivos
+            # Enviar heartbeat si pasaron 2 segundos sin enviar datos (los datos también
+            # le indican al servidor que estamos vivos)
             if tiempo_actual >= proximo_heartbeat:
                 try:
                     sio.emit('heartbeat')
@@ -209,15 +276,23 @@ def enviar_datos_sensores():
                         'presion': round(max(0, valores_actuales['presion'] + ruido_pres), 2)
                     }
                     
-                    # Enviar datos al servidor
-                    sio.emit('datos_sensor', datos)
+                    # Acumular la lectura en el lote y enviarlo si está completo
+                    lote.append(datos)
+                    if len(lote) > Config.MAX_LOTE_PAUSADO:
+                        del lote[0]  # Pausado hace demasiado: se pierden las lecturas más viejas
+                    if limite_flush is None:
+                        limite_flush = tiempo_actual + intervalo_flush
+                    if len(lote) >= tamano_lote and not envio_pausado:
+                        enviar_lote(lote, tamano_lote)
+                        limite_flush = None
+                        proximo_heartbeat = tiempo_actual + 2.0
                     
-                    # Siguiente envío en 1 segundo exacto
-                    proximo_envio = tiempo_actual + 1.0
+                    # Siguiente lectura
+                    proximo_envio = tiempo_actual + periodo_muestreo
                     
                 except Exception as e:
                     print(f"Error: {str(e)}")
-                    proximo_envio = tiempo_actual + 1.0
+                    proximo_envio = tiempo_actual + periodo_muestreo
                     
                     # Intentar reconectar si perdimos conexión
                     if not sio.connected:
@@ -228,15 +303,24 @@ def enviar_datos_sensores():
                         except:
                             pass
             
+            # Enviar el lote incompleto si se cumplió el intervalo de flush (lo acumulado
+            # durante una pausa se envía junto como un solo lote)
+            if limite_flush is not None and time.time() >= limite_flush and not envio_pausado:
+                try:
+                    enviar_lote(lote, max(tamano_lote, len(lote)))
+                    proximo_heartbeat = time.time() + 2.0
+                except Exception as e:
+                    print(f"Error enviando lote: {str(e)}")
+                limite_flush = None
+            
             # Pausa breve para no consumir CPU
             time.sleep(0.01)
         else:
             print("Intentando conectar al servidor...")
             try:
                 sio.connect(f"http://{Config.HOST}:{Config.PORT}")
-                sio.emit('sensor_activo', {'estado': True})
                 print("Conectado exitosamente")
-                proximo_envio = time.time() + 1.0
+                proximo_envio = time.time() + periodo_muestreo
             except Exception as e:
                 print(f"Error al conectar: {str(e)}")
             time.sleep(1.0)
@@ -249,12 +333,9 @@ if __name__ == "__main__":
     print(f"Presione Ctrl+C para detener")
     
     try:
-        # Conectar al servidor
+        # Conectar al servidor (al conectar se registra como sensor activo)
         sio.connect(server_url)
         
-        # Registrar como sensor activo
-        sio.emit('sensor_activo', {'estado': True})
-        
         # Iniciar envío de datos
         enviar_datos_sensores()
         
@@ -269,7 +350,7 @@ if __name__ == "__main__":
                 print("Notificando desactivación del sensor")
                 # Intentar 3 veces con pequeños retrasos para asegurar que el mensaje llegue
                 for _ in range(3):
-                    sio.emit('sensor_activo', {'estado': False})
+                    registrar_sensor(False)
                     time.sleep(0.2)
             except Exception as e:
                 print(f"Error al notificar desactivación: {e}")
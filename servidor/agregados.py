@@ -0,0 +1,387 @@
+"""
+Agregados de las series de los sensores por minuto y por hora.
+
+Por cada máquina, sensor y campo se mantienen, para cada intervalo
+(cubeta), el mínimo, el máximo, la suma, la cantidad y el último valor (con
+su timestamp), sin contar los campos sin dato (NaN) de cada lectura. Se
+actualizan de forma incremental al llegar los datos, así
+que los reportes de turno y las tendencias de varias semanas leen unos
+cientos de cubetas en lugar de millones de lecturas.
+
+Cada lectura va a la cubeta de *su* timestamp, no del momento en que llega:
+un dato atrasado actualiza la cubeta que le corresponde. En memoria se
+guardan las cubetas hasta ``retencion`` segundos antes del dato más reciente
+de cada serie. Con persistencia, lo acumulado desde la última escritura se
+combina (upsert) con las filas de las tablas ``Agregado_Minuto`` y
+``Agregado_Hora`` de bd/Modelos.py, así que los datos atrasados también
+corrigen cubetas que ya se escribieron o que ya salieron de memoria. Si la
+base de datos no responde, lo que falta escribir se guarda hasta
+``max_pendientes`` cubetas; pasado ese límite se descartan las que terminaron antes
+y se cuentan en ``descartadas``.
+"""
+import atexit
+import heapq
+import itertools
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from bitacora import campos, obtener_logger
+from historial import HistorialSensores
+
+log = obtener_logger('agregados')
+
+CAMPOS = HistorialSensores.CAMPOS
+
+# Resolución -> segundos por cubeta
+RESOLUCIONES = {'1m': 60, '1h': 3600}
+
+# Columnas de las estadísticas de una cubeta (arreglo de forma (len(CAMPOS), 6))
+MINIMO, MAXIMO, SUMA, CANTIDAD, ULTIMO, TS_ULTIMO = range(6)
+
+SIN_MAQUINA = -1  # maquina_id en las tablas para sensores sin máquina
+
+
+def estadisticas(timestamps_ns, valores):
+    """
+    Estadísticas por cubeta de un lote, para cada resolución.
+    Devuelve ``{resolucion: (inicios_en_segundos, stats de forma (k, len(CAMPOS), 6))}``.
+    """
+    segundos = np.asarray(timestamps_ns, dtype=np.int64) / 1e9
+    valores = np.asarray(valores, dtype=np.float64)
+    resultado = {}
+    for resolucion, ancho in RESOLUCIONES.items():
+        cubetas = (segundos // ancho).astype(np.int64)
+        # Ordenar por cubeta y, dentro de cada cubeta, por tiempo
+        orden = np.lexsort((segundos, cubetas))
+        cubetas, ts, v = cubetas[orden], segundos[orden], valores[:, orden]
+        inicios, cortes = np.unique(cubetas, return_index=True)
+        presentes = ~np.isnan(v)
+        # Última lectura con dato de cada campo en cada cubeta (-1 = ninguna)
+        ultimos = np.maximum.reduceat(np.where(presentes, np.arange(len(cubetas)), -1), cortes, axis=1).T
+        con_dato = ultimos >= 0
+
+        stats = np.empty((len(inicios), len(CAMPOS), 6))
+        stats[:, :, MINIMO] = np.fmin.reduceat(v, cortes, axis=1).T
+        stats[:, :, MAXIMO] = np.fmax.reduceat(v, cortes, axis=1).T
+        stats[:, :, SUMA] = np.add.reduceat(np.where(presentes, v, 0.0), cortes, axis=1).T
+        stats[:, :, CANTIDAD] = np.add.reduceat(presentes.astype(np.int64), cortes, axis=1).T
+        stats[:, :, ULTIMO] = np.where(con_dato, v[np.arange(len(CAMPOS)), np.maximum(ultimos, 0)], np.nan)
+        stats[:, :, TS_ULTIMO] = np.where(con_dato, ts[np.maximum(ultimos, 0)], -np.inf)
+        resultado[resolucion] = (inicios * ancho, stats)
+    return resultado
+
+
+def combinar(a, b):
+    """Combina las estadísticas de dos cubetas del mismo intervalo"""
+    if a is None:
+        return b.copy()
+    r = a.copy()
+    r[:, MINIMO] = np.fmin(a[:, MINIMO], b[:, MINIMO])
+    r[:, MAXIMO] = np.fmax(a[:, MAXIMO], b[:, MAXIMO])
+    r[:, SUMA] += b[:, SUMA]
+    r[:, CANTIDAD] += b[:, CANTIDAD]
+    mas_nuevo = b[:, TS_ULTIMO] >= a[:, TS_ULTIMO]
+    r[mas_nuevo, ULTIMO] = b[mas_nuevo, ULTIMO]
+    r[mas_nuevo, TS_ULTIMO] = b[mas_nuevo, TS_ULTIMO]
+    return r
+
+
+def a_fecha(segundos):
+    """Epoch en segundos a datetime sin zona horaria (igual que los timestamps del historial)"""
+    return datetime.fromtimestamp(segundos, timezone.utc).replace(tzinfo=None)
+
+
+def a_segundos(fecha):
+    return fecha.replace(tzinfo=timezone.utc).timestamp()
+
+
+def a_dict(resolucion, maquina_id, sensor_id, inicio, stats, campos_pedidos=CAMPOS):
+    """Cubeta como dict para la API y los eventos"""
+    datos = {
+        'resolucion': resolucion,
+        'maquina_id': maquina_id,
+        'sensor_id': sensor_id,
+        'inicio': a_fecha(inicio).isoformat(),
+    }
+    for i, campo in enumerate(CAMPOS):
+        if campo in campos_pedidos:
+            fila = stats[i]
+            n = int(fila[CANTIDAD])
+            datos[campo] = {
+                'min': float(fila[MINIMO]) if n else None,
+                'max': float(fila[MAXIMO]) if n else None,
+                'media': float(fila[SUMA] / n) if n else None,
+                'n': n,
+                'ultimo': float(fila[ULTIMO]) if n else None,
+            }
+    return datos
+
+
+class Agregados:
+    """
+    Cubetas por minuto y por hora de cada serie (máquina, sensor), en memoria
+    y, opcionalmente, en la base de datos (ver el módulo).
+    """
+
+    def __init__(self, retencion=None, intervalo=10.0, persistir=False, url=None, max_pendientes=100000):
+        self.retencion = retencion or {'1m': 2 * 24 * 3600, '1h': 90 * 24 * 3600}
+        self.intervalo = intervalo  # Segundos entre escrituras en la base de datos
+        self.persistir = persistir
+        self.url = url              # None = la base de persistencia.url_base_datos()
+        self.al_cerrar = None  # callback(dict de la cubeta) al pasar a la siguiente cubeta de una serie
+        self._series = {r: {} for r in RESOLUCIONES}      # resolución -> (maquina, sensor) -> {inicio: stats}
+        self._pendientes = {r: {} for r in RESOLUCIONES}  # lo que falta escribir, con la misma forma
+        self.max_pendientes = max_pendientes
+        self.descartadas = 0  # Cubetas sin escribir descartadas por exceder max_pendientes
+        self._orden_pendientes = []  # Heap de (fin, n, resolución, serie) de las cubetas pendientes
+        self._contador = itertools.count()
+        self._marcas = {}  # (maquina, sensor) -> timestamp más reciente visto (segundos)
+        self._lock = threading.Lock()
+        self._motor = None
+        self._tablas = None
+        self._hilo = None
+        self._detenido = threading.Event()
+
+    def agregar(self, maquina_id, sensor_id, timestamps_ns, valores, local=True):
+        """
+        Suma un lote de lecturas (``valores`` de forma (len(CAMPOS), N)) a las cubetas
+        de la serie. ``local=False`` para datos recibidos por otro proceso, que es
+        el que los escribe en la base de datos y anuncia las cubetas terminadas.
+        """
+        if len(timestamps_ns) == 0:
+            return
+        serie = (maquina_id, sensor_id)
+        por_resolucion = estadisticas(timestamps_ns, valores)
+        cerradas = []
+        with self._lock:
+            marca_anterior = self._marcas.get(serie)
+            marca = max(marca_anterior or 0.0, float(np.max(timestamps_ns)) / 1e9)
+            self._marcas[serie] = marca
+            for resolucion, (inicios, stats) in por_resolucion.items():
+                cubetas = self._series[resolucion].setdefault(serie, {})
+                limite = marca - self.retencion[resolucion]
+                for inicio, s in zip(inicios.tolist(), stats):
+                    if inicio + RESOLUCIONES[resolucion] > limite:
+                        cubetas[inicio] = combinar(cubetas.get(inicio), s)
+                    if local and self.persistir:
+                        self._sumar_pendiente(resolucion, serie, inicio, s)
+                # Solo al pasar a otra cubeta hay cubetas terminadas o vencidas
+                desde = inicios[0] if marca_anterior is None else marca_anterior
+                if marca // RESOLUCIONES[resolucion] > desde // RESOLUCIONES[resolucion]:
+                    if local:
+                        cerradas.extend(self._cerradas(resolucion, serie, cubetas, desde, marca))
+                    self._olvidar(resolucion, cubetas, limite)
+
+        if self.al_cerrar is not None:
+            for cubeta in cerradas:
+                self.al_cerrar(cubeta)
+
+    def _sumar_pendiente(self, resolucion, serie, inicio, stats, anteriores=False):
+        """
+        Suma ``stats`` a la cubeta pendiente (con el lock tomado); ``anteriores``
+        si son datos más viejos que los pendientes. Pasado ``max_pendientes`` se
+        descartan las cubetas pendientes más antiguas.
+        """
+        pendientes = self._pendientes[resolucion].setdefault(serie, {})
+        actual = pendientes.get(inicio)
+        if actual is not None:
+            pendientes[inicio] = combinar(stats, actual) if anteriores else combinar(actual, stats)
+            return
+        pendientes[inicio] = stats.copy()
+        fin = inicio + RESOLUCIONES[resolucion]
+        heapq.heappush(self._orden_pendientes, (fin, next(self._contador), resolucion, serie))
+        descartadas = 0
+        while len(self._orden_pendientes) > self.max_pendientes:
+            fin, _, r, s = heapq.heappop(self._orden_pendientes)
+            cubetas = self._pendientes[r][s]
+            del cubetas[fin - RESOLUCIONES[r]]
+            if not cubetas:
+                del self._pendientes[r][s]
+            descartadas += 1
+        if descartadas:
+            self.descartadas += descartadas
+            log.warning("Agregados sin escribir descartados por exceder el máximo en memoria",
+                        extra=campos(descartadas=descartadas, total=self.descartadas))
+
+    @staticmethod
+    def _cerradas(resolucion, serie, cubetas, desde, marca):
+        """Cubetas que terminaron al avanzar la marca de la serie desde ``desde`` hasta ``marca``"""
+        ancho = RESOLUCIONES[resolucion]
+        desde, hasta = desde // ancho * ancho, marca // ancho * ancho
+        return [a_dict(resolucion, *serie, inicio, cubetas[inicio])
+                for inicio in sorted(cubetas) if desde <= inicio < hasta]
+
+    @staticmethod
+    def _olvidar(resolucion, cubetas, limite):
+        """Quita de memoria las cubetas que terminaron antes del límite de retención"""
+        ancho = RESOLUCIONES[resolucion]
+        for inicio in [i for i in cubetas if i + ancho <= limite]:
+            del cubetas[inicio]
+
+    def series(self):
+        with self._lock:
+            return sorted(self._marcas, key=str)
+
+    def consultar(self, resolucion, maquina_id=None, sensor_id=None, desde=None, hasta=None, campos_pedidos=CAMPOS):
+        """
+        Cubetas de la resolución con inicio en [desde, hasta] (epoch en segundos),
+        filtradas por máquina y sensor, ordenadas por serie y tiempo. Con
+        persistencia se leen de la base de datos (más lo que falta escribir).
+        """
+        if resolucion not in RESOLUCIONES:
+            raise ValueError(f"Resolución desconocida: {resolucion!r} (disponibles: {', '.join(RESOLUCIONES)})")
+        desde = -np.inf if desde is None else desde
+        hasta = np.inf if hasta is None else hasta
+
+        def elegir(series):
+            return {serie: {i: s for i, s in cubetas.items() if desde <= i <= hasta}
+                    for serie, cubetas in series.items()
+                    if (maquina_id is None or serie[0] == maquina_id) and (sensor_id is None or serie[1] == sensor_id)}
+
+        with self._lock:
+            if self._motor is None:
+                resultado = elegir(self._series[resolucion])
+            else:
+                pendientes = elegir(self._pendientes[resolucion])
+        if self._motor is not None:
+            resultado = self._leer(resolucion, maquina_id, sensor_id, desde, hasta)
+            for serie, cubetas in pendientes.items():
+                destino = resultado.setdefault(serie, {})
+                for inicio, stats in cubetas.items():
+                    destino[inicio] = combinar(destino.get(inicio), stats)
+
+        return [a_dict(resolucion, *serie, inicio, cubetas[inicio], campos_pedidos)
+                for serie, cubetas in sorted(resultado.items(), key=lambda x: str(x[0]))
+                for inicio in sorted(cubetas)]
+
+    # Persistencia
+
+    def iniciar(self):
+        """Con persistencia, inicia el hilo que escribe lo acumulado cada ``intervalo`` segundos (una sola vez)"""
+        if not self.persistir or self._hilo is not None:
+            return
+        from sqlalchemy import create_engine
+        from persistencia import AgregadoHora, AgregadoMinuto, url_base_datos
+        self._motor = create_engine(self.url or url_base_datos(), pool_pre_ping=True)
+        self._tablas = {'1m': AgregadoMinuto.__table__, '1h': AgregadoHora.__table__}
+        self._hilo = threading.Thread(target=self._bucle, name='agregados', daemon=True)
+        self._hilo.start()
+        atexit.register(self.detener)
+
+    def _bucle(self):
+        while not self._detenido.wait(self.intervalo):
+            self.escribir()
+
+    def escribir(self):
+        """Combina lo acumulado con las filas de la base de datos. Devuelve False si falló"""
+        from sqlalchemy.exc import SQLAlchemyError
+        with self._lock:
+            lote, self._pendientes = self._pendientes, {r: {} for r in RESOLUCIONES}
+            self._orden_pendientes = []
+        filas = {r: [fila for serie, cubetas in series.items() for inicio, stats in cubetas.items()
+                     for fila in self._filas(serie, inicio, stats)]
+                 for r, series in lote.items()}
+        if not any(filas.values()):
+            return True
+        try:
+            with self._motor.begin() as conexion:
+                for resolucion, tabla in self._tablas.items():
+                    if filas[resolucion]:
+                        conexion.execute(self._upsert(conexion, tabla), filas[resolucion])
+        except SQLAlchemyError as e:
+            log.error("No se pudieron escribir los agregados: %s", e.__class__.__name__,
+                      extra=campos(filas=sum(len(f) for f in filas.values())))
+            # Devolver lo no escrito para el próximo intento
+            with self._lock:
+                for resolucion, series in lote.items():
+                    for serie, cubetas in series.items():
+                        for inicio, stats in cubetas.items():
+                            self._sumar_pendiente(resolucion, serie, inicio, stats, anteriores=True)
+            return False
+        return True
+
+    @staticmethod
+    def _filas(serie, inicio, stats):
+        maquina_id, sensor_id = serie
+        for i, campo in enumerate(CAMPOS):
+            fila = stats[i]
+            if not fila[CANTIDAD]:
+                continue  # Campo sin datos en la cubeta: no hay fila
+            yield {
+                'maquina_id': SIN_MAQUINA if maquina_id is None else maquina_id,
+                'sensor_id': sensor_id,
+                'campo': campo,
+                'inicio': a_fecha(inicio),
+                'minimo': float(fila[MINIMO]),
+                'maximo': float(fila[MAXIMO]),
+                'suma': float(fila[SUMA]),
+                'cantidad': int(fila[CANTIDAD]),
+                'ultimo': float(fila[ULTIMO]),
+                'ts_ultimo': a_fecha(fila[TS_ULTIMO]),
+            }
+
+    @staticmethod
+    def _upsert(conexion, tabla):
+        """INSERT ... ON CONFLICT que combina la cubeta nueva con la existente"""
+        from sqlalchemy import case, func
+        if conexion.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+            menor, mayor = func.least, func.greatest
+        elif conexion.dialect.name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+            menor, mayor = func.min, func.max
+        else:
+            raise ValueError(f"Base de datos no soportada para agregados: {conexion.dialect.name}")
+        sentencia = insert(tabla)
+        nuevo = sentencia.excluded
+        return sentencia.on_conflict_do_update(
+            index_elements=[c for c in tabla.primary_key.columns],
+            set_={
+                'minimo': menor(tabla.c.minimo, nuevo.minimo),
+                'maximo': mayor(tabla.c.maximo, nuevo.maximo),
+                'suma': tabla.c.suma + nuevo.suma,
+                'cantidad': tabla.c.cantidad + nuevo.cantidad,
+                'ultimo': case((nuevo.ts_ultimo >= tabla.c.ts_ultimo, nuevo.ultimo), else_=tabla.c.ultimo),
+                'ts_ultimo': mayor(tabla.c.ts_ultimo, nuevo.ts_ultimo),
+            })
+
+    def _leer(self, resolucion, maquina_id, sensor_id, desde, hasta):
+        """Cubetas guardadas en la base de datos, con la misma forma que en memoria"""
+        from sqlalchemy import select
+        tabla = self._tablas[resolucion]
+        consulta = select(tabla)
+        if maquina_id is not None:
+            consulta = consulta.where(tabla.c.maquina_id == maquina_id)
+        if sensor_id is not None:
+            consulta = consulta.where(tabla.c.sensor_id == sensor_id)
+        if np.isfinite(desde):
+            consulta = consulta.where(tabla.c.inicio >= a_fecha(desde))
+        if np.isfinite(hasta):
+            consulta = consulta.where(tabla.c.inicio <= a_fecha(hasta))
+
+        resultado = {}
+        with self._motor.connect() as conexion:
+            for fila in conexion.execute(consulta):
+                serie = (None if fila.maquina_id == SIN_MAQUINA else fila.maquina_id, fila.sensor_id)
+                inicio = a_segundos(fila.inicio)
+                stats = resultado.setdefault(serie, {}).get(inicio)
+                if stats is None:
+                    # Campos sin fila: cubeta vacía
+                    stats = resultado[serie][inicio] = np.full((len(CAMPOS), 6), np.nan)
+                    stats[:, SUMA], stats[:, CANTIDAD], stats[:, TS_ULTIMO] = 0, 0, -np.inf
+                stats[CAMPOS.index(fila.campo)] = (fila.minimo, fila.maximo, fila.suma, fila.cantidad,
+                                                   fila.ultimo, a_segundos(fila.ts_ultimo))
+        return resultado
+
+    def detener(self):
+        """Escribe lo pendiente y detiene el hilo de persistencia"""
+        if self._hilo is None:
+            return
+        self._detenido.set()
+        self._hilo.join(timeout=self.intervalo + 5)
+        self._hilo = None
+        if not self.escribir():
+            log.error("Se perdieron agregados sin escribir")
+        self._motor.dispose()
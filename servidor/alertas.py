@@ -0,0 +1,225 @@
+"""
+Motor de reglas de alerta con histéresis, N de M y enfriamiento.
+
+Las reglas se declaran como dicts (ver ``Config.ALERTAS_REGLAS``)::
+
+    {'nombre': 'temperatura_critica', 'campo': 'temperatura', 'operador': '>', 'valor': 85,
+     'tipo': 'valor', 'histeresis': 2, 'n': 3, 'm': 5, 'enfriamiento': 60,
+     'severidad': 'critico', 'maquinas': [1, 2], 'limites': {3: 90}}
+
+- ``tipo``: 'valor' (la lectura), 'tasa' (variación por segundo) o
+  'anomalia' (``|z|`` respecto de la propia serie, ver ``anomalias``).
+- La alerta se activa cuando al menos ``n`` de las últimas ``m`` lecturas
+  cumplen la condición, y se resuelve cuando al menos ``n`` de las últimas
+  ``m`` quedan del otro lado de ``valor`` por más de ``histeresis``. Así una
+  lectura que oscila alrededor del límite no prende y apaga la alerta.
+- ``enfriamiento``: segundos durante los que no se vuelve a avisar la misma
+  regla para la misma serie después de un aviso.
+- ``maquinas`` limita la regla a esas máquinas y ``limites`` cambia ``valor``
+  para algunas máquinas.
+
+Las reglas de cada máquina se compilan en grupos por señal y operador, con
+los límites ordenados. Para un lote se busca por bisección qué reglas
+superó el máximo del lote; solo esas y las que ya tienen estado para la
+serie (activas o con lecturas recientes sobre el límite) se evalúan lectura
+por lectura, así que el costo no crece con las reglas que no se acercan a
+su límite.
+"""
+import threading
+
+import numpy as np
+
+from historial import HistorialSensores
+
+CAMPOS = HistorialSensores.CAMPOS
+TIPOS = ('valor', 'tasa', 'anomalia')
+OPERADORES = {'>': 1, '<': -1}
+SEVERIDADES = ('advertencia', 'critico')
+
+
+def validar(regla):
+    """Completa los valores por defecto de una regla; ValueError si es inválida"""
+    regla = {'tipo': 'valor', 'operador': '>', 'histeresis': 0.0, 'n': 1, 'm': 1, 'enfriamiento': 0.0,
+             'severidad': 'advertencia', 'maquinas': '*', 'limites': {}, **regla}
+    if 'nombre' not in regla or 'valor' not in regla:
+        raise ValueError(f"La regla necesita 'nombre' y 'valor': {regla}")
+    if regla['tipo'] not in TIPOS:
+        raise ValueError(f"Tipo de regla desconocido: {regla['tipo']!r} (disponibles: {', '.join(TIPOS)})")
+    if regla.get('campo') not in CAMPOS:
+        raise ValueError(f"Campo desconocido en la regla {regla['nombre']}: {regla.get('campo')!r}")
+    if regla['severidad'] not in SEVERIDADES:
+        raise ValueError(f"Severidad desconocida en la regla {regla['nombre']}: {regla['severidad']!r}")
+    if regla['operador'] not in OPERADORES:
+        raise ValueError(f"Operador desconocido en la regla {regla['nombre']}: {regla['operador']!r}")
+    if not 1 <= regla['n'] <= regla['m']:
+        raise ValueError(f"La regla {regla['nombre']} necesita 1 <= n <= m")
+    regla['limites'] = {int(m): v for m, v in regla['limites'].items()}
+    return regla
+
+
+class GrupoReglas:
+    """Reglas de una máquina sobre la misma señal y operador, ordenadas por límite"""
+
+    def __init__(self, tipo, campo, signo):
+        self.tipo, self.campo, self.signo = tipo, campo, signo
+        self.umbrales = []  # límite * signo (para comparar siempre con '>')
+        self.reglas = []
+
+    def ordenar(self):
+        orden = np.argsort(self.umbrales, kind='stable')
+        self.umbrales = np.asarray(self.umbrales, dtype=np.float64)[orden]
+        self.reglas = [self.reglas[i] for i in orden]
+
+
+class EstadoRegla:
+    """Estado de una regla para una serie (máquina, sensor)"""
+
+    __slots__ = ('activa', 'cumple', 'libera', 'ultimo_aviso', 'avisada', 'valor')
+
+    def __init__(self):
+        self.activa = False
+        self.cumple = 0   # Bits de las últimas m - 1 lecturas que cumplieron la condición
+        self.libera = 0   # Bits de las últimas m - 1 lecturas del otro lado de la histéresis
+        self.ultimo_aviso = None
+        self.avisada = False
+        self.valor = None
+
+    def vacio(self, ahora, enfriamiento):
+        """Sin nada que recordar: inactiva, sin lecturas recientes sobre el límite y fuera del enfriamiento"""
+        return (not self.activa and not self.cumple and
+                (self.ultimo_aviso is None or ahora - self.ultimo_aviso >= enfriamiento))
+
+
+def a_iso(segundos):
+    return str(HistorialSensores.a_iso([int(segundos * 1e9)])[0])
+
+
+def _bits(mascara, k):
+    return (mascara >> np.arange(k - 1, -1, -1)) & 1 if k else np.zeros(0, dtype=np.int64)
+
+
+def _mascara(bits):
+    return int(bits.astype(np.int64) @ (1 << np.arange(len(bits) - 1, -1, -1))) if len(bits) else 0
+
+
+def ventana(anteriores, condicion, m):
+    """
+    Cuántas de las últimas ``m`` lecturas cumplen, para cada lectura del lote,
+    y la máscara de bits de las últimas ``m - 1`` para el próximo lote.
+    """
+    completa = np.concatenate([_bits(anteriores, m - 1), condicion.astype(np.int64)])
+    acumulado = np.concatenate([[0], np.cumsum(completa)])
+    cuentas = acumulado[m:] - acumulado[:-m]
+    return cuentas, _mascara(completa[len(completa) - (m - 1):]) if m > 1 else 0
+
+
+class MotorAlertas:
+    """Evalúa las reglas sobre los lotes de lecturas de cada serie (ver el módulo)"""
+
+    def __init__(self, reglas=()):
+        self.reglas = [validar(r) for r in reglas]
+        self._compiladas = {}  # maquina_id -> {(tipo, campo, signo): GrupoReglas}
+        self._estados = {}     # (maquina_id, sensor_id) -> {(grupo, índice de la regla): EstadoRegla}
+        self._lock = threading.Lock()
+
+    def compilar(self, maquina_id):
+        """Grupos de reglas que aplican a la máquina (se compilan una vez por máquina)"""
+        grupos = self._compiladas.get(maquina_id)
+        if grupos is None:
+            grupos = {}
+            for regla in self.reglas:
+                if regla['maquinas'] != '*' and maquina_id not in regla['maquinas']:
+                    continue
+                signo = OPERADORES[regla['operador']]
+                clave = (regla['tipo'], regla['campo'], signo)
+                grupo = grupos.setdefault(clave, GrupoReglas(*clave))
+                grupo.umbrales.append(signo * regla['limites'].get(maquina_id, regla['valor']))
+                grupo.reglas.append(regla)
+            for grupo in grupos.values():
+                grupo.ordenar()
+            self._compiladas[maquina_id] = grupos
+        return grupos
+
+    def evaluar(self, maquina_id, sensor_id, timestamps_ns, valores, z=None, tasa=None):
+        """
+        Evalúa un lote de lecturas de una serie (``valores``, ``z`` y ``tasa`` de
+        forma (len(CAMPOS), N); sin ``z`` o ``tasa`` se omiten esas reglas).
+        Devuelve los eventos de alerta (activa/resuelta) a avisar, en orden.
+        """
+        senales = {'valor': valores, 'tasa': tasa, 'anomalia': None if z is None else np.abs(z)}
+        tiempos = np.asarray(timestamps_ns, dtype=np.int64) / 1e9
+        eventos = []
+        with self._lock:
+            estados = self._estados.setdefault((maquina_id, sensor_id), {})
+            for clave, grupo in self.compilar(maquina_id).items():
+                senal = senales[grupo.tipo]
+                if senal is None:
+                    continue
+                x = grupo.signo * np.asarray(senal[CAMPOS.index(grupo.campo)], dtype=np.float64)
+                # Reglas cuyo límite superó alguna lectura, más las que ya tienen estado
+                candidatas = set(range(int(np.searchsorted(grupo.umbrales, x.max(), side='left'))))
+                candidatas.update(i for c, i in estados if c == clave)
+                for i in sorted(candidatas):
+                    regla = grupo.reglas[i]
+                    estado = estados.setdefault((clave, i), EstadoRegla())
+                    eventos.extend(self._evaluar_regla(regla, grupo, grupo.umbrales[i], estado, x, tiempos,
+                                                       maquina_id, sensor_id))
+                    if estado.vacio(tiempos[-1], regla['enfriamiento']):
+                        del estados[(clave, i)]
+            if not estados:
+                del self._estados[(maquina_id, sensor_id)]
+        eventos.sort(key=lambda e: e['timestamp'])
+        for evento in eventos:
+            evento['timestamp'] = a_iso(evento['timestamp'])
+        return eventos
+
+    @staticmethod
+    def _evaluar_regla(regla, grupo, umbral, estado, x, tiempos, maquina_id, sensor_id):
+        n, m = regla['n'], regla['m']
+        cuentas_cumple, estado.cumple = ventana(estado.cumple, x > umbral, m)
+        cuentas_libera, estado.libera = ventana(estado.libera, x <= umbral - regla['histeresis'], m)
+
+        # Estado de la alerta tras cada lectura: la última decisión (activar o resolver) vigente
+        decision = np.where(cuentas_cumple >= n, 1, np.where(cuentas_libera >= n, 0, -1))
+        indices = np.where(decision >= 0, np.arange(len(x)), -1)
+        ultima = np.maximum.accumulate(indices)
+        activa = np.where(ultima >= 0, decision[np.maximum(ultima, 0)], int(estado.activa)).astype(bool)
+        previa = np.concatenate([[estado.activa], activa[:-1]])
+        cambios = np.flatnonzero(activa != previa)
+
+        eventos = []
+        for i in cambios:
+            activada = bool(activa[i])
+            if activada:
+                # Enfriamiento: no repetir el aviso de la misma regla y serie
+                estado.avisada = (estado.ultimo_aviso is None or
+                                  tiempos[i] - estado.ultimo_aviso >= regla['enfriamiento'])
+                if estado.avisada:
+                    estado.ultimo_aviso = tiempos[i]
+                estado.valor = float(grupo.signo * x[i])
+            if estado.avisada:
+                eventos.append({
+                    'regla': regla['nombre'],
+                    'estado': 'activa' if activada else 'resuelta',
+                    'severidad': regla['severidad'],
+                    'tipo': regla['tipo'],
+                    'campo': regla['campo'],
+                    'maquina_id': maquina_id,
+                    'sensor_id': sensor_id,
+                    'valor': round(float(grupo.signo * x[i]), 4),
+                    'limite': float(grupo.signo * umbral),
+                    'timestamp': float(tiempos[i]),
+                })
+            if not activada:
+                estado.avisada = False
+        estado.activa = bool(activa[-1])
+        return eventos
+
+    def activas(self, maquina_id=None):
+        """Alertas activas (avisadas) de todas las series o de una máquina"""
+        with self._lock:
+            return [{'regla': self._compiladas[maquina][clave].reglas[i]['nombre'], 'maquina_id': maquina,
+                     'sensor_id': sensor, 'valor': estado.valor, 'desde': a_iso(estado.ultimo_aviso)}
+                    for (maquina, sensor), estados in self._estados.items()
+                    if maquina_id is None or maquina == maquina_id
+                    for (clave, i), estado in estados.items() if estado.activa and estado.avisada]
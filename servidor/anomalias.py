@@ -0,0 +1,183 @@
+"""
+Detección de anomalías en línea con estadísticas por serie (máquina, sensor).
+
+Por cada serie y campo se lleva la media y la varianza con media móvil
+exponencial (EWMA, factor ``alfa``). Mientras la serie tiene menos de
+``1/alfa`` lecturas el factor es ``1/n``, que da exactamente la media y la
+varianza de Welford, así que los primeros datos no arrastran el valor inicial.
+
+Cada lectura recibe, antes de actualizar las estadísticas:
+
+- ``z``: desvíos de la lectura respecto de la media de su propia serie,
+- ``tasa``: variación por segundo respecto de la lectura anterior,
+- ``puntaje``: el mayor ``|z|`` entre los campos.
+
+Una lectura suelta se procesa en O(1). Un lote se procesa de una vez para
+todos los campos: la recurrencia de la EWMA se resuelve con sumas acumuladas
+en lugar de un bucle por lectura.
+
+Un campo sin dato (NaN) no cambia las estadísticas de su campo y recibe
+``z`` y ``tasa`` 0; los lotes con campos sin dato se procesan lectura por
+lectura. La cantidad de lecturas se cuenta por campo.
+"""
+import math
+import threading
+
+import numpy as np
+
+from historial import HistorialSensores
+
+CAMPOS = HistorialSensores.CAMPOS
+
+
+class EstadoSerie:
+    """Estadísticas acumuladas de una serie"""
+
+    __slots__ = ('n', 'media', 'varianza', 'ultimo', 'ts_ultimo')
+
+    def __init__(self):
+        self.n = np.zeros(len(CAMPOS), dtype=np.int64)  # Lecturas con dato, por campo
+        self.media = np.zeros(len(CAMPOS))
+        self.varianza = np.zeros(len(CAMPOS))
+        self.ultimo = None
+        self.ts_ultimo = None
+
+
+def recurrencia(inicial, entradas, d):
+    """
+    Resuelve ``y[i] = d * y[i-1] + entradas[:, i]`` para todas las columnas a la vez.
+    Se trabaja por bloques para que ``d ** -i`` no desborde.
+    """
+    salida = np.empty_like(entradas)
+    bloque = max(1, int(30 / -math.log(d))) if 0 < d < 1 else entradas.shape[1]
+    y = inicial
+    for inicio in range(0, entradas.shape[1], bloque):
+        u = entradas[:, inicio:inicio + bloque]
+        potencias = d ** np.arange(1, u.shape[1] + 1)
+        salida[:, inicio:inicio + u.shape[1]] = potencias * (y[:, None] + np.cumsum(u / potencias, axis=1))
+        y = salida[:, inicio + u.shape[1] - 1]
+    return salida
+
+
+class DetectorAnomalias:
+    """
+    Puntajes de anomalía por serie (ver el módulo). ``minimo`` es la cantidad
+    de lecturas antes de dar puntajes (antes son 0). El desvío usado nunca es
+    menor que ``desvio_minimo`` más ``RELATIVO`` veces la media, para no dar
+    puntajes enormes en campos casi constantes.
+    """
+
+    RELATIVO = 1e-3
+
+    def __init__(self, alfa=0.01, minimo=10, desvio_minimo=1e-3):
+        self.alfa = alfa
+        self.minimo = minimo
+        self.desvio_minimo = desvio_minimo
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def olvidar(self, maquina_id, sensor_id):
+        with self._lock:
+            self._series.pop((maquina_id, sensor_id), None)
+
+    def puntuar(self, maquina_id, sensor_id, timestamps_ns, valores):
+        """
+        Puntúa y suma a las estadísticas de la serie un lote de lecturas
+        (``valores`` de forma (len(CAMPOS), N)). Devuelve ``(z, tasa, puntaje)``
+        con formas (len(CAMPOS), N), (len(CAMPOS), N) y (N,).
+        """
+        x = np.asarray(valores, dtype=np.float64).reshape(len(CAMPOS), -1)
+        t = np.asarray(timestamps_ns, dtype=np.int64) / 1e9
+        n_lote = x.shape[1]
+        with self._lock:
+            estado = self._series.get((maquina_id, sensor_id))
+            if estado is None:
+                estado = self._series[(maquina_id, sensor_id)] = EstadoSerie()
+            if n_lote == 1:
+                return self._puntuar_uno(estado, x[:, 0], t[0])
+            if np.isnan(x).any():
+                # Campos sin dato: lectura por lectura
+                z, tasa, puntaje = zip(*(self._puntuar_uno(estado, x[:, i], t[i]) for i in range(n_lote)))
+                return np.hstack(z), np.hstack(tasa), np.concatenate(puntaje)
+
+            # Media y varianza vigentes antes de cada lectura
+            medias = np.empty_like(x)
+            varianzas = np.empty_like(x)
+            cantidades = estado.n[:, None] + np.arange(n_lote)
+
+            # Calentamiento: factor 1/n (Welford), lectura por lectura
+            calentamiento = min(n_lote, max(0, math.ceil(1 / self.alfa) - int(estado.n.min())))
+            for i in range(calentamiento):
+                medias[:, i], varianzas[:, i] = estado.media, estado.varianza
+                self._actualizar(estado, x[:, i], np.maximum(self.alfa, 1 / (estado.n + 1)))
+            # Resto: factor constante, resuelto de una vez
+            if calentamiento < n_lote:
+                self._actualizar_lote(estado, x[:, calentamiento:], medias[:, calentamiento:],
+                                      varianzas[:, calentamiento:])
+
+            anteriores_x = np.hstack([x[:, :1] if estado.ultimo is None else estado.ultimo[:, None], x[:, :-1]])
+            anteriores_t = np.append(t[0] if estado.ts_ultimo is None else estado.ts_ultimo, t[:-1])
+            estado.ultimo, estado.ts_ultimo = x[:, -1].copy(), t[-1]
+
+        z = np.where(cantidades >= self.minimo, (x - medias) / self._desvio(medias, varianzas), 0.0)
+        dt = t - anteriores_t
+        # Un campo que nunca tuvo dato deja NaN en la lectura anterior: tasa 0
+        tasa = np.divide(x - anteriores_x, dt, out=np.zeros_like(x), where=(dt > 0) & ~np.isnan(anteriores_x))
+        return z, tasa, np.abs(z).max(axis=0)
+
+    def _puntuar_uno(self, estado, x, t):
+        """Camino rápido de una sola lectura (también con campos sin dato)"""
+        presentes = ~np.isnan(x)
+        z = (x - estado.media) / self._desvio(estado.media, estado.varianza)
+        z = np.where(presentes & (estado.n >= self.minimo), z, 0.0)
+        dt = 0.0 if estado.ts_ultimo is None else t - estado.ts_ultimo
+        if dt > 0:
+            tasa = x - estado.ultimo
+            tasa = np.where(np.isnan(tasa), 0.0, tasa / dt)
+        else:
+            tasa = np.zeros(len(CAMPOS))
+        self._actualizar(estado, x, np.maximum(self.alfa, 1 / (estado.n + 1)))
+        # Cada campo recuerda su último dato (la tasa usa el tiempo de la última lectura)
+        estado.ultimo, estado.ts_ultimo = (x if estado.ultimo is None else np.where(presentes, x, estado.ultimo)), t
+        return z[:, None], tasa[:, None], np.abs(z).max(keepdims=True)
+
+    def _desvio(self, media, varianza):
+        return np.maximum(np.sqrt(varianza), self.desvio_minimo + self.RELATIVO * np.abs(media))
+
+    @staticmethod
+    def _actualizar(estado, x, alfa):
+        """Suma una lectura con factor ``alfa`` (por campo); los campos sin dato no cambian"""
+        presentes = ~np.isnan(x)
+        diferencia = np.where(presentes, x - estado.media, 0.0)
+        incremento = alfa * diferencia
+        estado.media = estado.media + incremento
+        estado.varianza = np.where(presentes, (1 - alfa) * (estado.varianza + diferencia * incremento), estado.varianza)
+        estado.n = estado.n + presentes
+
+    def _actualizar_lote(self, estado, x, medias, varianzas):
+        """EWMA de factor ``alfa`` sobre varias lecturas; llena la media y varianza previas a cada una"""
+        a, d = self.alfa, 1 - self.alfa
+        nuevas_medias = recurrencia(estado.media, a * x, d)
+        medias[:, 0] = estado.media
+        medias[:, 1:] = nuevas_medias[:, :-1]
+        diferencias = x - medias
+        nuevas_varianzas = recurrencia(estado.varianza, d * a * diferencias ** 2, d)
+        varianzas[:, 0] = estado.varianza
+        varianzas[:, 1:] = nuevas_varianzas[:, :-1]
+        estado.media, estado.varianza = nuevas_medias[:, -1], nuevas_varianzas[:, -1]
+        estado.n += x.shape[1]
+
+    @staticmethod
+    def resumen(z, tasa, puntaje, indice=None):
+        """
+        Puntajes como dict para adjuntar a los datos que se envían a los
+        dashboards: de una lectura (``indice``) o listas para todo el lote.
+        """
+        if indice is not None:
+            z, tasa, puntaje = z[:, indice], tasa[:, indice], puntaje[indice]
+        redondear = (lambda v: round(float(v), 3)) if indice is not None else (lambda v: v.round(3).tolist())
+        return {
+            'puntaje': redondear(puntaje),
+            'z': {campo: redondear(z[i]) for i, campo in enumerate(CAMPOS)},
+            'tasa': {campo: redondear(tasa[i]) for i, campo in enumerate(CAMPOS)},
+        }
@@ -8,21 +8,24 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'IAs'))
 
 # Importar módulos refactorizados
 from config import Config
+from bitacora import obtener_logger
 from routes.sensores_routes import web_blueprint
 from routes.api_routes import api_blueprint
 from routes.markov_routes import markov_blueprint
 from socket_events import setup_socket_events
+from servicio import ServicioSocket
+from emisores import EmisorFlask
+from bus import crear_bus, manager_socketio
+from estado import agregados, alertas, estimador, historial, registro
+from difusion import Difusor
+from inferencia import PoolInferencia
+from vigilancia import VigilanciaSensores
+from anomalias import DetectorAnomalias
 
-# Load the predictive model
-from modelo_predictivo import modelo_prediccion
+log = obtener_logger('app')
 
-# Variables globales (se pueden mover a un módulo de estado si crece más)
-datos_recientes = []
-sensor_activo = False
-maquina_encendida = True
-proximo_envio = 0
-ultimo_heartbeat = 0
-TIMEOUT_SENSOR = 5  # seconds before considering sensor disconnected
+# The predictive model is loaded in the background when the inference pool starts
+from modelo_predictivo import modelo_prediccion
 
 # Crear la aplicación Flask con la carpeta estática configurada
 app = Flask(__name__, static_url_path='/static')
@@ -31,13 +34,43 @@ app.config['SECRET_KEY'] = 'secret_key_for_socketio'
 # Registrar blueprints
 app.register_blueprint(web_blueprint)
 app.register_blueprint(api_blueprint, url_prefix='/api')
+app.register_blueprint(markov_blueprint)
+
+# Bus con los demás procesos del servidor (Config.BUS_URL; 'local' = un solo proceso)
+bus = crear_bus()
 
 # Inicializar Socket.IO
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', client_manager=manager_socketio(bus))
+
+# Los servicios envían mensajes a través del emisor (ver asgi_app.py para el modo asyncio)
+emisor = EmisorFlask(socketio)
+
+# Difusión de datos a los dashboards con control de ritmo por cliente
+difusor = Difusor(emisor, profundidad=Config.DIFUSION_PROFUNDIDAD, max_hz=Config.DIFUSION_MAX_HZ,
+                  max_sin_ack=Config.DIFUSION_MAX_SIN_ACK, tiempo_max_rezago=Config.DIFUSION_TIEMPO_REZAGO,
+                  desconectar_lentos=Config.DIFUSION_DESCONECTAR_LENTOS, tiempo_ack=Config.DIFUSION_TIEMPO_ACK)
+
+# Pool de inferencia (el modelo no se ejecuta dentro de los handlers)
+inferencia = PoolInferencia(modelo_prediccion, Config.INFERENCIA_TRABAJADORES, Config.INFERENCIA_COLA,
+                            Config.INFERENCIA_PROCESOS, Config.INFERENCIA_VENTANA_MS, Config.INFERENCIA_MAX_LOTE)
+
+# Detección de sensores perdidos por vencimiento de plazos (sin datos en cero en este servidor)
+vigilancia = VigilanciaSensores(emisor, registro, historial, difusor, Config.TIMEOUT_SENSOR)
+
+# Puntajes de anomalía por máquina y sensor, adjuntos a los datos que se difunden
+anomalias = DetectorAnomalias(Config.ANOMALIAS_ALFA, Config.ANOMALIAS_MINIMO)
+
+# Persistencia diferida de lecturas y predicciones (opcional, requiere la base de datos)
+escritor = None
+if Config.PERSISTENCIA_HABILITADA:
+    from persistencia import EscritorDiferido
+    escritor = EscritorDiferido(Config.PERSISTENCIA_URL, Config.PERSISTENCIA_LOTE, Config.PERSISTENCIA_INTERVALO,
+                                Config.PERSISTENCIA_MAX_PENDIENTES)
 
 # Configurar eventos de socket
-setup_socket_events(socketio, datos_recientes, sensor_activo, maquina_encendida, 
-                    proximo_envio, ultimo_heartbeat, TIMEOUT_SENSOR)
+servicio = ServicioSocket(emisor, historial, registro, difusor, inferencia, vigilancia, bus, escritor,
+                          agregados, anomalias, alertas, estimador)
+setup_socket_events(socketio, servicio)
 
 @app.errorhandler(404)
 def page_not_found(e):
@@ -54,9 +87,9 @@ if __name__ == '__main__':
     os.makedirs(os.path.join(os.path.dirname(__file__), 'templates'), exist_ok=True)
     os.makedirs(os.path.join(os.path.dirname(__file__), 'routes'), exist_ok=True)
     
-    print(f"Iniciando servidor en http://{Config.HOST}:{Config.PORT}")
-    print(f"Accede al dashboard en tu navegador con la URL http://localhost:{Config.PORT}")
-    print(f"Modelo predictivo cargado: {'Sí' if modelo_prediccion.model is not None else 'No'}")
+    log.info("Iniciando servidor en http://%s:%s", Config.HOST, Config.PORT)
+    log.info("Accede al dashboard en tu navegador con la URL http://localhost:%s", Config.PORT)
+    log.info("Modelo predictivo cargando en segundo plano (consulta /api/estado)")
     
     # Iniciar el servidor Flask-SocketIO
     socketio.run(app, host=Config.HOST, port=Config.PORT, debug=Config.DEBUG)
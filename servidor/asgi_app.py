@@ -0,0 +1,131 @@
+"""
+Servidor asyncio (ASGI) con el ``AsyncServer`` de python-socketio.
+
+Alternativa a ``flask_server.py``/``app.py`` para muchas conexiones
+simultáneas: cada conexión es una corrutina en lugar de un hilo del sistema.
+Los eventos son los mismos (``ServicioSocket``); los que procesan lotes de
+datos corren en un executor, la inferencia ya corre en el pool de inferencia
+y el difusor y la vigilancia usan sus propios hilos. Las páginas y la API
+REST siguen siendo las de Flask, servidas a través de ``WsgiToAsgi``.
+
+Requiere ``uvicorn`` y ``asgiref``:
+
+    cd servidor
+    uvicorn asgi_app:asgi --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import socketio
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask
+
+# Add the IAs directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'IAs'))
+
+from config import Config
+from bitacora import campos, obtener_logger
+from routes.sensores_routes import web_blueprint
+from routes.api_routes import api_blueprint
+from routes.markov_routes import markov_blueprint
+from estado import agregados, alertas, estimador, historial, registro
+from difusion import Difusor
+from inferencia import PoolInferencia
+from vigilancia import VigilanciaSensores
+from anomalias import DetectorAnomalias
+from modelo_predictivo import modelo_prediccion
+from servicio import ServicioSocket
+from emisores import EmisorAsincrono
+from bus import crear_bus, manager_socketio
+
+log = obtener_logger('asgi')
+
+# Páginas y API REST (Flask, WSGI)
+app = Flask(__name__, static_url_path='/static')
+app.config['SECRET_KEY'] = 'secret_key_for_socketio'
+app.register_blueprint(web_blueprint)
+app.register_blueprint(api_blueprint, url_prefix='/api')
+app.register_blueprint(markov_blueprint)
+
+# Socket.IO asyncio, con los demás procesos del servidor conectados por el bus
+bus = crear_bus()
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*',
+                           client_manager=manager_socketio(bus, asincrono=True))
+emisor = EmisorAsincrono(sio)
+
+difusor = Difusor(emisor, profundidad=Config.DIFUSION_PROFUNDIDAD, max_hz=Config.DIFUSION_MAX_HZ,
+                  max_sin_ack=Config.DIFUSION_MAX_SIN_ACK, tiempo_max_rezago=Config.DIFUSION_TIEMPO_REZAGO,
+                  desconectar_lentos=Config.DIFUSION_DESCONECTAR_LENTOS, tiempo_ack=Config.DIFUSION_TIEMPO_ACK)
+inferencia = PoolInferencia(modelo_prediccion, Config.INFERENCIA_TRABAJADORES, Config.INFERENCIA_COLA,
+                            Config.INFERENCIA_PROCESOS, Config.INFERENCIA_VENTANA_MS, Config.INFERENCIA_MAX_LOTE)
+vigilancia = VigilanciaSensores(emisor, registro, historial, difusor, Config.TIMEOUT_SENSOR,
+                                periodo_reposo=Config.UPDATE_INTERVAL)
+
+# Puntajes de anomalía por máquina y sensor, adjuntos a los datos que se difunden
+anomalias = DetectorAnomalias(Config.ANOMALIAS_ALFA, Config.ANOMALIAS_MINIMO)
+
+# Persistencia diferida de lecturas y predicciones (opcional, requiere la base de datos)
+escritor = None
+if Config.PERSISTENCIA_HABILITADA:
+    from persistencia import EscritorDiferido
+    escritor = EscritorDiferido(Config.PERSISTENCIA_URL, Config.PERSISTENCIA_LOTE, Config.PERSISTENCIA_INTERVALO,
+                                Config.PERSISTENCIA_MAX_PENDIENTES)
+
+servicio = ServicioSocket(emisor, historial, registro, difusor, inferencia, vigilancia, bus, escritor,
+                          agregados, anomalias, alertas, estimador)
+
+# Executor para los eventos bloqueantes, y un lock por sesión para que los
+# lotes de un mismo sensor se procesen en orden (el formato binario es diferencial)
+ejecutor = ThreadPoolExecutor(Config.ASGI_EJECUTOR_HILOS, thread_name_prefix='asgi')
+candados = {}
+
+
+async def arrancar():
+    """Fija el loop del emisor e inicia los servicios (una sola vez)"""
+    if emisor.loop is None:
+        emisor.iniciar()
+        servicio.iniciar()
+        log.info("Servidor asyncio listo", extra=campos(hilos_ejecutor=Config.ASGI_EJECUTOR_HILOS))
+
+
+async def detener():
+    """Escribe en la base de datos lo que quede pendiente al cerrar el servidor"""
+    if escritor is not None:
+        await asyncio.get_running_loop().run_in_executor(ejecutor, escritor.detener)
+    await asyncio.get_running_loop().run_in_executor(ejecutor, agregados.detener)
+
+
+@sio.event
+async def connect(sid, environ, auth=None):
+    # Por si el servidor ASGI no envía los eventos de lifespan
+    await arrancar()
+    servicio.conectar(sid)
+
+
+@sio.event
+async def disconnect(sid, *_):
+    candados.pop(sid, None)
+    servicio.desconectar(sid)
+
+
+def registrar(evento, metodo):
+    atender = getattr(servicio, metodo)
+
+    if evento in ServicioSocket.BLOQUEANTES:
+        async def handler(sid, datos=None):
+            async with candados.setdefault(sid, asyncio.Lock()):
+                return await asyncio.get_running_loop().run_in_executor(ejecutor, atender, sid, datos)
+    else:
+        async def handler(sid, datos=None):
+            return atender(sid, datos)
+
+    sio.on(evento, handler)
+
+
+for evento, metodo in ServicioSocket.EVENTOS.items():
+    if evento not in ('connect', 'disconnect'):
+        registrar(evento, metodo)
+
+asgi = socketio.ASGIApp(sio, other_asgi_app=WsgiToAsgi(app), on_startup=arrancar, on_shutdown=detener)
@@ -0,0 +1,163 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+from config import Config
+
+RAIZ = 'cbn'
+
+_lock = threading.Lock()
+_listener = None
+_manejador = None
+_por_frame = True
+
+
+def campos(**valores):
+    """Campos estructurados de un mensaje: ``log.info("...", extra=campos(sensor_id=...))``"""
+    return {'campos': valores}
+
+
+class FormatoEstructurado(logging.Formatter):
+    """Una línea por mensaje: JSON, o texto con los campos como clave=valor"""
+
+    def __init__(self, formato='texto'):
+        super().__init__()
+        self.json = formato == 'json'
+
+    def format(self, record):
+        extra = getattr(record, 'campos', None) or {}
+        if self.json:
+            salida = {
+                'ts': self.formatTime(record),
+                'nivel': record.levelname,
+                'logger': record.name,
+                'mensaje': record.getMessage(),
+            }
+            salida.update(extra)
+            if record.exc_info:
+                salida['excepcion'] = self.formatException(record.exc_info)
+            return json.dumps(salida, ensure_ascii=False, default=str)
+
+        texto = f"{self.formatTime(record)} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        if extra:
+            texto += ' ' + ' '.join(f"{k}={v}" for k, v in extra.items())
+        if record.exc_info:
+            texto += '\n' + self.formatException(record.exc_info)
+        return texto
+
+
+class FiltroFrecuencia(logging.Filter):
+    """
+    Limita cuántas veces por segundo se escribe cada mensaje (por logger y
+    plantilla del mensaje, no por sus valores) y muestrea los mensajes por dato:
+    de ellos se deja pasar 1 de cada ``muestreo``. Cuando un mensaje vuelve a
+    pasar después de haber sido limitado lleva el campo ``suprimidos``.
+    """
+
+    def __init__(self, max_por_segundo=20, muestreo=1):
+        super().__init__()
+        self.max_por_segundo = max_por_segundo
+        self.muestreo = max(1, muestreo)
+        self._estado = {}  # clave -> [fichas, último instante, suprimidos, vistos]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        clave = (record.name, record.msg)
+        ahora = time.monotonic()
+        with self._lock:
+            estado = self._estado.get(clave)
+            if estado is None:
+                estado = self._estado[clave] = [self.max_por_segundo, ahora, 0, 0]
+
+            if getattr(record, 'por_frame', False) and self.muestreo > 1:
+                estado[3] += 1
+                if estado[3] % self.muestreo != 1:
+                    return False
+
+            # Cubeta de fichas: se recarga a max_por_segundo fichas por segundo
+            estado[0] = min(self.max_por_segundo, estado[0] + (ahora - estado[1]) * self.max_por_segundo)
+            estado[1] = ahora
+            if estado[0] < 1:
+                estado[2] += 1
+                return False
+            estado[0] -= 1
+            suprimidos, estado[2] = estado[2], 0
+
+        if suprimidos:
+            record.campos = dict(getattr(record, 'campos', None) or {}, suprimidos=suprimidos)
+        return True
+
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """
+    Encola los mensajes para que los escriba el hilo del QueueListener. No
+    formatea en el hilo que registra el mensaje y, si la cola está llena,
+    descarta el mensaje en lugar de bloquear.
+    """
+
+    def __init__(self, cola):
+        super().__init__(cola)
+        self.descartados = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+def configurar(nivel=None, formato=None, por_frame=None, muestreo=None, max_por_segundo=None,
+               tamano_cola=None):
+    """
+    Configura la bitácora del servidor (una sola vez; los valores por defecto
+    salen de ``Config``). La escritura a consola ocurre en un hilo aparte.
+    """
+    global _listener, _manejador, _por_frame
+    with _lock:
+        if _listener is not None:
+            return
+        _por_frame = Config.LOG_POR_FRAME if por_frame is None else por_frame
+
+        salida = logging.StreamHandler(sys.stdout)
+        salida.setFormatter(FormatoEstructurado(formato or Config.LOG_FORMATO))
+
+        _manejador = ManejadorCola(queue.Queue(tamano_cola or Config.LOG_COLA))
+        _manejador.addFilter(FiltroFrecuencia(max_por_segundo or Config.LOG_MAX_POR_SEGUNDO,
+                                              muestreo or Config.LOG_MUESTREO_FRAMES))
+
+        raiz = logging.getLogger(RAIZ)
+        raiz.setLevel(nivel or Config.LOG_NIVEL)
+        raiz.addHandler(_manejador)
+        raiz.propagate = False
+
+        _listener = logging.handlers.QueueListener(_manejador.queue, salida)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def obtener_logger(nombre):
+    """Logger del módulo ``nombre`` dentro de la bitácora del servidor"""
+    configurar()
+    return logging.getLogger(f"{RAIZ}.{nombre}")
+
+
+def por_frame(logger, nivel, mensaje, *args, **valores):
+    """
+    Mensaje por cada dato recibido: no hace nada si ``LOG_POR_FRAME`` está
+    apagado y, si no, se muestrea y se limita como los demás.
+    """
+    if _por_frame and logger.isEnabledFor(nivel):
+        logger.log(nivel, mensaje, *args, extra={'campos': valores, 'por_frame': True})
+
+
+def descartados():
+    """Mensajes descartados porque la cola de la bitácora estaba llena"""
+    return _manejador.descartados if _manejador is not None else 0
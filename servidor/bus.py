@@ -0,0 +1,311 @@
+"""
+Bus de mensajes entre procesos del servidor (pub/sub).
+
+Cada proceso (trabajador) tiene su propio bus conectado a los demás. Un
+mensaje publicado en un canal llega a los suscriptores de ese canal en los
+*otros* procesos; el proceso que publica ya lo aplicó por su cuenta.
+
+Backends (``crear_bus(url)``):
+
+- ``local``: dentro del proceso. Con un solo servidor no hay a quién
+  entregar; varios buses del mismo proceso sí se ven entre sí.
+- ``unix:///ruta/al/socket``: varios procesos de la misma máquina,
+  conectados a un ``BrokerBus`` que reenvía los mensajes (ver
+  ``trabajadores.py``).
+
+Para agregar otro backend (por ejemplo Redis) basta con una subclase de
+``Bus`` que implemente ``iniciar``, ``publicar`` y ``cerrar`` y llame a
+``_entregar`` al recibir, registrada en ``BACKENDS``.
+
+``manager_socketio(bus)`` devuelve el client manager de python-socketio que
+reparte los emit, las salas y los acks de Socket.IO entre los procesos.
+"""
+import asyncio
+import os
+from abc import ABC, abstractmethod
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+from socketio import PubSubManager
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from bitacora import campos, obtener_logger
+from config import Config
+
+log = obtener_logger('bus')
+
+
+class Bus(ABC):
+    """Interfaz común de los backends del bus"""
+
+    def __init__(self):
+        self._suscriptores = {}  # canal -> [callback(mensaje)]
+
+    def suscribir(self, canal, callback):
+        """Llama a ``callback(mensaje)`` con cada mensaje del canal publicado por otro proceso"""
+        self._suscriptores.setdefault(canal, []).append(callback)
+
+    def iniciar(self):
+        pass
+
+    @abstractmethod
+    def publicar(self, canal, mensaje):
+        """Envía el mensaje a los suscriptores del canal en los demás procesos"""
+
+    def cerrar(self):
+        pass
+
+    def _entregar(self, canal, mensaje):
+        for callback in self._suscriptores.get(canal, ()):
+            try:
+                callback(mensaje)
+            except Exception:
+                log.exception("Error al atender un mensaje del bus", extra=campos(canal=canal))
+
+
+class BusLocal(Bus):
+    """Bus dentro del proceso: entrega a los demás buses de la misma red, en el hilo que publica"""
+
+    _RED = []
+
+    def __init__(self, red=None):
+        super().__init__()
+        self._red = BusLocal._RED if red is None else red
+        self._red.append(self)
+
+    def publicar(self, canal, mensaje):
+        for bus in list(self._red):
+            if bus is not self:
+                bus._entregar(canal, mensaje)
+
+    def cerrar(self):
+        if self in self._red:
+            self._red.remove(self)
+
+
+class BusMultiproceso(Bus):
+    """
+    Bus entre procesos a través de un ``BrokerBus`` escuchando en un socket
+    Unix. Los mensajes se serializan con pickle y la conexión se autentica
+    con ``clave``, que debe ser secreta (``trabajadores.py`` genera una
+    aleatoria en cada ejecución). Si se pierde la conexión se reintenta en segundo plano;
+    mientras tanto lo publicado se descarta.
+    """
+
+    REINTENTO = 1.0  # segundos entre intentos de conexión
+
+    def __init__(self, direccion, clave):
+        super().__init__()
+        self.direccion = direccion
+        self.clave = clave
+        self.descartados = 0
+        self._conexion = None
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._cerrado = False
+
+    def iniciar(self):
+        """Conecta con el broker e inicia el hilo de recepción (una sola vez)"""
+        if self._hilo is None:
+            self._conectar()
+            self._hilo = threading.Thread(target=self._recibir, name='bus', daemon=True)
+            self._hilo.start()
+
+    def _conectar(self):
+        try:
+            conexion = Client(self.direccion, family='AF_UNIX', authkey=self.clave)
+        except OSError as e:
+            log.warning("No se pudo conectar con el broker del bus: %s", e, extra=campos(direccion=self.direccion))
+            return False
+        with self._lock:
+            self._conexion = conexion
+        log.info("Conectado al broker del bus", extra=campos(direccion=self.direccion, pid=os.getpid()))
+        return True
+
+    def publicar(self, canal, mensaje):
+        with self._lock:
+            if self._conexion is not None:
+                try:
+                    self._conexion.send((canal, mensaje))
+                    return
+                except OSError:
+                    self._conexion = None
+            self.descartados += 1
+
+    def _recibir(self):
+        while not self._cerrado:
+            conexion = self._conexion
+            if conexion is None:
+                time.sleep(self.REINTENTO)
+                self._conectar()
+                continue
+            try:
+                canal, mensaje = conexion.recv()
+            except (EOFError, OSError):
+                if not self._cerrado:
+                    log.warning("Se perdió la conexión con el broker del bus", extra=campos(direccion=self.direccion))
+                with self._lock:
+                    if self._conexion is conexion:
+                        self._conexion = None
+                continue
+            self._entregar(canal, mensaje)
+
+    def cerrar(self):
+        self._cerrado = True
+        with self._lock:
+            if self._conexion is not None:
+                self._conexion.close()
+                self._conexion = None
+
+
+class BrokerBus:
+    """
+    Reenvía cada mensaje recibido de un proceso a todos los demás procesos
+    conectados, tal como llegó (sin deserializarlo). Corre en el proceso que
+    lanza los trabajadores. El socket se crea accesible solo para el usuario
+    del servidor; conviene que además esté en un directorio privado.
+    """
+
+    def __init__(self, direccion, clave):
+        self.direccion = direccion
+        self.clave = clave
+        self._conexiones = {}  # conexión -> lock de envío
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def iniciar(self):
+        """Empieza a aceptar conexiones en un hilo aparte"""
+        if os.path.exists(self.direccion):
+            os.unlink(self.direccion)  # Socket de una ejecución anterior
+        mascara = os.umask(0o177)  # Socket con permisos 0600 desde que se crea
+        try:
+            self._listener = Listener(self.direccion, family='AF_UNIX', authkey=self.clave)
+        finally:
+            os.umask(mascara)
+        threading.Thread(target=self._aceptar, name='broker-bus', daemon=True).start()
+        log.info("Broker del bus escuchando", extra=campos(direccion=self.direccion))
+
+    def _aceptar(self):
+        while True:
+            try:
+                conexion = self._listener.accept()
+            except OSError:
+                return  # Listener cerrado
+            except Exception:
+                log.exception("Conexión rechazada por el broker del bus")
+                continue
+            with self._lock:
+                self._conexiones[conexion] = threading.Lock()
+            threading.Thread(target=self._reenviar, args=(conexion,), daemon=True).start()
+
+    def _reenviar(self, origen):
+        while True:
+            try:
+                mensaje = origen.recv_bytes()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                destinos = [(c, l) for c, l in self._conexiones.items() if c is not origen]
+            for conexion, lock in destinos:
+                try:
+                    with lock:
+                        conexion.send_bytes(mensaje)
+                except OSError:
+                    self._quitar(conexion)
+        self._quitar(origen)
+
+    def _quitar(self, conexion):
+        with self._lock:
+            self._conexiones.pop(conexion, None)
+        conexion.close()
+
+    def conectados(self):
+        return len(self._conexiones)
+
+    def cerrar(self):
+        if self._listener is not None:
+            self._listener.close()
+        with self._lock:
+            conexiones = list(self._conexiones)
+        for conexion in conexiones:
+            self._quitar(conexion)
+        if os.path.exists(self.direccion):
+            os.unlink(self.direccion)
+
+
+def _bus_unix(url):
+    clave = Config.BUS_CLAVE
+    if not clave:
+        raise ValueError("El bus 'unix' necesita una clave secreta (CBN_BUS_CLAVE o trabajadores.py)")
+    return BusMultiproceso(url[len('unix://'):], clave.encode() if isinstance(clave, str) else clave)
+
+
+# Esquema de la URL -> constructor del bus
+BACKENDS = {
+    'local': lambda url: BusLocal(),
+    'unix': _bus_unix,
+}
+
+
+def crear_bus(url=None):
+    """Crea el bus indicado por la URL (por defecto ``Config.BUS_URL``)"""
+    url = url or Config.BUS_URL
+    esquema = url.split('://', 1)[0]
+    if esquema not in BACKENDS:
+        raise ValueError(f"Backend de bus no soportado: {url!r} (disponibles: {', '.join(BACKENDS)})")
+    return BACKENDS[esquema](url)
+
+
+class ManagerBus(PubSubManager):
+    """Client manager de Socket.IO (servidor con hilos) sobre un ``Bus``"""
+
+    name = 'bus'
+
+    def __init__(self, bus, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.bus = bus
+        self._cola = queue.Queue()
+        bus.suscribir(channel, self._cola.put)
+
+    def _publish(self, data):
+        self.bus.publicar(self.channel, data)
+
+    def _listen(self):
+        while True:
+            yield self._cola.get()
+
+
+class ManagerBusAsincrono(AsyncPubSubManager):
+    """Client manager de Socket.IO (servidor asyncio) sobre un ``Bus``"""
+
+    name = 'bus'
+
+    def __init__(self, bus, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.bus = bus
+        self._loop = None
+        self._cola = None
+        bus.suscribir(channel, self._recibido)
+
+    def _recibido(self, mensaje):
+        # Llega en el hilo del bus: se pasa al loop del servidor
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._cola.put_nowait, mensaje)
+
+    async def _publish(self, data):
+        self.bus.publicar(self.channel, data)
+
+    async def _listen(self):
+        self._cola = asyncio.Queue()
+        self._loop = asyncio.get_running_loop()
+        while True:
+            yield await self._cola.get()
+
+
+def manager_socketio(bus, asincrono=False):
+    """Client manager de Socket.IO para el bus, o None si no hay otros procesos (bus local)"""
+    if isinstance(bus, BusLocal):
+        return None
+    return ManagerBusAsincrono(bus) if asincrono else ManagerBus(bus)
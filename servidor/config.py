@@ -1,6 +1,74 @@
+import os
+
+
 class Config:
     HOST = '0.0.0.0'
     PORT = 5000
     DEBUG = True
-    MAX_DATA_POINTS = 1000
-    UPDATE_INTERVAL = 1
+    HISTORIAL_MEMORIA_MB = 256  # RAM máxima para el historial de lecturas
+    HISTORIAL_SENSOR_PUNTOS = 3600  # Lecturas máximas en el historial de cada sensor (~140 KB)
+    REGISTRO_FRAGMENTOS = 64  # Fragmentos (locks independientes) del registro de sensores
+    TIMEOUT_SENSOR = 5  # segundos sin heartbeat antes de considerar el sensor desconectado
+    UPDATE_INTERVAL = 1  # segundos entre datos en cero mientras no hay sensores activos
+    API_MAX_PUNTOS = 1000  # Puntos máximos por serie en /api/datos con rango de tiempo (LTTB)
+    # Difusión a dashboards
+    DIFUSION_PROFUNDIDAD = 256        # Datos pendientes que se guardan por cliente como máximo
+    DIFUSION_MAX_HZ = 10              # Envíos por segundo a cada dashboard como máximo
+    DIFUSION_MAX_SIN_ACK = 8          # Vueltas de envío sin confirmar antes de considerar lento al cliente
+    DIFUSION_TIEMPO_REZAGO = 30       # Segundos atrasado antes de avisar (o desconectar) al cliente
+    DIFUSION_DESCONECTAR_LENTOS = False
+    DIFUSION_TIEMPO_ACK = 10          # Segundos sin confirmaciones antes de dar por perdidos los envíos pendientes
+    # Inferencia del modelo predictivo
+    INFERENCIA_TRABAJADORES = 2       # Hilos (o procesos) que ejecutan el modelo
+    INFERENCIA_COLA = 1024            # Pedidos en espera antes de usar la regla de umbrales
+    INFERENCIA_PROCESOS = False       # True = pool de procesos en lugar de hilos
+    INFERENCIA_VENTANA_MS = 5         # Tiempo máximo que se juntan pedidos en un micro-lote
+    INFERENCIA_MAX_LOTE = 256         # Observaciones máximas por llamada al modelo
+    MOTOR_INFERENCIA = 'auto'         # 'auto' (NumPy si existe la exportación, si no SB3), 'numpy', 'tabla' o 'sb3'
+    # Servidor asyncio (asgi_app.py)
+    ASGI_EJECUTOR_HILOS = 8           # Hilos para los eventos con trabajo de CPU (lotes de datos)
+    # Bus entre procesos (ver bus.py y trabajadores.py)
+    BUS_URL = os.environ.get('CBN_BUS', 'local')      # 'local' o 'unix:///ruta/al/socket'
+    BUS_CLAVE = os.environ.get('CBN_BUS_CLAVE')  # Clave secreta del broker (trabajadores.py genera una)
+    # Persistencia diferida de lecturas y predicciones (ver persistencia.py)
+    PERSISTENCIA_HABILITADA = False
+    PERSISTENCIA_URL = os.environ.get('CBN_BD_URL')  # None = la base de bd/database.py
+    PERSISTENCIA_LOTE = 1000          # Filas por inserción
+    PERSISTENCIA_INTERVALO = 1.0      # Segundos máximos que una fila espera en memoria
+    PERSISTENCIA_MAX_PENDIENTES = 100000  # Filas en memoria antes de descartar (al 80% se frena a los sensores)
+    # Agregados por minuto y por hora (ver agregados.py); con persistencia se guardan en la base
+    AGREGADOS_RETENCION = {'1m': 2 * 24 * 3600, '1h': 90 * 24 * 3600}  # Segundos en memoria por resolución
+    AGREGADOS_INTERVALO = 10.0        # Segundos entre escrituras de agregados en la base de datos
+    AGREGADOS_MAX_PENDIENTES = 100000  # Cubetas sin escribir en memoria antes de descartar las más antiguas
+    # Detección de anomalías por serie (ver anomalias.py)
+    ANOMALIAS_ALFA = 0.01             # Factor de la media móvil exponencial (~100 lecturas de memoria)
+    ANOMALIAS_MINIMO = 10             # Lecturas de una serie antes de dar puntajes
+    # Límites por defecto para clasificar lecturas en bueno/medio/malo (máquinas sin fila en Maquinas_Cerveceria)
+    ESTIMADOR_LIMITES = {'temp_mini': 20.0, 'temp_maxi': 70.0, 'presion_max': 150.0}
+    ESTIMADOR_MARGEN = 0.1            # Fracción del rango junto a los límites que cuenta como 'medio'
+    ESTIMADOR_OLVIDO = 0.999          # Olvido exponencial de las transiciones (1 = sin olvido)
+
+    # Reglas de alerta (ver alertas.py): se activan con n de m lecturas y se resuelven pasada la histéresis
+    ALERTAS_REGLAS = [
+        {'nombre': 'temperatura_alta', 'campo': 'temperatura', 'valor': 70, 'histeresis': 2,
+         'n': 3, 'm': 5, 'enfriamiento': 60, 'severidad': 'advertencia'},
+        {'nombre': 'temperatura_critica', 'campo': 'temperatura', 'valor': 85, 'histeresis': 2,
+         'n': 3, 'm': 5, 'enfriamiento': 60, 'severidad': 'critico'},
+        {'nombre': 'vibracion_alta', 'campo': 'vibracion', 'valor': 7, 'histeresis': 0.5,
+         'n': 3, 'm': 5, 'enfriamiento': 60, 'severidad': 'advertencia'},
+        {'nombre': 'vibracion_critica', 'campo': 'vibracion', 'valor': 9, 'histeresis': 0.5,
+         'n': 3, 'm': 5, 'enfriamiento': 60, 'severidad': 'critico'},
+        {'nombre': 'presion_alta', 'campo': 'presion', 'valor': 150, 'histeresis': 5,
+         'n': 3, 'm': 5, 'enfriamiento': 60, 'severidad': 'advertencia'},
+        {'nombre': 'presion_critica', 'campo': 'presion', 'valor': 200, 'histeresis': 5,
+         'n': 3, 'm': 5, 'enfriamiento': 60, 'severidad': 'critico'},
+        {'nombre': 'deriva_temperatura', 'tipo': 'anomalia', 'campo': 'temperatura', 'valor': 6,
+         'histeresis': 3, 'n': 3, 'm': 5, 'enfriamiento': 300, 'severidad': 'advertencia'},
+    ]
+    # Bitácora (logging)
+    LOG_NIVEL = 'INFO'
+    LOG_FORMATO = 'texto'             # 'texto' o 'json' (una línea por mensaje)
+    LOG_POR_FRAME = True              # False en producción: sin mensajes por cada dato recibido
+    LOG_MUESTREO_FRAMES = 1           # Se escribe 1 de cada N mensajes por dato
+    LOG_MAX_POR_SEGUNDO = 20          # Mensajes por segundo como máximo para cada tipo de mensaje
+    LOG_COLA = 10000                  # Mensajes en espera de escribirse antes de descartar
@@ -0,0 +1,379 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from bitacora import campos, obtener_logger
+from formato_binario import MAX_PUNTOS, CodificadorBinario
+from historial import HistorialSensores
+
+log = obtener_logger('difusion')
+
+
+class ClienteDifusion:
+    """Estado de envío de un dashboard conectado"""
+
+    def __init__(self, sid):
+        self.sid = sid
+        self.suscripciones = {}    # flujo -> conjunto de máquinas ('*' = todas)
+        self.cursor = None         # Secuencia del próximo dato pendiente para este cliente
+        self.sin_ack = 0           # Vueltas de envío que el cliente todavía no confirmó
+        self.ultimo_ack = 0.0      # Última confirmación (o primer envío sin confirmar)
+        self.por_defecto = False   # Sigue con la suscripción por defecto (no envió 'suscribir')
+        self.ultimo_envio = 0.0
+        self.rezagado_desde = None
+        self.avisado = False
+        self.descartados = 0       # Datos que nunca llegó a recibir por quedarse atrás
+        self.codificador = None    # CodificadorBinario si el cliente negoció el formato binario
+
+    def to_dict(self):
+        return {
+            'sid': self.sid,
+            'suscripciones': {f: sorted(map(str, m)) for f, m in self.suscripciones.items()},
+            'sin_ack': self.sin_ack,
+            'rezagado': self.rezagado_desde is not None,
+            'descartados': self.descartados,
+            'formato': 'json' if self.codificador is None else 'binario'
+        }
+
+
+class Difusor:
+    """
+    Envía los datos de los sensores a cada dashboard respetando su ritmo.
+
+    Los datos publicados se guardan una sola vez en una cola compartida de
+    profundidad acotada y cada cliente mantiene un cursor sobre ella, así que
+    publicar es O(1) sin importar cuántos dashboards haya. Cada cliente recibe
+    solo los flujos y máquinas a los que se suscribió. Un hilo aparte
+    atiende a los clientes como máximo ``max_hz`` veces por segundo: si un
+    cliente tiene varios datos pendientes de un mismo sensor (porque va lento o
+    por el límite de frecuencia) recibe solo el último, con un resumen de
+    mínimos y máximos de los datos intermedios de ese sensor; cada sensor de
+    cada máquina tiene su propio mensaje. Los mensajes de una vuelta se
+    confirman juntos (con el último), y los clientes que acumulan
+    ``max_sin_ack`` vueltas sin confirmar dejan de recibir datos; si siguen atrasados más de
+    ``tiempo_max_rezago`` segundos se les avisa con 'cliente_lento' y,
+    opcionalmente, se los desconecta. Si un cliente no confirma nada durante
+    ``tiempo_ack`` segundos se dan por perdidos sus envíos pendientes y vuelve
+    a recibir datos. Los clientes que negociaron el formato binario reciben
+    los datos y predicciones codificados con su propio codificador (ver
+    ``formato_binario``), con los lotes grandes (y sus predicciones) partidos
+    en mensajes de ``MAX_PUNTOS`` puntos como máximo.
+
+    Un cliente agregado con ``agregar_cliente`` recibe los flujos de
+    ``por_defecto`` de todas las máquinas hasta que se suscriba a algo.
+    """
+
+    # Flujos que pasan por el difusor; los demás (alertas, agregados) van por salas de Socket.IO
+    FLUJOS = ('datos', 'predicciones')
+
+    def __init__(self, emisor, evento='nuevos_datos', profundidad=256, max_hz=10,
+                 max_sin_ack=8, tiempo_max_rezago=30, desconectar_lentos=False, tiempo_ack=10,
+                 por_defecto=FLUJOS):
+        self.emisor = emisor
+        self.evento = evento
+        self.intervalo = 1.0 / max_hz
+        self.max_sin_ack = max_sin_ack
+        self.tiempo_ack = tiempo_ack
+        self.por_defecto = tuple(por_defecto or ())
+        self.tiempo_max_rezago = tiempo_max_rezago
+        self.desconectar_lentos = desconectar_lentos
+        self._cola = deque(maxlen=profundidad)  # (secuencia, flujo, maquina, evento, datos)
+        self._secuencia = 0
+        self._clientes = {}
+        self._condicion = threading.Condition()
+        self._hilo = None
+
+    def iniciar(self):
+        """Inicia el hilo de envío (una sola vez)"""
+        if self._hilo is None:
+            self._hilo = self.emisor.start_background_task(self._bucle)
+
+    def publicar(self, datos, evento=None, flujo='datos', maquina=None):
+        """
+        Publica un dato (o un lote con ``evento='nuevos_datos_lote'``) del
+        ``flujo`` indicado para los clientes suscritos a esa máquina.
+        """
+        with self._condicion:
+            self._cola.append((self._secuencia, flujo, maquina, evento or self.evento, datos))
+            self._secuencia += 1
+            self._condicion.notify()
+
+    def agregar_cliente(self, sid):
+        """Agrega un dashboard con la suscripción por defecto (si todavía no existe)"""
+        with self._condicion:
+            if sid in self._clientes:
+                return
+            cliente = self._cliente(sid)
+            if self.por_defecto:
+                cliente.suscripciones = {flujo: {'*'} for flujo in self.por_defecto}
+                cliente.por_defecto = True
+
+    def quitar_cliente(self, sid):
+        with self._condicion:
+            self._clientes.pop(sid, None)
+
+    def _cliente(self, sid):
+        """Cliente con ese sid, creándolo si todavía no existe (con el lock tomado)"""
+        cliente = self._clientes.get(sid)
+        if cliente is None:
+            cliente = ClienteDifusion(sid)
+            cliente.cursor = self._secuencia
+            self._clientes[sid] = cliente
+        return cliente
+
+    def suscribir(self, sid, flujo, maquinas):
+        """Suscribe al cliente al ``flujo`` de las ``maquinas`` indicadas ('*' = todas)"""
+        with self._condicion:
+            cliente = self._cliente(sid)
+            if cliente.por_defecto:
+                # La primera suscripción explícita reemplaza a la por defecto
+                cliente.suscripciones, cliente.por_defecto = {}, False
+            cliente.suscripciones.setdefault(flujo, set()).update(maquinas)
+
+    def formato(self, sid, formato):
+        """Elige el formato de los mensajes del cliente: 'json' o 'binario'"""
+        with self._condicion:
+            self._cliente(sid).codificador = CodificadorBinario() if formato == 'binario' else None
+
+    def desuscribir(self, sid, flujo, maquinas=None):
+        """Quita la suscripción del cliente (a todas las máquinas del flujo si ``maquinas`` es None)"""
+        with self._condicion:
+            cliente = self._clientes.get(sid)
+            if cliente is None:
+                return
+            cliente.por_defecto = False
+            if maquinas is None:
+                cliente.suscripciones.pop(flujo, None)
+            else:
+                cliente.suscripciones.get(flujo, set()).difference_update(maquinas)
+
+    def clientes(self):
+        with self._condicion:
+            return [c.to_dict() for c in self._clientes.values()]
+
+    def _confirmar(self, sid):
+        with self._condicion:
+            cliente = self._clientes.get(sid)
+            if cliente is not None and cliente.sin_ack > 0:
+                cliente.sin_ack -= 1
+                cliente.ultimo_ack = time.time()
+                self._condicion.notify()
+
+    def _bucle(self):
+        while True:
+            try:
+                with self._condicion:
+                    espera = self._proxima_espera(time.time())
+                    self._condicion.wait(espera)
+                    clientes = list(self._clientes.values())
+                    pendientes = list(self._cola)
+                    secuencia = self._secuencia
+
+                ahora = time.time()
+                resumenes = {}  # Clientes en el mismo punto comparten el mismo mensaje
+                for cliente in clientes:
+                    try:
+                        self._enviar(cliente, self._atender(cliente, pendientes, secuencia, ahora, resumenes))
+                    except Exception:
+                        # Un cliente con problemas no frena a los demás
+                        log.exception("Error al enviar datos a un cliente", extra=campos(sid=cliente.sid))
+            except Exception:
+                log.exception("Error en el hilo de difusión")
+                time.sleep(self.intervalo)
+
+    def _enviar(self, cliente, envios):
+        """Emite los mensajes de una vuelta; solo el último pide confirmación (llegan en orden)"""
+        sid = cliente.sid
+        mensajes = []
+        for evento, datos in envios:
+            if cliente.codificador is None:
+                mensajes.append((evento, datos))
+            else:
+                mensajes.extend(cliente.codificador.codificar(evento, parte) or (evento, parte)
+                                for parte in self._partir(evento, datos))
+        for i, (evento, mensaje) in enumerate(mensajes, 1):
+            callback = (lambda *_, sid=sid: self._confirmar(sid)) if i == len(mensajes) else None
+            self.emisor.emit(evento, mensaje, to=sid, callback=callback, local=True)
+
+    @staticmethod
+    def _partir(evento, datos):
+        """
+        Parte un lote columnar, o la predicción de un lote, en mensajes de
+        ``MAX_PUNTOS`` puntos como máximo (la cantidad viaja en u16)
+        """
+        if evento == 'nuevos_datos_lote':
+            n = len(datos['timestamp'])
+        elif evento == 'prediccion':
+            n = len(datos.get('acciones') or ())
+        else:
+            n = 0
+        if n <= MAX_PUNTOS:
+            return [datos]
+
+        def tramo(valor, inicio):
+            if isinstance(valor, dict):
+                return {k: tramo(v, inicio) for k, v in valor.items()}
+            return valor[inicio:inicio + MAX_PUNTOS] if isinstance(valor, list) and len(valor) == n else valor
+
+        partes = []
+        for inicio in range(0, n, MAX_PUNTOS):
+            parte = {k: tramo(v, inicio) for k, v in datos.items()}
+            if datos.get('seq') is not None:
+                parte['seq'] = datos['seq'] + inicio
+            if evento == 'prediccion' and inicio + MAX_PUNTOS < n:
+                # Solo la última parte tiene la observación y el timestamp de su último punto
+                parte.update(action=parte['acciones'][-1], is_critical=bool(parte['criticos'][-1]),
+                             raw_data=None, timestamp=None)
+            partes.append(parte)
+        return partes
+
+    def _proxima_espera(self, ahora):
+        """Segundos hasta que algún cliente pueda recibir datos (None = esperar a que se publique algo)"""
+        espera = None
+        for cliente in self._clientes.values():
+            if cliente.cursor == self._secuencia:
+                continue
+            if cliente.sin_ack >= self.max_sin_ack:
+                # Revisar más tarde si sigue atrasado o si venció la espera de confirmaciones
+                vence_ack = max(self.intervalo, cliente.ultimo_ack + self.tiempo_ack - ahora)
+                if cliente.avisado:
+                    restante = vence_ack
+                else:
+                    restante = self.intervalo if cliente.rezagado_desde is None else \
+                        max(self.intervalo, min(vence_ack, cliente.rezagado_desde + self.tiempo_max_rezago - ahora))
+            else:
+                restante = max(0.0, cliente.ultimo_envio + self.intervalo - ahora)
+            espera = restante if espera is None else min(espera, restante)
+        return espera
+
+    def _atender(self, cliente, pendientes, secuencia, ahora, resumenes):
+        """Devuelve la lista de (evento, datos) a enviar al cliente en esta vuelta"""
+        with self._condicion:
+            if cliente.cursor == secuencia:
+                cliente.rezagado_desde = None
+                return []
+            if ahora - cliente.ultimo_envio < self.intervalo:
+                return []
+
+            if cliente.sin_ack >= self.max_sin_ack and ahora - cliente.ultimo_ack >= self.tiempo_ack:
+                # No confirmó nada en ``tiempo_ack``: los envíos pendientes se dan por perdidos
+                log.debug("Confirmaciones vencidas", extra=campos(sid=cliente.sid, sin_ack=cliente.sin_ack))
+                cliente.sin_ack = 0
+
+            if cliente.sin_ack >= self.max_sin_ack:
+                rezagado = self._marcar_rezagado(cliente, ahora)
+                if rezagado is None:
+                    return []
+            else:
+                rezagado = None
+                primera = pendientes[0][0] if pendientes else secuencia
+                perdidos = max(0, primera - cliente.cursor)
+                desde = max(cliente.cursor, primera)
+                suscripciones = frozenset((f, m) for f, ms in cliente.suscripciones.items() for m in ms)
+                cliente.cursor = secuencia
+
+        if rezagado is not None:
+            self._avisar_rezagado(cliente, rezagado)
+            return []
+
+        # Clientes en el mismo punto y con las mismas suscripciones comparten los mensajes
+        clave = (desde, secuencia, perdidos, suscripciones)
+        if clave not in resumenes:
+            elegidos = [p for p in pendientes if p[0] >= desde and
+                        ((p[1], p[2]) in suscripciones or (p[1], '*') in suscripciones)]
+            resumenes[clave] = self._combinar(elegidos, perdidos) if elegidos else []
+        envios = resumenes[clave]
+
+        if envios:
+            with self._condicion:
+                cliente.rezagado_desde = None
+                cliente.avisado = False
+                cliente.descartados += perdidos
+                if cliente.sin_ack == 0:
+                    cliente.ultimo_ack = ahora  # Desde aquí corre la espera de confirmaciones
+                cliente.sin_ack += 1
+                cliente.ultimo_envio = ahora
+        return envios
+
+    def _marcar_rezagado(self, cliente, ahora):
+        """
+        Lleva la cuenta del tiempo que un cliente pasa atrasado. Devuelve
+        'avisar' o 'desconectar' cuando supera ``tiempo_max_rezago``.
+        """
+        if cliente.rezagado_desde is None:
+            cliente.rezagado_desde = ahora
+            return None
+        if ahora - cliente.rezagado_desde < self.tiempo_max_rezago:
+            return None
+        if self.desconectar_lentos:
+            self._clientes.pop(cliente.sid, None)
+            return 'desconectar'
+        if not cliente.avisado:
+            cliente.avisado = True
+            return 'avisar'
+        return None
+
+    def _avisar_rezagado(self, cliente, accion):
+        log.warning("Cliente atrasado", extra=campos(sid=cliente.sid, sin_ack=cliente.sin_ack, accion=accion))
+        self.emisor.emit('cliente_lento', cliente.to_dict(), to=cliente.sid, local=True)
+        if accion == 'desconectar':
+            self.emisor.desconectar(cliente.sid)
+
+    def _combinar(self, pendientes, perdidos):
+        """
+        Arma los mensajes para un cliente con datos pendientes, uno por cada
+        flujo, máquina y sensor, en el orden de su último dato. Si hay uno solo
+        se envía tal cual. Si hay varios del flujo 'datos' se envía el último
+        dato junto con el mínimo y el máximo de ese sensor en todo el
+        intervalo; de los demás flujos se envía solo el último mensaje.
+        """
+        por_serie = {}
+        for pendiente in pendientes:
+            clave = (pendiente[1], pendiente[2], pendiente[4].get('sensor_id'))
+            por_serie.setdefault(clave, []).append(pendiente)
+
+        envios = []
+        for (flujo, _, _), items in sorted(por_serie.items(), key=lambda x: x[1][-1][0]):
+            _, _, _, evento, datos = items[-1]
+            if len(items) == 1 and not perdidos:
+                envios.append((evento, datos))
+            elif flujo == 'datos':
+                envios.append(self._resumir(items, perdidos))
+            else:
+                envios.append((evento, dict(datos, omitidos=len(items) - 1)))
+        return envios
+
+    def _resumir(self, items, perdidos):
+        """Último dato de ``items`` (de un mismo sensor) con el mínimo y el máximo de cada campo en el intervalo"""
+        _, _, _, evento, ultimo = items[-1]
+        if evento != self.evento:
+            # Último punto de un lote columnar
+            ultimo = {k: (v[-1] if isinstance(v, list) else v) for k, v in ultimo.items()}
+            if 'anomalia' in ultimo:
+                ultimo['anomalia'] = {k: ({c: x[-1] for c, x in v.items()} if isinstance(v, dict) else v[-1])
+                                      for k, v in ultimo['anomalia'].items()}
+
+        datos = dict(ultimo)
+        columnas = {campo: [] for campo in HistorialSensores.CAMPOS}
+        n = 0
+        for _, _, _, evento, pendiente in items:
+            n += len(pendiente['timestamp']) if evento != self.evento else 1
+            for campo, valores in columnas.items():
+                valor = pendiente.get(campo)
+                if isinstance(valor, list):
+                    valores.extend(valor)
+                elif valor is not None:
+                    valores.append(valor)
+
+        columnas = {campo: np.asarray(v, dtype=float) for campo, v in columnas.items()}
+        columnas = {campo: v[~np.isnan(v)] for campo, v in columnas.items()}  # None (sin dato) -> NaN
+        columnas = {campo: v for campo, v in columnas.items() if len(v)}
+        datos['resumen'] = {
+            'n': n,
+            'descartados': perdidos,
+            'min': {campo: float(v.min()) for campo, v in columnas.items()},
+            'max': {campo: float(v.max()) for campo, v in columnas.items()}
+        }
+        return self.evento, datos
@@ -0,0 +1,92 @@
+"""
+Emisores: la interfaz que usan el servicio de eventos, el difusor y la
+vigilancia para enviar mensajes, manejar salas y lanzar hilos, sin depender
+del servidor de Socket.IO que está detrás.
+
+Con varios procesos (ver bus.py) los emit pasan por el bus para llegar a los
+clientes conectados a otros procesos; ``local=True`` se saltea el bus cuando
+se sabe que el cliente está conectado a este proceso.
+"""
+import asyncio
+import threading
+
+from bitacora import obtener_logger
+
+log = obtener_logger('emisores')
+
+
+class EmisorFlask:
+    """Emisor sobre Flask-SocketIO (modo con hilos)"""
+
+    def __init__(self, socketio, namespace='/'):
+        self.socketio = socketio
+        self.namespace = namespace
+
+    def emit(self, evento, datos=None, to=None, callback=None, local=False):
+        self.socketio.emit(evento, datos, to=to, callback=callback, namespace=self.namespace, ignore_queue=local)
+
+    def unirse(self, sid, sala):
+        self.socketio.server.enter_room(sid, sala, namespace=self.namespace)
+
+    def salir(self, sid, sala):
+        self.socketio.server.leave_room(sid, sala, namespace=self.namespace)
+
+    def desconectar(self, sid):
+        self.socketio.server.disconnect(sid, namespace=self.namespace)
+
+    def start_background_task(self, funcion, *args, **kwargs):
+        return self.socketio.start_background_task(funcion, *args, **kwargs)
+
+
+class EmisorAsincrono:
+    """
+    Emisor sobre ``socketio.AsyncServer``. Se puede llamar desde cualquier
+    hilo (difusor, vigilancia, pool de inferencia): las operaciones se
+    programan como corrutinas en el loop del servidor.
+    """
+
+    def __init__(self, sio, namespace='/'):
+        self.sio = sio
+        self.namespace = namespace
+        self.loop = None
+        self._tareas = set()
+
+    def iniciar(self, loop=None):
+        """Fija el loop del servidor (por defecto, el que está corriendo)"""
+        self.loop = loop or asyncio.get_running_loop()
+
+    def _programar(self, corrutina):
+        if self.loop is None:
+            corrutina.close()
+            log.debug("Emisor asíncrono sin loop: se descarta el mensaje")
+            return
+        try:
+            en_el_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            en_el_loop = False
+        if en_el_loop:
+            # Guardar una referencia hasta que termine (el loop solo guarda referencias débiles)
+            tarea = self.loop.create_task(corrutina)
+            self._tareas.add(tarea)
+            tarea.add_done_callback(self._tareas.discard)
+        else:
+            asyncio.run_coroutine_threadsafe(corrutina, self.loop)
+
+    def emit(self, evento, datos=None, to=None, callback=None, local=False):
+        self._programar(self.sio.emit(evento, datos, to=to, callback=callback, namespace=self.namespace,
+                                      ignore_queue=local))
+
+    def unirse(self, sid, sala):
+        self._programar(self.sio.enter_room(sid, sala, namespace=self.namespace))
+
+    def salir(self, sid, sala):
+        self._programar(self.sio.leave_room(sid, sala, namespace=self.namespace))
+
+    def desconectar(self, sid):
+        self._programar(self.sio.disconnect(sid, namespace=self.namespace))
+
+    def start_background_task(self, funcion, *args, **kwargs):
+        """Los hilos de difusión y vigilancia bloquean, así que corren en hilos propios y no en el loop"""
+        hilo = threading.Thread(target=funcion, args=args, kwargs=kwargs, daemon=True)
+        hilo.start()
+        return hilo
@@ -0,0 +1,29 @@
+"""
+Estado compartido del servidor.
+
+Los objetos de este módulo se comparten entre los eventos de Socket.IO,
+las rutas de la API y el hilo de datos del servidor.
+"""
+from agregados import Agregados
+from alertas import MotorAlertas
+from config import Config
+from historial import HistorialSensores
+from markov.estimador import EstimadorTransiciones
+from sensores import RegistroSensores
+
+# Historial de lecturas de los sensores (limitado por memoria, no por cantidad de puntos)
+historial = HistorialSensores.desde_memoria(Config.HISTORIAL_MEMORIA_MB)
+
+# Registro de sensores y máquinas conectados, cada uno con su propio historial
+registro = RegistroSensores(Config.REGISTRO_FRAGMENTOS, Config.HISTORIAL_SENSOR_PUNTOS)
+
+# Agregados por minuto y por hora de cada serie (máquina, sensor)
+agregados = Agregados(Config.AGREGADOS_RETENCION, Config.AGREGADOS_INTERVALO, Config.PERSISTENCIA_HABILITADA,
+                      Config.PERSISTENCIA_URL, Config.AGREGADOS_MAX_PENDIENTES)
+
+# Matriz de transición bueno/medio/malo de cada máquina, estimada de sus lecturas
+estimador = EstimadorTransiciones(Config.ESTIMADOR_LIMITES, Config.ESTIMADOR_MARGEN, Config.ESTIMADOR_OLVIDO,
+                                  persistir=Config.PERSISTENCIA_HABILITADA)
+
+# Reglas de alerta y alertas activas por serie
+alertas = MotorAlertas(Config.ALERTAS_REGLAS)
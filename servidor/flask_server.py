@@ -1,24 +1,25 @@
 from flask import Flask
 from flask_socketio import SocketIO
-import threading
-import time
 import os
-from datetime import datetime
 
 # Importar módulos refactorizados
 from config import Config
+from bitacora import obtener_logger
 from servidor.routes.sensores_routes import web_blueprint
 from routes.api_routes import api_blueprint
 from routes.markov_routes import markov_blueprint
 from socket_events import setup_socket_events
+from servicio import ServicioSocket
+from emisores import EmisorFlask
+from bus import crear_bus, manager_socketio
+from estado import agregados, alertas, estimador, historial, registro
+from difusion import Difusor
+from inferencia import PoolInferencia
+from vigilancia import VigilanciaSensores
+from anomalias import DetectorAnomalias
+from modelo_predictivo import modelo_prediccion
 
-# Variables globales (se pueden mover a un módulo de estado si crece más)
-datos_recientes = []
-sensor_activo = False
-maquina_encendida = True
-proximo_envio = 0
-ultimo_heartbeat = 0
-TIMEOUT_SENSOR = 5  # seconds before considering sensor disconnected
+log = obtener_logger('servidor')
 
 # Crear la aplicación Flask con la carpeta estática configurada
 app = Flask(__name__, static_url_path='/static')
@@ -27,78 +28,43 @@ app.config['SECRET_KEY'] = 'secret_key_for_socketio'
 # Registrar blueprints
 app.register_blueprint(web_blueprint)
 app.register_blueprint(api_blueprint, url_prefix='/api')
+app.register_blueprint(markov_blueprint)
+
+# Bus con los demás procesos del servidor (Config.BUS_URL; 'local' = un solo proceso)
+bus = crear_bus()
 
 # Inicializar Socket.IO
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', client_manager=manager_socketio(bus))
 
-# Configurar eventos de socket
-setup_socket_events(socketio, datos_recientes, sensor_activo, maquina_encendida, 
-                    proximo_envio, ultimo_heartbeat, TIMEOUT_SENSOR)
+emisor = EmisorFlask(socketio)
 
-def generar_datos_tiempo_real():
-    return {
-        'timestamp': datetime.now().isoformat(),
-        'temperatura': 0,
-        'vibracion': 0,
-        'presion': 0
-    }
+# Difusión de datos a los dashboards con control de ritmo por cliente
+difusor = Difusor(emisor, profundidad=Config.DIFUSION_PROFUNDIDAD, max_hz=Config.DIFUSION_MAX_HZ,
+                  max_sin_ack=Config.DIFUSION_MAX_SIN_ACK, tiempo_max_rezago=Config.DIFUSION_TIEMPO_REZAGO,
+                  desconectar_lentos=Config.DIFUSION_DESCONECTAR_LENTOS, tiempo_ack=Config.DIFUSION_TIEMPO_ACK)
 
-def generar_y_enviar_datos():
-    """Función que genera y envía datos en cero cada segundo cuando el sensor no está activo"""
-    global proximo_envio, sensor_activo, ultimo_heartbeat
-    
-    # Inicializar la variable para el tiempo del próximo envío
-    proximo_envio = time.time() + 1.0
-    ultimo_heartbeat = time.time()  # Initialize heartbeat timer
-    
-    print("Servidor listo - esperando conexión del sensor...")
-    
-    while True:
-        try:
-            # Tiempo actual
-            tiempo_actual = time.time()
-            
-            # Verificar si el sensor está activo pero ha dejado de enviar heartbeats
-            if sensor_activo and (tiempo_actual - ultimo_heartbeat > TIMEOUT_SENSOR):
-                print("⚠️ Sensor perdido - no se ha recibido heartbeat en", round(tiempo_actual - ultimo_heartbeat, 1), "segundos")
-                sensor_activo = False
-                # Notificar a todos los clientes que el sensor se ha desconectado
-                socketio.emit('estado_sensores', {'activos': False, 'cantidad': 0})
-            
-            # Verificar si es momento de enviar datos (precisamente cada segundo)
-            if tiempo_actual >= proximo_envio:
-                # Solo enviamos datos si el sensor no está activo
-                if not sensor_activo:
-                    # Generar datos con valores en cero
-                    timestamp = datetime.now().isoformat()
-                    nuevos_datos = {
-                        'timestamp': timestamp,
-                        'temperatura': 0,
-                        'vibracion': 0,
-                        'presion': 0
-                    }
-                    
-                    # Agregar a la lista de datos recientes
-                    datos_recientes.append(nuevos_datos)
-                    
-                    # Mantener solo los últimos N puntos
-                    if len(datos_recientes) > Config.MAX_DATA_POINTS:
-                        datos_recientes.pop(0)
-                    
-                    # Enviar datos a todos los clientes conectados
-                    socketio.emit('nuevos_datos', nuevos_datos)
-                
-                # Calcular el próximo tiempo de envío (exactamente 1 segundo después)
-                proximo_envio = tiempo_actual + 1.0
-            
-            # Dormir por un tiempo corto para no consumir CPU innecesariamente
-            time.sleep(0.01)
-                
-        except Exception as e:
-            print(f"Error en el hilo de datos: {str(e)}")
-            import traceback
-            traceback.print_exc()  # Print the full stack trace to help diagnose issues
-            proximo_envio = time.time() + 1.0
+# Pool de inferencia (el modelo no se ejecuta dentro de los handlers)
+inferencia = PoolInferencia(modelo_prediccion, Config.INFERENCIA_TRABAJADORES, Config.INFERENCIA_COLA,
+                            Config.INFERENCIA_PROCESOS, Config.INFERENCIA_VENTANA_MS, Config.INFERENCIA_MAX_LOTE)
+
+# Detección de sensores perdidos y datos en cero cada UPDATE_INTERVAL segundos mientras no hay sensores
+vigilancia = VigilanciaSensores(emisor, registro, historial, difusor, Config.TIMEOUT_SENSOR,
+                                periodo_reposo=Config.UPDATE_INTERVAL)
+
+# Puntajes de anomalía por máquina y sensor, adjuntos a los datos que se difunden
+anomalias = DetectorAnomalias(Config.ANOMALIAS_ALFA, Config.ANOMALIAS_MINIMO)
+
+# Persistencia diferida de lecturas y predicciones (opcional, requiere la base de datos)
+escritor = None
+if Config.PERSISTENCIA_HABILITADA:
+    from persistencia import EscritorDiferido
+    escritor = EscritorDiferido(Config.PERSISTENCIA_URL, Config.PERSISTENCIA_LOTE, Config.PERSISTENCIA_INTERVALO,
+                                Config.PERSISTENCIA_MAX_PENDIENTES)
+
+# Configurar eventos de socket
+servicio = ServicioSocket(emisor, historial, registro, difusor, inferencia, vigilancia, bus, escritor,
+                          agregados, anomalias, alertas, estimador)
+setup_socket_events(socketio, servicio)
 
 if __name__ == '__main__':
     # Ensure required directories exist
@@ -106,13 +72,9 @@ if __name__ == '__main__':
     os.makedirs(os.path.join(os.path.dirname(__file__), 'templates'), exist_ok=True)
     os.makedirs(os.path.join(os.path.dirname(__file__), 'routes'), exist_ok=True)
     
-    print(f"Iniciando servidor en http://{Config.HOST}:{Config.PORT}")
-    print(f"Accede al dashboard en tu navegador con la URL http://localhost:{Config.PORT}")
-    
-    # Iniciar el hilo para generar datos
-    thread_datos = threading.Thread(target=generar_y_enviar_datos)
-    thread_datos.daemon = True
-    thread_datos.start()
+    log.info("Iniciando servidor en http://%s:%s", Config.HOST, Config.PORT)
+    log.info("Accede al dashboard en tu navegador con la URL http://localhost:%s", Config.PORT)
+    log.info("Servidor listo - esperando conexión del sensor...")
     
     # Iniciar el servidor Flask-SocketIO
     socketio.run(app, host=Config.HOST, port=Config.PORT, debug=Config.DEBUG)
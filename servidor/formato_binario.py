@@ -0,0 +1,297 @@
+"""
+Formato binario de los mensajes de datos y predicciones.
+
+Los mensajes viajan como adjuntos binarios de Socket.IO. Todos los números
+son little-endian y los valores de los sensores float32.
+
+Cabecera común:
+    versión u8, tipo u8, banderas u8, largo del sensor_id u8, sensor_id (utf-8),
+    maquina_id i32 (-1 = sin máquina), seq i64 (-1 = sin secuencia)
+
+Datos (tipo 1):
+    cantidad de puntos u16
+    [timestamp base i64 en ms, solo con la bandera CLAVE]
+    por punto: delta de tiempo i32 en ms respecto del punto anterior,
+               máscara u8 de campos presentes, un float32 por campo presente
+    [con RESUMEN: n u32, descartados u32, mínimos 3 x f32, máximos 3 x f32]
+    [con ANOMALIA, por punto: puntaje f32, z 3 x f32, tasa 3 x f32]
+
+Predicción (tipo 2):
+    acción u8, crítico u8, origen u8, cantidad u16, timestamp i64 en ms (-1 = sin timestamp),
+    observación 3 x f32
+    [con LOTE: cantidad x u8 acciones, cantidad x u8 críticos]
+
+Los timestamps son la hora de pared que envió el sensor (ISO sin zona
+horaria, como en JSON) expresada en ms desde 1970-01-01T00:00 sin convertir
+a UTC; los decodificadores la devuelven otra vez como ISO sin zona, así el
+dashboard la muestra igual por los dos caminos. Los timestamps con zona se
+pasan a UTC.
+
+Cada codificador recuerda el último timestamp y los últimos valores que
+envió de cada sensor: el primer punto de un mensaje lleva el delta respecto
+de ese timestamp y un campo se omite si no cambió. El primer mensaje de cada
+sensor (o uno con un salto de tiempo que no entra en 32 bits) lleva la
+bandera CLAVE con el timestamp absoluto y todos los campos.
+"""
+import struct
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from historial import HistorialSensores
+
+VERSION = 1
+FORMATOS = ('binario', 'json')
+
+TIPO_DATOS = 1
+TIPO_PREDICCION = 2
+
+# Banderas
+CLAVE = 0x01
+RESUMEN = 0x02
+LOTE = 0x04
+ANOMALIA = 0x08
+
+CAMPOS = HistorialSensores.CAMPOS
+ORIGENES = ('modelo', 'umbral')
+
+# Eventos JSON que tienen formato binario y el evento binario con que se envían
+EVENTOS = {
+    'nuevos_datos': 'datos_bin',
+    'nuevos_datos_lote': 'datos_bin',
+    'prediccion': 'prediccion_bin',
+}
+
+_CABECERA = struct.Struct('<BBBB')
+_ORIGEN = struct.Struct('<iq')
+_CANTIDAD = struct.Struct('<H')
+_BASE = struct.Struct('<q')
+_PUNTO = struct.Struct('<iB')
+_VALOR = struct.Struct('<f')
+_RESUMEN = struct.Struct(f'<II{2 * len(CAMPOS)}f')
+_PREDICCION = struct.Struct(f'<BBBHq{len(CAMPOS)}f')
+
+# Puntos por mensaje de datos como máximo (la cantidad viaja en u16)
+MAX_PUNTOS = 2 ** 16 - 1
+
+_MIN_I32, _MAX_I32 = -2 ** 31, 2 ** 31 - 1
+_EPOCH = datetime(1970, 1, 1)
+_UN_MS = timedelta(milliseconds=1)
+_NAN = float('nan')
+_TODOS = (1 << len(CAMPOS)) - 1
+
+
+def a_ms(timestamp):
+    """Convierte un timestamp ISO (o datetime, o None = ahora) a epoch en milisegundos"""
+    if timestamp is None:
+        timestamp = datetime.now()
+    elif isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    # Igual que numpy, un timestamp sin zona horaria se toma tal cual (sin convertir)
+    return (timestamp - _EPOCH) // _UN_MS
+
+
+def _anomalia(anomalia, n):
+    """Puntajes de anomalía (ver ``anomalias``) de los últimos ``n`` puntos como bytes"""
+    columnas = ([anomalia.get('puntaje', _NAN)] + [anomalia.get('z', {}).get(c, _NAN) for c in CAMPOS] +
+                [anomalia.get('tasa', {}).get(c, _NAN) for c in CAMPOS])
+    filas = np.column_stack([np.broadcast_to(np.atleast_1d(np.asarray(c, dtype=np.float64))[-n:], n)
+                             for c in columnas])
+    return filas.astype('<f4').tobytes()
+
+
+def _f32(valor):
+    """Redondea un valor a float32 (lo que efectivamente viaja en el mensaje)"""
+    return _VALOR.unpack(_VALOR.pack(valor))[0]
+
+
+def _origen(datos):
+    maquina = datos.get('maquina_id')
+    seq = datos.get('seq')
+    sensor = str(datos.get('sensor_id') or '').encode('utf-8')[:255]
+    return sensor, _ORIGEN.pack(-1 if maquina is None else int(maquina), -1 if seq is None else int(seq))
+
+
+class CodificadorBinario:
+    """Codifica los mensajes de un cliente en el formato binario (ver el módulo)"""
+
+    def __init__(self):
+        self._ultimos = {}  # sensor_id -> (timestamp en ms, valores float32)
+
+    def codificar(self, evento, datos):
+        """Devuelve ``(evento_binario, bytes)``, o None si el evento no tiene formato binario"""
+        if evento == 'nuevos_datos':
+            filas = [[datos.get(c) for c in CAMPOS]]
+            return EVENTOS[evento], self._datos(datos, [a_ms(datos.get('timestamp'))], filas)
+        if evento == 'nuevos_datos_lote':
+            timestamps = [a_ms(ts) for ts in datos['timestamp']]
+            columnas = [datos.get(c) or [None] * len(timestamps) for c in CAMPOS]
+            return EVENTOS[evento], self._datos(datos, timestamps, list(zip(*columnas)))
+        if evento == 'prediccion':
+            return EVENTOS[evento], self._prediccion(datos)
+        return None
+
+    def _datos(self, datos, timestamps, filas):
+        sensor, origen = _origen(datos)
+        anterior = self._ultimos.get(sensor)
+        banderas = RESUMEN if 'resumen' in datos else 0
+        if datos.get('anomalia'):
+            banderas |= ANOMALIA
+        if anterior is None or not _MIN_I32 <= timestamps[0] - anterior[0] <= _MAX_I32:
+            banderas |= CLAVE
+            referencia, previos = timestamps[0], None
+        else:
+            referencia, previos = anterior
+
+        partes = [_CABECERA.pack(VERSION, TIPO_DATOS, banderas, len(sensor)), sensor, origen,
+                  _CANTIDAD.pack(len(timestamps))]
+        if banderas & CLAVE:
+            partes.append(_BASE.pack(referencia))
+
+        for ts, fila in zip(timestamps, filas):
+            if previos is None:
+                # Primer punto de un mensaje clave: van todos los campos (NaN = sin dato)
+                presentes = [_NAN if v is None else _f32(v) for v in fila]
+                mascara, previos = _TODOS, presentes
+            else:
+                # Un campo va si cambió respecto del último valor enviado (None = sin dato: se omite)
+                presentes, mascara, previos = [], 0, list(previos)
+                for i, valor in enumerate(fila):
+                    if valor is None:
+                        continue
+                    valor = _f32(valor)
+                    if valor != previos[i]:
+                        mascara |= 1 << i
+                        presentes.append(valor)
+                        previos[i] = valor
+            partes.append(_PUNTO.pack(max(_MIN_I32, min(_MAX_I32, ts - referencia)), mascara))
+            partes.append(struct.pack(f'<{len(presentes)}f', *presentes))
+            referencia = ts
+
+        self._ultimos[sensor] = (referencia, previos)
+
+        if banderas & RESUMEN:
+            resumen = datos['resumen']
+            extremos = [resumen.get(clave, {}).get(c, _NAN) for clave in ('min', 'max') for c in CAMPOS]
+            partes.append(_RESUMEN.pack(resumen.get('n', 0), resumen.get('descartados', 0), *extremos))
+        if banderas & ANOMALIA:
+            partes.append(_anomalia(datos['anomalia'], len(timestamps)))
+        return b''.join(partes)
+
+    @staticmethod
+    def _prediccion(datos):
+        sensor, origen = _origen(datos)
+        acciones = datos.get('acciones') or []
+        banderas = LOTE if acciones else 0
+        timestamp = datos.get('timestamp')
+        partes = [
+            _CABECERA.pack(VERSION, TIPO_PREDICCION, banderas, len(sensor)), sensor, origen,
+            _PREDICCION.pack(int(datos.get('action', 0)), int(bool(datos.get('is_critical'))),
+                             ORIGENES.index(datos.get('origen', 'modelo')), len(acciones),
+                             -1 if timestamp is None else a_ms(timestamp),
+                             *(datos.get('raw_data') or [_NAN] * len(CAMPOS)))
+        ]
+        if acciones:
+            partes.append(np.asarray(acciones, dtype=np.uint8).tobytes())
+            partes.append(np.asarray(datos.get('criticos', []), dtype=np.uint8).tobytes())
+        return b''.join(partes)
+
+
+class DecodificadorBinario:
+    """
+    Decodifica mensajes binarios a los mismos dicts del formato JSON
+    (para sensores que envían en binario y para verificar el formato).
+    """
+
+    def __init__(self):
+        self._ultimos = {}  # sensor_id -> (timestamp en ms, valores float32)
+
+    def decodificar(self, mensaje):
+        """Devuelve ``(evento_json, datos)``"""
+        mensaje = memoryview(mensaje)
+        version, tipo, banderas, largo = _CABECERA.unpack_from(mensaje, 0)
+        if version != VERSION:
+            raise ValueError(f"Versión de formato binario no soportada: {version}")
+        pos = _CABECERA.size
+        sensor = bytes(mensaje[pos:pos + largo]).decode('utf-8')
+        pos += largo
+        maquina, seq = _ORIGEN.unpack_from(mensaje, pos)
+        pos += _ORIGEN.size
+        datos = {'sensor_id': sensor or None, 'maquina_id': None if maquina < 0 else maquina,
+                 'seq': None if seq < 0 else seq}
+
+        if tipo == TIPO_PREDICCION:
+            return 'prediccion', self._prediccion(mensaje, pos, banderas, datos)
+        if tipo != TIPO_DATOS:
+            raise ValueError(f"Tipo de mensaje binario desconocido: {tipo}")
+
+        (n,), pos = _CANTIDAD.unpack_from(mensaje, pos), pos + _CANTIDAD.size
+        if banderas & CLAVE:
+            (referencia,), pos = _BASE.unpack_from(mensaje, pos), pos + _BASE.size
+            previos = np.full(len(CAMPOS), np.nan, dtype=np.float32)
+        else:
+            if sensor not in self._ultimos:
+                raise ValueError(f"Mensaje diferencial sin mensaje clave previo del sensor {sensor!r}")
+            referencia, previos = self._ultimos[sensor]
+
+        timestamps = np.empty(n, dtype=np.int64)
+        valores = np.empty((n, len(CAMPOS)), dtype=np.float32)
+        for i in range(n):
+            delta, mascara = _PUNTO.unpack_from(mensaje, pos)
+            pos += _PUNTO.size
+            presentes = np.unpackbits(np.array([mascara], dtype=np.uint8), bitorder='little')[:len(CAMPOS)]
+            presentes = presentes.astype(bool)
+            k = int(presentes.sum())
+            fila = previos.copy()
+            fila[presentes] = np.frombuffer(mensaje, dtype='<f4', count=k, offset=pos)
+            pos += k * _VALOR.size
+            referencia += delta
+            timestamps[i], valores[i], previos = referencia, fila, fila
+        self._ultimos[sensor] = (referencia, previos)
+
+        iso = np.datetime_as_string(timestamps.astype('datetime64[ms]'), unit='us').tolist()
+        # Campos sin dato (NaN) como None, igual que en JSON
+        columnas = [HistorialSensores.a_lista(valores[:, i]) for i in range(len(CAMPOS))]
+        if n == 1:
+            datos.update(timestamp=iso[0], **{campo: columna[0] for campo, columna in zip(CAMPOS, columnas)})
+            evento = 'nuevos_datos'
+        else:
+            datos.update(timestamp=iso, **dict(zip(CAMPOS, columnas)))
+            evento = 'nuevos_datos_lote'
+
+        if banderas & RESUMEN:
+            n_resumen, descartados, *extremos = _RESUMEN.unpack_from(mensaje, pos)
+            pos += _RESUMEN.size
+            minimos, maximos = extremos[:len(CAMPOS)], extremos[len(CAMPOS):]
+            datos['resumen'] = {
+                'n': n_resumen,
+                'descartados': descartados,
+                'min': {c: v for c, v in zip(CAMPOS, minimos) if v == v},
+                'max': {c: v for c, v in zip(CAMPOS, maximos) if v == v},
+            }
+        if banderas & ANOMALIA:
+            k = 1 + 2 * len(CAMPOS)
+            filas = np.frombuffer(mensaje, dtype='<f4', count=n * k, offset=pos).reshape(n, k)
+            columnas = filas.astype(np.float64).round(3).T.tolist()
+            if n == 1:
+                columnas = [c[0] for c in columnas]
+            datos['anomalia'] = {
+                'puntaje': columnas[0],
+                'z': dict(zip(CAMPOS, columnas[1:1 + len(CAMPOS)])),
+                'tasa': dict(zip(CAMPOS, columnas[1 + len(CAMPOS):])),
+            }
+        return evento, datos
+
+    @staticmethod
+    def _prediccion(mensaje, pos, banderas, datos):
+        accion, critico, origen, n, timestamp, *observacion = _PREDICCION.unpack_from(mensaje, pos)
+        pos += _PREDICCION.size
+        datos.update(action=accion, is_critical=bool(critico), origen=ORIGENES[origen], raw_data=observacion,
+                     timestamp=None if timestamp < 0 else
+                     str(np.datetime_as_string(np.datetime64(timestamp, 'ms'), unit='us')))
+        if banderas & LOTE:
+            datos['acciones'] = np.frombuffer(mensaje, dtype=np.uint8, count=n, offset=pos).tolist()
+            datos['criticos'] = [bool(c) for c in np.frombuffer(mensaje, dtype=np.uint8, count=n, offset=pos + n)]
+        return datos
@@ -0,0 +1,321 @@
+import threading
+from datetime import datetime
+
+import numpy as np
+
+
+class HistorialSensores:
+    """
+    Buffer circular columnar para el historial de lecturas de los sensores.
+
+    Guarda los timestamps como enteros (epoch en nanosegundos) y cada sensor
+    en su propia columna float32. Cada punto se escribe dos veces (en ``i`` y
+    en ``i + capacidad``), de modo que cualquier ventana de los últimos ``n``
+    puntos es siempre un bloque contiguo. Los arreglos crecen por duplicación
+    hasta ``capacidad`` y a partir de ahí se sobrescribe el punto más antiguo,
+    así que agregar es O(1). Las consultas copian la ventana con el lock
+    tomado, para que una escritura concurrente no la modifique.
+
+    Los puntos se guardan en orden de llegada con su timestamp real: con
+    varios sensores (o un reloj atrasado) puede llegar un dato anterior al
+    último. Se lleva la cuenta de los descensos entre puntos consecutivos;
+    mientras no haya ninguno los rangos se buscan por bisección y si no, se
+    filtran y ordenan por timestamp.
+
+    Un campo que no vino en la lectura se guarda como NaN (no como 0) y sale
+    como None en los dicts de ``a_registros``.
+    """
+
+    CAMPOS = ('temperatura', 'vibracion', 'presion')
+    BYTES_POR_PUNTO = 2 * (8 + 4 * len(CAMPOS))  # timestamp + columnas, duplicados
+    CAPACIDAD_INICIAL = 4096
+
+    def __init__(self, capacidad, capacidad_inicial=None):
+        if capacidad < 1:
+            raise ValueError("La capacidad del historial debe ser al menos 1")
+        self.capacidad = int(capacidad)
+        self.total = 0  # Cantidad de puntos agregados desde el inicio (número de secuencia)
+        self._inicio = 0
+        self._n = 0
+        self._descensos = 0  # Pares de puntos consecutivos con el timestamp del segundo menor
+        self._lock = threading.Lock()
+        self._reservar(min(self.capacidad, capacidad_inicial or self.CAPACIDAD_INICIAL))
+
+    @classmethod
+    def desde_memoria(cls, megabytes, capacidad_inicial=None):
+        """Crea un historial cuya capacidad máxima ocupa como mucho ``megabytes`` de RAM"""
+        return cls(max(1, int(megabytes * 1024 * 1024) // cls.BYTES_POR_PUNTO), capacidad_inicial)
+
+    def _reservar(self, capacidad_actual):
+        """Reserva arreglos para ``capacidad_actual`` puntos conservando los datos existentes"""
+        timestamps = np.empty(2 * capacidad_actual, dtype=np.int64)
+        valores = np.empty((len(self.CAMPOS), 2 * capacidad_actual), dtype=np.float32)
+        if self._n:
+            fin = self._inicio + self._n
+            timestamps[:self._n] = self._timestamps[self._inicio:fin]
+            valores[:, :self._n] = self._valores[:, self._inicio:fin]
+            timestamps[capacidad_actual:capacidad_actual + self._n] = timestamps[:self._n]
+            valores[:, capacidad_actual:capacidad_actual + self._n] = valores[:, :self._n]
+        self._timestamps = timestamps
+        self._valores = valores
+        self._cap = capacidad_actual
+        self._inicio = 0
+
+    @staticmethod
+    def a_ns(timestamp=None):
+        """Convierte un timestamp ISO (o datetime, o None = ahora) a epoch en nanosegundos"""
+        if timestamp is None:
+            timestamp = datetime.now()
+        elif isinstance(timestamp, (int, np.integer)):
+            return int(timestamp)
+        return int(np.datetime64(timestamp, 'ns').astype(np.int64))
+
+    @classmethod
+    def fila(cls, datos):
+        """Valores de una lectura (dict) en el orden de CAMPOS; NaN para los que no vinieron"""
+        return [np.nan if datos.get(campo) is None else float(datos[campo]) for campo in cls.CAMPOS]
+
+    @staticmethod
+    def a_lista(columna, decimales=4):
+        """Columna de valores como lista para JSON, con None en lugar de NaN"""
+        columna = np.asarray(columna, dtype=np.float64).round(decimales)
+        faltantes = np.isnan(columna)
+        if not faltantes.any():
+            return columna.tolist()
+        return np.where(faltantes, None, columna).tolist()
+
+    @staticmethod
+    def a_iso(timestamps_ns):
+        """Convierte un arreglo de epoch en nanosegundos a cadenas ISO"""
+        return np.datetime_as_string(np.asarray(timestamps_ns).astype('datetime64[ns]'), unit='us')
+
+    def agregar(self, datos):
+        """
+        Agrega una lectura (dict con timestamp y valores de los sensores).
+        Devuelve el número de secuencia asignado al punto.
+        """
+        ts = self.a_ns(datos.get('timestamp'))
+        fila = self.fila(datos)
+
+        with self._lock:
+            if self._n == self._cap and self._cap < self.capacidad:
+                self._reservar(min(2 * self._cap, self.capacidad))
+
+            if self._n == self._cap and self._n > 1 and \
+                    self._timestamps[self._inicio + 1] < self._timestamps[self._inicio]:
+                self._descensos -= 1  # Se sobrescribe el punto más antiguo
+            if self._n and (self._n < self._cap or self._n > 1) and \
+                    ts < self._timestamps[self._inicio + self._n - 1]:
+                self._descensos += 1
+
+            if self._n < self._cap:
+                pos = (self._inicio + self._n) % self._cap
+                self._n += 1
+            else:
+                pos = self._inicio
+                self._inicio = (self._inicio + 1) % self._cap
+
+            self._timestamps[pos] = ts
+            self._timestamps[pos + self._cap] = ts
+            self._valores[:, pos] = fila
+            self._valores[:, pos + self._cap] = fila
+            self.total += 1
+            return self.total - 1
+
+    @classmethod
+    def leer_lote(cls, lote):
+        """
+        Convierte un lote de lecturas en arreglos ``(timestamps_ns, valores)``.
+
+        Acepta el formato columnar ``{'timestamp': [...], 'temperatura': [...], ...}``
+        o una lista de lecturas (también dentro de ``{'lecturas': [...]}``).
+        ``valores`` tiene forma (len(CAMPOS), N), con NaN en los campos que no
+        vinieron. Lanza ValueError si el lote está mal formado (por ejemplo, con
+        columnas de distinto largo).
+        """
+        try:
+            return cls._columnas_lote(lote)
+        except (TypeError, AttributeError) as e:
+            raise ValueError(f"Lote mal formado: {e}") from e
+
+    @classmethod
+    def _columnas_lote(cls, lote):
+        if isinstance(lote, dict) and 'lecturas' in lote:
+            lote = lote['lecturas']
+        if isinstance(lote, dict):
+            columnas = {c: lote[c] for c in ('timestamp',) + cls.CAMPOS if lote.get(c) is not None}
+            largos = {c: len(v) for c, v in columnas.items()}
+            if len(set(largos.values())) > 1:
+                raise ValueError(f"Columnas del lote de distinto largo: {largos}")
+            n = next(iter(largos.values()), 0)
+            timestamps = columnas.get('timestamp') or [None] * n
+        elif isinstance(lote, list):
+            n = len(lote)
+            columnas = {campo: [l.get(campo) for l in lote] for campo in cls.CAMPOS}
+            timestamps = [l.get('timestamp') for l in lote]
+        else:
+            raise ValueError("El lote debe ser un dict de columnas o una lista de lecturas")
+
+        valores = np.full((len(cls.CAMPOS), n), np.nan, dtype=np.float32)
+        for i, campo in enumerate(cls.CAMPOS):
+            if campo in columnas:
+                valores[i] = np.array(columnas[campo], dtype=np.float64)  # None -> NaN
+
+        ts = np.array(timestamps, dtype='datetime64[ns]').astype(np.int64)
+        faltantes = ts == np.iinfo(np.int64).min  # NaT
+        if faltantes.any():
+            ts[faltantes] = cls.a_ns()
+        return ts, valores
+
+    def agregar_lote(self, timestamps, valores):
+        """
+        Agrega N lecturas en una sola operación. ``timestamps`` son epoch en ns y
+        ``valores`` tiene forma (len(CAMPOS), N). Devuelve el número de secuencia
+        del primer punto agregado.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        valores = np.asarray(valores, dtype=np.float32)
+        k = len(timestamps)
+
+        with self._lock:
+            primero = self.total
+            self.total += k
+            if k > self.capacidad:
+                timestamps, valores = timestamps[-self.capacidad:], valores[:, -self.capacidad:]
+                k = self.capacidad
+
+            if self._n + k > self._cap and self._cap < self.capacidad:
+                self._reservar(min(max(2 * self._cap, self._n + k), self.capacidad))
+
+            # Descensos: los del lote, el del empalme y menos los de los puntos que se sobrescriben
+            desborde = max(0, self._n + k - self._cap)
+            nuevos = int(np.count_nonzero(np.diff(timestamps) < 0))
+            if desborde >= self._n:
+                self._descensos = nuevos
+            else:
+                ultimo = self._timestamps[self._inicio + self._n - 1]
+                salientes = self._timestamps[self._inicio:self._inicio + desborde + 1]
+                self._descensos += (nuevos + int(timestamps[0] < ultimo) -
+                                    int(np.count_nonzero(np.diff(salientes) < 0)))
+
+            pos = (self._inicio + self._n + np.arange(k)) % self._cap
+            self._timestamps[pos] = timestamps
+            self._timestamps[pos + self._cap] = timestamps
+            self._valores[:, pos] = valores
+            self._valores[:, pos + self._cap] = valores
+
+            self._n = min(self._n + k, self._cap)
+            self._inicio = (self._inicio + desborde) % self._cap
+            return primero
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def ordenado(self):
+        """True si los timestamps guardados están en orden no decreciente"""
+        return self._descensos == 0
+
+    def _vistas(self):
+        """Vistas de los puntos guardados, en orden de llegada (con el lock tomado)"""
+        fin = self._inicio + self._n
+        return self._timestamps[self._inicio:fin], self._valores[:, self._inicio:fin]
+
+    def ventana(self, n=None):
+        """
+        Devuelve una copia de los últimos ``n`` puntos en orden de llegada (todos
+        si ``n`` es None): ``(timestamps, valores)`` con ``valores`` de forma (len(CAMPOS), n).
+        """
+        with self._lock:
+            timestamps, valores = self._vistas()
+            n = len(timestamps) if n is None else min(n, len(timestamps))
+            return timestamps[len(timestamps) - n:].copy(), valores[:, len(timestamps) - n:].copy()
+
+    def columna(self, campo, n=None):
+        """Copia de la columna de un sensor para los últimos ``n`` puntos"""
+        _, valores = self.ventana(n)
+        return valores[self.CAMPOS.index(campo)]
+
+    def rango(self, desde=None, hasta=None):
+        """
+        Devuelve una copia de los puntos ``(timestamps, valores)`` con timestamps en
+        [desde, hasta], ordenados por timestamp. Los límites aceptan ISO, datetime o
+        epoch en ns; si los timestamps están en orden la búsqueda es por bisección.
+        """
+        a_ns = None if desde is None else self.a_ns(desde)
+        b_ns = None if hasta is None else self.a_ns(hasta)
+        with self._lock:
+            timestamps, valores = self._vistas()
+            if self.ordenado:
+                a = 0 if a_ns is None else np.searchsorted(timestamps, a_ns, side='left')
+                b = len(timestamps) if b_ns is None else np.searchsorted(timestamps, b_ns, side='right')
+                return timestamps[a:b].copy(), valores[:, a:b].copy()
+            dentro = np.ones(len(timestamps), dtype=bool)
+            if a_ns is not None:
+                dentro &= timestamps >= a_ns
+            if b_ns is not None:
+                dentro &= timestamps <= b_ns
+            timestamps, valores = timestamps[dentro], valores[:, dentro]
+        orden = np.argsort(timestamps, kind='stable')
+        return timestamps[orden], valores[:, orden]
+
+    def ultimo(self):
+        """Devuelve el último punto como dict, o None si el historial está vacío"""
+        registros = self.a_registros(*self.ventana(1))
+        return registros[0] if registros else None
+
+    def a_registros(self, timestamps, valores, campos=None, extra=None):
+        """
+        Convierte vistas del historial en la lista de dicts que espera el dashboard
+        (solo con los ``campos`` indicados, si se indican). ``extra`` se agrega a
+        cada dict (por ejemplo ``sensor_id`` y ``maquina_id``).
+        """
+        if len(timestamps) == 0:
+            return []
+        campos = tuple(c for c in campos if c in self.CAMPOS) if campos else self.CAMPOS
+        columnas = [self.a_lista(valores[self.CAMPOS.index(c)]) for c in campos]
+        iso = self.a_iso(timestamps).tolist()
+        return [
+            dict(zip(('timestamp',) + campos, fila), **(extra or {}))
+            for fila in zip(iso, *columnas)
+        ]
+
+    @staticmethod
+    def reducir(timestamps, valores, n):
+        """
+        Elige ``n`` puntos con Largest-Triangle-Three-Buckets para graficar una
+        ventana larga sin perder su forma. Con varios campos, cada punto se elige
+        por la suma de las áreas de sus triángulos, con cada campo normalizado a
+        su rango, así que todos los campos comparten los mismos timestamps.
+        Devuelve las vistas ``(timestamps, valores)`` reducidas (con ``n`` < 3,
+        los últimos ``n`` puntos; ningún punto si ``n`` <= 0).
+        """
+        total = len(timestamps)
+        n = max(0, int(n))
+        if n >= total or n < 3:
+            return (timestamps, valores) if n >= total else (timestamps[total - n:], valores[:, total - n:])
+
+        x = (timestamps - timestamps[0]) / 1e9
+        y = valores.astype(np.float64)
+        rangos = np.ptp(y, axis=1, keepdims=True)
+        y = y / np.where(rangos > 0, rangos, 1)
+
+        # Cubetas entre el primer y el último punto (que se conservan siempre)
+        bordes = (np.arange(n - 1) * (total - 2) / (n - 2)).astype(np.int64) + 1
+        bordes[-1] = total - 1
+        tamanos = np.diff(bordes)
+        # Promedio de cada cubeta: el tercer vértice del triángulo de la cubeta anterior
+        x_medio = np.append(np.add.reduceat(x[:-1], bordes[:-1]) / tamanos, x[-1])
+        y_medio = np.hstack([np.add.reduceat(y[:, :-1], bordes[:-1], axis=1) / tamanos, y[:, -1:]])
+
+        elegidos = np.empty(n, dtype=np.int64)
+        elegidos[0], elegidos[-1] = 0, total - 1
+        a = 0
+        for i in range(n - 2):
+            inicio, fin = bordes[i], bordes[i + 1]
+            xa, ya = x[a], y[:, a:a + 1]
+            xc, yc = x_medio[i + 1], y_medio[:, i + 1:i + 2]
+            areas = np.abs((xa - xc) * (y[:, inicio:fin] - ya) - (xa - x[inicio:fin]) * (yc - ya)).sum(axis=0)
+            a = inicio + int(np.argmax(areas))
+            elegidos[i + 1] = a
+        return timestamps[elegidos], valores[:, elegidos]
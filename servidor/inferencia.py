@@ -0,0 +1,197 @@
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from bitacora import obtener_logger
+
+log = obtener_logger('inferencia')
+
+
+# Modelo cargado en cada proceso del pool (modo procesos)
+_modelo_proceso = None
+
+
+def _inicializar_proceso():
+    """Carga el modelo una vez en cada proceso del pool"""
+    global _modelo_proceso
+    from modelo_predictivo import modelo_prediccion
+    modelo_prediccion.cargar()
+    _modelo_proceso = modelo_prediccion
+
+
+def _predecir_en_proceso(observaciones):
+    return _modelo_proceso.predict_batch(observaciones)
+
+
+def _estado_proceso():
+    return _modelo_proceso.estado()
+
+
+class PoolInferencia:
+    """
+    Ejecuta la inferencia del modelo fuera de los handlers de Socket.IO.
+
+    Los pedidos entran a una cola acotada atendida por ``n_trabajadores``
+    hilos (o, con ``usar_procesos``, por un pool de procesos que cargan su
+    propia copia del modelo; el proceso principal no lo carga). Cada trabajador arma micro-lotes: junta los
+    pedidos de todos los sensores durante ``ventana_ms`` milisegundos o hasta
+    ``max_lote`` observaciones (sin pasarse), ejecuta una sola llamada al modelo y reparte
+    las acciones a cada pedido. Si la cola está llena el pedido no espera: pasa
+    a una cola de respaldo que un hilo aparte resuelve con la regla de umbrales
+    (``ModeloPrediccion.es_critico``), y si esa también está llena se descarta,
+    de modo que la ingesta nunca se frena por el modelo. Mientras el modelo se
+    carga en segundo plano al arrancar también se usa la regla de umbrales.
+    """
+
+    def __init__(self, modelo, n_trabajadores=2, tamano_cola=1024, usar_procesos=False,
+                 ventana_ms=5, max_lote=256):
+        self.modelo = modelo
+        self.n_trabajadores = n_trabajadores
+        self.usar_procesos = usar_procesos
+        self.ventana = ventana_ms / 1000.0
+        self.max_lote = max_lote
+        self.por_umbral = 0   # Pedidos resueltos por umbral por saturación
+        self.descartados = 0  # Pedidos descartados con las dos colas llenas
+        self.llamadas = 0     # Llamadas al modelo (cada una atiende un micro-lote)
+        self._cola = queue.Queue(maxsize=tamano_cola)
+        self._respaldo = queue.Queue(maxsize=tamano_cola)
+        self._ejecutor = None
+        self._procesos_listos = False
+        self._hilos = []
+
+    def iniciar(self):
+        """Inicia los trabajadores (una sola vez) y la carga del modelo en segundo plano"""
+        if self._hilos:
+            return
+        if self.usar_procesos:
+            # Cada proceso carga el modelo en su inicializador; el principal solo consulta el estado
+            self._ejecutor = ProcessPoolExecutor(self.n_trabajadores, initializer=_inicializar_proceso)
+            self.modelo.estado_procesos = {'listo': False, 'cargando': True, 'motor': None,
+                                           'segundos_carga': None, 'error': None}
+            self._ejecutor.submit(_estado_proceso).add_done_callback(self._cargado_en_procesos)
+        else:
+            self.modelo.cargar_en_segundo_plano()
+        for i in range(self.n_trabajadores):
+            hilo = threading.Thread(target=self._trabajar, name=f"inferencia-{i}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+        hilo = threading.Thread(target=self._responder_por_umbral, name="inferencia-umbral", daemon=True)
+        hilo.start()
+        self._hilos.append(hilo)
+
+    def _cargado_en_procesos(self, futuro):
+        try:
+            estado = futuro.result()
+        except Exception as e:
+            log.error("Error al cargar el modelo en los procesos de inferencia: %s", e)
+            estado = {'listo': False, 'cargando': False, 'motor': None, 'segundos_carga': None, 'error': str(e)}
+        self.modelo.estado_procesos = estado
+        self._procesos_listos = estado['listo']
+
+    def _listo(self):
+        if self._ejecutor is not None:
+            return self._procesos_listos
+        return self.modelo.esta_listo()
+
+    def pendientes(self):
+        return self._cola.qsize()
+
+    def enviar(self, observaciones, callback, contexto=None):
+        """
+        Encola la inferencia de ``observaciones`` (forma (N, 3)). Cuando termina se
+        llama ``callback(acciones, criticos, contexto, origen)`` con ``origen`` igual
+        a 'modelo' o 'umbral', siempre desde otro hilo. Devuelve False si por
+        saturación se resolverá por umbral o se descartó.
+        """
+        pedido = (np.asarray(observaciones, dtype=np.float32).reshape(-1, 3), callback, contexto)
+        try:
+            self._cola.put_nowait(pedido)
+            return True
+        except queue.Full:
+            pass
+        try:
+            self._respaldo.put_nowait(pedido)
+            self.por_umbral += 1
+        except queue.Full:
+            self.descartados += 1
+        return False
+
+    def _responder_por_umbral(self):
+        """Resuelve con la regla de umbrales los pedidos que no entraron a la cola del modelo"""
+        while True:
+            observaciones, callback, contexto = self._respaldo.get()
+            try:
+                criticos = self.modelo.es_critico(observaciones)
+                callback(criticos.astype(np.int64), criticos, contexto, 'umbral')
+            except Exception:
+                log.exception("Error al entregar una predicción por umbral")
+            finally:
+                self._respaldo.task_done()
+
+    def _juntar(self, pendiente=None):
+        """
+        Espera un pedido (o empieza por ``pendiente``) y junta los que lleguen
+        dentro de la ventana sin pasar de ``max_lote`` filas. Devuelve los
+        pedidos y el que ya no entró, que empieza el próximo micro-lote.
+        """
+        pedidos = [self._cola.get() if pendiente is None else pendiente]
+        filas = len(pedidos[0][0])
+        limite = time.monotonic() + self.ventana
+        while filas < self.max_lote:
+            restante = limite - time.monotonic()
+            try:
+                pedido = self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait()
+            except queue.Empty:
+                break
+            if filas + len(pedido[0]) > self.max_lote:
+                return pedidos, pedido
+            pedidos.append(pedido)
+            filas += len(pedido[0])
+        return pedidos, None
+
+    def _trabajar(self):
+        pendiente = None
+        while True:
+            pedidos, pendiente = self._juntar(pendiente)
+            try:
+                observaciones = np.concatenate([p[0] for p in pedidos])
+                acciones, origen = self._predecir(observaciones)
+                criticos = self.modelo.es_critico(observaciones)
+
+                # Repartir los resultados del micro-lote a cada pedido
+                inicio = 0
+                for obs, callback, contexto in pedidos:
+                    fin = inicio + len(obs)
+                    try:
+                        callback(acciones[inicio:fin], criticos[inicio:fin], contexto, origen)
+                    except Exception:
+                        log.exception("Error al entregar una predicción")
+                    inicio = fin
+            except Exception:
+                log.exception("Error en el hilo de inferencia")
+            finally:
+                for _ in pedidos:
+                    self._cola.task_done()
+
+    def _predecir(self, observaciones):
+        """Acciones del modelo para el lote (o por umbral si el modelo no está disponible)"""
+        if len(observaciones) > self.max_lote:
+            # Un solo pedido más grande que max_lote: varias llamadas de max_lote filas
+            partes = [self._predecir(observaciones[i:i + self.max_lote])
+                      for i in range(0, len(observaciones), self.max_lote)]
+            origen = 'modelo' if all(o == 'modelo' for _, o in partes) else 'umbral'
+            return np.concatenate([a for a, _ in partes]), origen
+        if not self._listo():
+            return self.modelo.es_critico(observaciones).astype(np.int64), 'umbral'
+        try:
+            if self._ejecutor is not None:
+                self.llamadas += 1
+                return self._ejecutor.submit(_predecir_en_proceso, observaciones).result(), 'modelo'
+            self.llamadas += 1
+            return self.modelo.predict_batch(observaciones), 'modelo'
+        except Exception as e:
+            log.warning("Error en la inferencia, se usa la regla de umbrales: %s", e)
+        return self.modelo.es_critico(observaciones).astype(np.int64), 'umbral'
@@ -1,34 +1,203 @@
 import numpy as np
 
+from markov.dispersa import MatrizDispersa
+
+def vector_en_estado(n, estado=0):
+    """Vector de probabilidad con toda la masa en ``estado`` (sin armar una matriz n×n)"""
+    vector = np.zeros(n)
+    vector[estado] = 1.0
+    return vector
+
+
+def en_tres_estados(probabilidades):
+    """
+    Resume una distribución de N estados (ordenados de mejor a peor) en
+    bueno/medio/malo, sumando tres tramos consecutivos de estados. Con menos
+    de 3 estados el primero es 'bueno' y el último 'malo' (sin 'medio').
+    """
+    probabilidades = np.asarray(probabilidades, dtype=float)
+    n = probabilidades.shape[-1]
+    if n == 3:
+        return probabilidades
+    if n < 3:
+        resumen = np.zeros(probabilidades.shape[:-1] + (3,))
+        resumen[..., 0] = probabilidades[..., 0]
+        if n == 2:
+            resumen[..., 2] = probabilidades[..., 1]
+        return resumen
+    return np.stack([tramo.sum(axis=-1) for tramo in np.array_split(probabilidades, 3, axis=-1)], axis=-1)
+
+
 class CadenaMarkov:
-    def __init__(self, matriz_transicion: np.ndarray, vector_inicial: np.ndarray):
-        self.matriz_transicion = np.array(matriz_transicion, dtype= float)
+    """
+    Cadena de Markov con matriz de transición por filas y vector inicial.
+
+    La matriz se factoriza una sola vez (P = V diag(λ) V⁻¹), así que el
+    estado tras n pasos cuesta O(k²) para cualquier n y la trayectoria de
+    1..N pasos sale en una sola operación. Si la matriz no es diagonalizable
+    (o V está mal condicionada) se usan potencias P^(2^j) calculadas una vez
+    y reutilizadas por elevación al cuadrado.
+
+    Para cadenas de muchos estados la matriz puede ser una ``MatrizDispersa``:
+    la validación y cada paso cuestan O(nnz) y la distribución estacionaria
+    se obtiene por iteración de potencias en lugar de ``eig`` (O(n³)).
+    """
+
+    # Condición máxima de V para confiar en la diagonalización
+    CONDICION_MAXIMA = 1e8
+    # Iteración de potencias para la distribución estacionaria de cadenas dispersas
+    TOLERANCIA = 1e-10
+    MAX_ITERACIONES = 100000
+
+    def __init__(self, matriz_transicion, vector_inicial: np.ndarray):
+        self.dispersa = isinstance(matriz_transicion, MatrizDispersa)
+        self.matriz_transicion = matriz_transicion if self.dispersa else np.array(matriz_transicion, dtype= float)
         self.vector_inicial = np.array(vector_inicial, dtype= float )
         self._validar_elementos()
+        self._valores = None      # λ de la diagonalización
+        self._vectores = None     # V
+        self._inversa = None      # V⁻¹ (sus filas son los autovectores izquierdos)
+        self._potencias = None    # [P, P², P⁴, ...] si no se puede diagonalizar
+        self.convergencia = None  # Resultado de la última iteración de potencias
+        if not self.dispersa:
+            self._factorizar()
+
+    @property
+    def n_estados(self):
+        return self.matriz_transicion.shape[0]
 
     def _validar_elementos(self):
-        if self.matriz_transicion.ndim != 2 or self.matriz_transicion.shape[0] != self.matriz_transicion.shape[1]:
+        if len(self.matriz_transicion.shape) != 2 or self.matriz_transicion.shape[0] != self.matriz_transicion.shape[1]:
             raise ValueError("la matriz de transicion debe de ser cuadrada")
-        if np.any(self.matriz_transicion < 0) or np.any(self.matriz_transicion > 1):
+        if self.dispersa:
+            # Solo se recorren las entradas guardadas: O(nnz)
+            matriz = self.matriz_transicion
+            entradas = matriz.datos
+            if len(matriz.punteros) != matriz.shape[0] + 1 or matriz.punteros[0] != 0 or \
+                    matriz.punteros[-1] != len(entradas) or np.any(np.diff(matriz.punteros) < 0):
+                raise ValueError("Los punteros de filas de la matriz dispersa no son válidos")
+            if len(matriz.indices) != len(entradas) or \
+                    (len(entradas) and (matriz.indices.min() < 0 or matriz.indices.max() >= matriz.shape[1])):
+                raise ValueError("Los índices de columna de la matriz dispersa están fuera de rango")
+            sumas_filas = matriz.sumas_filas()
+        else:
+            entradas = self.matriz_transicion
+            sumas_filas = self.matriz_transicion.sum(axis=1)
+        if np.any(entradas < 0) or np.any(entradas > 1):
             raise ValueError("Cada entrada de la matriz debe estar entre 0 y 1")
-        sumas_filas = self.matriz_transicion.sum(axis=1)
         if not np.allclose(sumas_filas,1):
-            raise ValueError(f"cada fila debe de sumasr 1 (sumas actuales:{sumas_filas})")
-        if self.vector_inicial.ndim != 1 or self.vector_inicial.shape[0] != self.matriz_transicion.shape[0]:
+            malas = np.flatnonzero(~np.isclose(sumas_filas, 1))
+            raise ValueError(f"cada fila debe de sumasr 1 (filas {malas[:10].tolist()} suman {sumas_filas[malas[:10]]})")
+        self._validar_vector(self.vector_inicial)
+
+    def _validar_vector(self, vector):
+        if vector.ndim != 1 or vector.shape[0] != self.matriz_transicion.shape[0]:
             raise ValueError("El vector inicial debe tener la misma longitud que la dimension de la matriz")
-        if np.any(self.vector_inicial < 0) or not np.isclose(self.vector_inicial.sum(), 1):
+        if np.any(vector < 0) or not np.isclose(vector.sum(), 1):
             raise ValueError("El vector inicial debe ser un vector de probabilidad >= 0 y suma =1)")
 
-    def propagar(self, pasos: int) -> np.ndarray:
-        if not isinstance(pasos, int) or pasos < 0:
+    def _factorizar(self):
+        """Diagonaliza la matriz una vez; si no es posible, prepara las potencias por cuadrados"""
+        try:
+            valores, vectores = np.linalg.eig(self.matriz_transicion)
+            if np.linalg.cond(vectores) < self.CONDICION_MAXIMA:
+                self._valores, self._vectores = valores, vectores
+                self._inversa = np.linalg.inv(vectores)
+                return
+        except np.linalg.LinAlgError:
+            pass
+        self._potencias = [self.matriz_transicion]
+
+    @property
+    def diagonalizable(self):
+        return self._valores is not None
+
+    @property
+    def factorizacion(self):
+        """``(λ, V, V⁻¹)`` de la diagonalización guardada, o None si no es diagonalizable"""
+        return (self._valores, self._vectores, self._inversa) if self.diagonalizable else None
+
+    def _vector(self, vector):
+        if vector is None:
+            return self.vector_inicial
+        vector = np.array(vector, dtype=float)
+        self._validar_vector(vector)
+        return vector
+
+    @staticmethod
+    def _validar_pasos(pasos):
+        if not isinstance(pasos, (int, np.integer)) or isinstance(pasos, bool) or pasos < 0:
             raise ValueError("el numero de pasos debe ser un entero")
-        matriz_n = np.linalg.matrix_power(self.matriz_transicion, pasos)
-        return self.vector_inicial @ matriz_n
 
-    def calculo_futuro(self) -> np.ndarray:
-        valores, vectores = np.linalg.eig(self.matriz_transicion)
+    @staticmethod
+    def _probabilidades(resultado):
+        # Los autovalores complejos dejan restos imaginarios y negativos del orden del redondeo
+        return np.maximum(np.real(resultado), 0.0)
+
+    def propagar(self, pasos: int, vector=None) -> np.ndarray:
+        """Distribución tras ``pasos`` pasos desde el vector inicial (o desde ``vector``)"""
+        self._validar_pasos(pasos)
+        vector = self._vector(vector)
+        if self.diagonalizable:
+            return self._probabilidades(((vector @ self._vectores) * self._valores ** pasos) @ self._inversa)
+        if self.dispersa:
+            # Producto vector-matriz disperso en cada paso: O(pasos · nnz)
+            for _ in range(pasos):
+                vector = self.matriz_transicion.vecmat(vector)
+            return vector
+        # Elevación al cuadrado con las potencias P^(2^j) guardadas
+        resultado, j = vector, 0
+        while pasos:
+            if j == len(self._potencias):
+                self._potencias.append(self._potencias[-1] @ self._potencias[-1])
+            if pasos & 1:
+                resultado = resultado @ self._potencias[j]
+            pasos >>= 1
+            j += 1
+        return resultado
+
+    def trayectoria(self, pasos: int, vector=None) -> np.ndarray:
+        """Distribuciones tras 1..``pasos`` pasos, como arreglo de forma (pasos, k)"""
+        self._validar_pasos(pasos)
+        vector = self._vector(vector)
+        if self.diagonalizable:
+            n = np.arange(1, pasos + 1)[:, None]
+            return self._probabilidades(((vector @ self._vectores) * self._valores ** n) @ self._inversa)
+        resultado = np.empty((pasos, len(vector)))
+        for i in range(pasos):
+            vector = vector @ self.matriz_transicion
+            resultado[i] = vector
+        return resultado
+
+    def calculo_futuro(self, tolerancia=None, max_iteraciones=None) -> np.ndarray:
+        """Distribución estacionaria: autovector izquierdo de autovalor 1"""
+        if self.dispersa:
+            return self._iteracion_potencias(tolerancia or self.TOLERANCIA, max_iteraciones or self.MAX_ITERACIONES)
+        if self.diagonalizable:
+            valores, izquierdos = self._valores, self._inversa
+        else:
+            valores, vectores = np.linalg.eig(self.matriz_transicion.T)
+            izquierdos = vectores.T
         indice = np.argmin(np.abs(valores -1))
-        estacionario = np.real(vectores [:,indice])
+        estacionario = np.real(izquierdos[indice])
         estacionario = estacionario /estacionario.sum()
         return estacionario
 
+    def _iteracion_potencias(self, tolerancia, max_iteraciones):
+        """
+        π ← (π + πP) / 2 hasta que el cambio (norma 1) baje de ``tolerancia``.
+        Promediar con el paso anterior (cadena "perezosa") tiene la misma
+        distribución estacionaria y evita que las cadenas periódicas oscilen.
+        El resultado queda en ``self.convergencia``.
+        """
+        estacionario = self.vector_inicial
+        cambio = np.inf
+        for iteracion in range(1, max_iteraciones + 1):
+            siguiente = 0.5 * (estacionario + self.matriz_transicion.vecmat(estacionario))
+            siguiente /= siguiente.sum()
+            cambio = np.abs(siguiente - estacionario).sum()
+            estacionario = siguiente
+            if cambio < tolerancia:
+                break
+        self.convergencia = {'iteraciones': iteracion, 'cambio': float(cambio), 'convergio': bool(cambio < tolerancia)}
+        return estacionario
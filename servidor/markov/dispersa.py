@@ -0,0 +1,96 @@
+import numpy as np
+
+class MatrizDispersa:
+    """
+    Matriz dispersa en formato CSR (filas comprimidas) implementada con NumPy.
+
+    ``datos`` e ``indices`` tienen un elemento por entrada no nula, ordenados
+    por fila, y ``punteros[i]:punteros[i + 1]`` es el tramo de la fila ``i``.
+    Sirve para cadenas de Markov con cientos o miles de estados en las que
+    cada estado solo pasa a unos pocos vecinos: el producto por un vector
+    cuesta O(nnz) en lugar de O(n²).
+    """
+
+    # Que ``vector @ matriz`` con un arreglo de NumPy use ``__rmatmul__``
+    __array_ufunc__ = None
+
+    def __init__(self, datos, indices, punteros, forma):
+        self.datos = np.asarray(datos, dtype=float)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.punteros = np.asarray(punteros, dtype=np.int64)
+        self.forma = tuple(int(n) for n in forma)
+        # Fila de cada entrada (para reducciones por fila y productos)
+        self.filas = np.repeat(np.arange(self.forma[0]), np.diff(self.punteros))
+        self._por_columna = None
+
+    @classmethod
+    def desde_coordenadas(cls, filas, columnas, valores, n):
+        """Construye la matriz n×n desde tripletas (fila, columna, valor); los repetidos se suman"""
+        filas = np.asarray(filas, dtype=np.int64)
+        columnas = np.asarray(columnas, dtype=np.int64)
+        valores = np.asarray(valores, dtype=float)
+        if filas.size and (filas.min() < 0 or filas.max() >= n or columnas.min() < 0 or columnas.max() >= n):
+            raise ValueError(f"Índices de estado fuera de rango (0..{n - 1})")
+        # Ordenar por (fila, columna) y sumar las tripletas repetidas
+        claves = filas * n + columnas
+        unicas, inversa = np.unique(claves, return_inverse=True)
+        datos = np.bincount(inversa, weights=valores, minlength=len(unicas))
+        punteros = np.concatenate([[0], np.cumsum(np.bincount(unicas // n, minlength=n))])
+        return cls(datos, unicas % n, punteros, (n, n))
+
+    @classmethod
+    def desde_densa(cls, matriz):
+        matriz = np.asarray(matriz, dtype=float)
+        filas, columnas = np.nonzero(matriz)
+        return cls.desde_coordenadas(filas, columnas, matriz[filas, columnas], matriz.shape[0])
+
+    @property
+    def nnz(self):
+        return len(self.datos)
+
+    @property
+    def shape(self):
+        return self.forma
+
+    def sumas_filas(self):
+        return np.bincount(self.filas, weights=self.datos, minlength=self.forma[0])
+
+    def vecmat(self, vector):
+        """
+        Producto ``vector @ matriz`` en O(nnz). ``vector`` puede ser (n,) o
+        (m, n) para propagar varias distribuciones a la vez.
+        """
+        vector = np.asarray(vector, dtype=float)
+        if vector.ndim == 1:
+            return np.bincount(self.indices, weights=vector[self.filas] * self.datos, minlength=self.forma[1])
+        # Varias filas: sumar los aportes agrupados por columna
+        orden, cortes, columnas = self._columnas()
+        aportes = (vector[:, self.filas] * self.datos)[:, orden]
+        resultado = np.zeros((vector.shape[0], self.forma[1]))
+        if len(cortes):
+            resultado[:, columnas] = np.add.reduceat(aportes, cortes, axis=1)
+        return resultado
+
+    def _columnas(self):
+        """Orden de las entradas por columna, inicio de cada columna no vacía y sus índices"""
+        if self._por_columna is None:
+            orden = np.argsort(self.indices, kind='stable')
+            columnas, cortes = np.unique(self.indices[orden], return_index=True)
+            self._por_columna = (orden, cortes, columnas)
+        return self._por_columna
+
+    def __matmul__(self, otra):
+        """Producto matriz @ vector columna (o matriz densa), en O(nnz) por columna"""
+        otra = np.asarray(otra, dtype=float)
+        productos = self.datos.reshape((-1,) + (1,) * (otra.ndim - 1)) * otra[self.indices]
+        resultado = np.zeros((self.forma[0],) + otra.shape[1:])
+        np.add.at(resultado, self.filas, productos)
+        return resultado
+
+    def __rmatmul__(self, vector):
+        return self.vecmat(vector)
+
+    def densa(self):
+        matriz = np.zeros(self.forma)
+        matriz[self.filas, self.indices] = self.datos
+        return matriz
@@ -0,0 +1,217 @@
+"""
+Estimación en línea de la matriz de transición de cada máquina.
+
+Cada lectura se clasifica en bueno/medio/malo con los límites de la máquina
+en ``Maquinas_Cerveceria`` (``temp_mini``, ``temp_maxi``, ``presion_max``):
+
+- malo: temperatura fuera de [temp_mini, temp_maxi] o presión sobre presion_max,
+- medio: dentro, pero a menos de ``margen`` (fracción del rango) de algún límite,
+- bueno: el resto.
+
+Por máquina se cuentan las transiciones entre el estado de una lectura y el
+de la siguiente del mismo sensor (cada serie (máquina, sensor) tiene su
+último estado, para no inventar transiciones al intercalar sensores). Con ``olvido`` < 1 cada transición pesa ``1/olvido`` veces
+más que la anterior (olvido exponencial): en lugar de multiplicar todos los
+conteos en cada lectura se hace crecer el peso de las nuevas y se reescala
+de vez en cuando, así que cada lectura cuesta O(1). ``previa`` es el conteo
+inicial de cada transición, para que las filas sin datos sumen 1. Las
+lecturas sin temperatura o sin presión (NaN) no tienen estado y se omiten.
+"""
+import math
+import threading
+
+import numpy as np
+
+from bitacora import obtener_logger
+from historial import HistorialSensores
+from markov.cadenas_de_markov import CadenaMarkov, vector_en_estado
+
+log = obtener_logger('estimador')
+
+CAMPOS = HistorialSensores.CAMPOS
+ESTADOS = ('bueno', 'medio', 'malo')
+
+
+class ConteosMaquina:
+    """Conteos de transiciones de una máquina (en unidades del peso actual)"""
+
+    __slots__ = ('conteos', 'peso', 'ultimo', 'lecturas', 'cadena')
+
+    def __init__(self):
+        self.conteos = np.zeros((len(ESTADOS), len(ESTADOS)))
+        self.peso = 1.0      # Peso de la próxima transición
+        self.ultimo = None   # Estado de la última lectura de la máquina (de cualquier sensor)
+        self.lecturas = 0
+        self.cadena = None   # CadenaMarkov de los conteos actuales (se arma al pedirla)
+
+
+class EstimadorTransiciones:
+    """Matriz de transición de cada máquina estimada de sus lecturas (ver el módulo)"""
+
+    # Peso máximo antes de reescalar los conteos de una máquina
+    PESO_MAXIMO = 1e50
+
+    def __init__(self, limites, margen=0.1, olvido=1.0, previa=1.0, persistir=False):
+        if not 0 < olvido <= 1:
+            raise ValueError("olvido debe estar en (0, 1]")
+        self.limites = dict(limites)  # Límites por defecto (máquinas sin fila en la base de datos)
+        self.margen = margen
+        self.olvido = olvido
+        self.previa = previa
+        self.persistir = persistir
+        self._limites_maquina = {}    # maquina_id -> (temp_mini, temp_maxi, presion_max)
+        self._ids = {}                # nombre de la máquina -> id
+        self._maquinas = {}
+        self._ultimos = {}            # (maquina_id, sensor_id) -> estado de la última lectura de la serie
+        self._lock = threading.Lock()
+        self._i_temperatura = CAMPOS.index('temperatura')
+        self._i_presion = CAMPOS.index('presion')
+
+    def iniciar(self):
+        """Con persistencia, carga los límites de todas las máquinas de Maquinas_Cerveceria"""
+        if not self.persistir:
+            return
+        from sqlalchemy import select
+        from sqlalchemy.exc import SQLAlchemyError
+        from persistencia import MaquinasCerveceria, motor_consultas
+        tabla = MaquinasCerveceria.__table__
+        try:
+            with motor_consultas().connect() as conexion:
+                filas = conexion.execute(select(tabla.c.id, tabla.c.nombre, tabla.c.temp_mini, tabla.c.temp_maxi,
+                                                tabla.c.presion_max)).all()
+        except SQLAlchemyError as e:
+            log.warning("No se pudieron leer los límites de las máquinas, se usan los de config.py: %s", e)
+            return
+        with self._lock:
+            for id_maquina, nombre, temp_mini, temp_maxi, presion_max in filas:
+                self._limites_maquina[id_maquina] = self._completar(temp_mini, temp_maxi, presion_max)
+                if nombre:
+                    self._ids.setdefault(nombre, id_maquina)
+        log.info("Límites de %d máquinas cargados para el estimador de transiciones", len(filas))
+
+    def _completar(self, temp_mini, temp_maxi, presion_max):
+        """Límites de una máquina, con los de config.py para los que falten"""
+        return (self.limites['temp_mini'] if temp_mini is None else temp_mini,
+                self.limites['temp_maxi'] if temp_maxi is None else temp_maxi,
+                self.limites['presion_max'] if presion_max is None else presion_max)
+
+    def id_maquina(self, nombre):
+        """Id de la máquina con ese nombre en Maquinas_Cerveceria (o None)"""
+        return self._ids.get(nombre)
+
+    def _limites(self, maquina_id):
+        return self._limites_maquina.get(maquina_id) or self._completar(None, None, None)
+
+    def _estado(self, maquina_id, temperatura, presion):
+        """Estado de una sola lectura (sin NumPy)"""
+        temp_mini, temp_maxi, presion_max = self._limites(maquina_id)
+        if temperatura < temp_mini or temperatura > temp_maxi or presion > presion_max:
+            return 2
+        holgura = self.margen * (temp_maxi - temp_mini)
+        if (temperatura < temp_mini + holgura or temperatura > temp_maxi - holgura or
+                presion > (1 - self.margen) * presion_max):
+            return 1
+        return 0
+
+    def discretizar(self, maquina_id, valores):
+        """Estado (0 bueno, 1 medio, 2 malo) de cada lectura; ``valores`` de forma (len(CAMPOS), N)"""
+        temp_mini, temp_maxi, presion_max = self._limites(maquina_id)
+        temperatura = np.asarray(valores[self._i_temperatura], dtype=float)
+        presion = np.asarray(valores[self._i_presion], dtype=float)
+        holgura = self.margen * (temp_maxi - temp_mini)
+        malo = (temperatura < temp_mini) | (temperatura > temp_maxi) | (presion > presion_max)
+        medio = ((temperatura < temp_mini + holgura) | (temperatura > temp_maxi - holgura) |
+                 (presion > (1 - self.margen) * presion_max))
+        return np.where(malo, 2, np.where(medio, 1, 0))
+
+    def agregar(self, maquina_id, sensor_id, valores):
+        """
+        Suma las transiciones de un lote de lecturas de un sensor de la máquina
+        (``valores`` de forma (len(CAMPOS), N))
+        """
+        temperatura, presion = valores[self._i_temperatura], valores[self._i_presion]
+        if len(temperatura) == 1:
+            # Camino rápido de una sola lectura (sin temperatura o presión no hay estado)
+            temperatura, presion = float(temperatura[0]), float(presion[0])
+            if math.isnan(temperatura) or math.isnan(presion):
+                return
+            estados = [self._estado(maquina_id, temperatura, presion)]
+        else:
+            valores = np.asarray(valores, dtype=float)
+            completas = ~(np.isnan(valores[self._i_temperatura]) | np.isnan(valores[self._i_presion]))
+            estados = self.discretizar(maquina_id, valores if completas.all() else valores[:, completas])
+            if len(estados) == 0:
+                return
+        with self._lock:
+            maquina = self._maquinas.get(maquina_id)
+            if maquina is None:
+                maquina = self._maquinas[maquina_id] = ConteosMaquina()
+            ultimo = self._ultimos.get((maquina_id, sensor_id))
+            if len(estados) == 1:
+                if ultimo is not None:
+                    self._sumar(maquina, ultimo, estados[0])
+            else:
+                desde = estados[:-1] if ultimo is None else np.concatenate([[ultimo], estados[:-1]])
+                hacia = estados[1:] if ultimo is None else estados
+                self._sumar_lote(maquina, desde, hacia)
+            self._ultimos[(maquina_id, sensor_id)] = maquina.ultimo = int(estados[-1])
+            maquina.lecturas += len(estados)
+            maquina.cadena = None
+
+    def _sumar(self, maquina, desde, hacia):
+        maquina.conteos[desde, hacia] += maquina.peso
+        maquina.peso /= self.olvido
+        if maquina.peso > self.PESO_MAXIMO:
+            self._reescalar(maquina)
+
+    def _sumar_lote(self, maquina, desde, hacia):
+        """Transiciones de un lote, por bloques para que los pesos no desborden"""
+        crecimiento = -math.log(self.olvido)
+        bloque = max(1, int(math.log(self.PESO_MAXIMO) / crecimiento)) if crecimiento > 0 else len(desde)
+        for inicio in range(0, len(desde), bloque):
+            d, h = desde[inicio:inicio + bloque], hacia[inicio:inicio + bloque]
+            pesos = maquina.peso * np.exp(crecimiento * np.arange(len(d)))
+            np.add.at(maquina.conteos, (d, h), pesos)
+            maquina.peso = pesos[-1] / self.olvido
+            if maquina.peso > self.PESO_MAXIMO:
+                self._reescalar(maquina)
+
+    @staticmethod
+    def _reescalar(maquina):
+        maquina.conteos /= maquina.peso
+        maquina.peso = 1.0
+
+    def matriz(self, maquina_id):
+        """Matriz de transición estimada de la máquina (None si no hay lecturas)"""
+        with self._lock:
+            maquina = self._maquinas.get(maquina_id)
+            return None if maquina is None else self._normalizar(maquina)
+
+    def _normalizar(self, maquina):
+        # Conteos en unidades de la última transición (peso 1), más la previa
+        conteos = maquina.conteos / (maquina.peso * self.olvido) + self.previa
+        sumas = conteos.sum(axis=1, keepdims=True)
+        vacias = sumas[:, 0] == 0
+        conteos[vacias] = np.eye(len(ESTADOS))[vacias]  # Sin datos ni previa: el estado se mantiene
+        sumas[vacias] = 1
+        return conteos / sumas
+
+    def cadena(self, maquina_id):
+        """
+        ``CadenaMarkov`` con la matriz estimada y el estado actual de la
+        máquina como vector inicial (None si no hay lecturas). Se arma una vez
+        por cada cambio de los conteos.
+        """
+        with self._lock:
+            maquina = self._maquinas.get(maquina_id)
+            if maquina is None or maquina.ultimo is None:
+                return None
+            if maquina.cadena is None:
+                maquina.cadena = CadenaMarkov(self._normalizar(maquina), vector_en_estado(len(ESTADOS), maquina.ultimo))
+            return maquina.cadena
+
+    def olvidar(self, maquina_id):
+        with self._lock:
+            self._maquinas.pop(maquina_id, None)
+            for serie in [s for s in self._ultimos if s[0] == maquina_id]:
+                del self._ultimos[serie]
@@ -0,0 +1,55 @@
+import numpy as np
+
+def pronosticar(valores, vectores, inversas, iniciales, horizontes):
+    """
+    Distribuciones de M cadenas diagonalizadas del mismo tamaño para varios
+    horizontes a la vez, con la factorización P = V diag(λ) V⁻¹ ya calculada
+    de cada cadena: π·P^h = ((π V) · λ^h) V⁻¹.
+
+    ``valores`` tiene forma (M, k), ``vectores`` e ``inversas`` (M, k, k) e
+    ``iniciales`` (M, k). Cuesta O(M · len(horizontes) · k²) sin bucles por
+    máquina. Devuelve un arreglo de forma (M, len(horizontes), k) en el orden pedido.
+    """
+    horizontes = np.asarray(horizontes, dtype=np.int64)
+    coeficientes = np.einsum('mi,mij->mj', iniciales, vectores)
+    escalados = coeficientes[:, None, :] * valores[:, None, :] ** horizontes[None, :, None]
+    # Los autovalores complejos dejan restos imaginarios y negativos del orden del redondeo
+    return np.maximum(np.real(np.einsum('mhj,mjk->mhk', escalados, inversas)), 0.0)
+
+
+def _propagar_horizontes(cadena, horizontes):
+    """Distribuciones de una cadena para cada horizonte, avanzando de uno al siguiente en orden"""
+    resultado = np.empty((len(horizontes), cadena.n_estados))
+    actual, paso = cadena.vector_inicial, 0
+    for i in np.argsort(horizontes, kind='stable'):
+        if horizontes[i] > paso:
+            actual = cadena.propagar(int(horizontes[i] - paso), actual)
+            paso = horizontes[i]
+        resultado[i] = actual
+    return resultado
+
+
+def pronosticar_cadenas(cadenas, horizontes):
+    """
+    Pronóstico de una lista de ``CadenaMarkov``: las diagonalizables se
+    agrupan por cantidad de estados y se apilan sus factorizaciones (ya
+    guardadas en cada cadena) para ``pronosticar``; las demás (dispersas o no
+    diagonalizables) se propagan una por una de un horizonte al siguiente.
+    Devuelve una lista con un arreglo (len(horizontes), k) por cadena, en el
+    mismo orden.
+    """
+    horizontes = np.asarray(horizontes, dtype=np.int64)
+    resultados = [None] * len(cadenas)
+    grupos = {}
+    for i, cadena in enumerate(cadenas):
+        if cadena.factorizacion is None:
+            resultados[i] = _propagar_horizontes(cadena, horizontes)
+        else:
+            grupos.setdefault(cadena.n_estados, []).append(i)
+    for indices in grupos.values():
+        valores, vectores, inversas = (np.stack(partes) for partes in zip(*(cadenas[i].factorizacion
+                                                                            for i in indices)))
+        iniciales = np.stack([cadenas[i].vector_inicial for i in indices])
+        for i, distribuciones in zip(indices, pronosticar(valores, vectores, inversas, iniciales, horizontes)):
+            resultados[i] = distribuciones
+    return resultados
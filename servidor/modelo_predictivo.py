@@ -1,59 +1,162 @@
-from stable_baselines3 import PPO
 import numpy as np
 import os
-import sys
+import threading
+import time
 
-# Add the IAs directory to the Python path
-sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'IAs'))
-from EquipoEnt import EquipoEnt
+from bitacora import obtener_logger
+from config import Config
+from motor_numpy import MotorNumpy
+from motor_tabla import MotorTabla
+
+log = obtener_logger('modelo')
 
 class ModeloPrediccion:
-    def __init__(self, model_path=None):
-        """Initialize the prediction model"""
+    MOTORES = ('auto', 'numpy', 'tabla', 'sb3')
+    
+    def __init__(self, model_path=None, motor='auto'):
+        """
+        Initialize the prediction model. The model is not loaded here: it is loaded
+        by ``cargar_en_segundo_plano()`` at server startup, or on first use.
+        ``motor`` selects the inference engine (see ``load_model``).
+        """
+        if motor not in self.MOTORES:
+            raise ValueError(f"Motor de inferencia desconocido: {motor}")
         self.model = None
-        self.env = None
+        self.motor_pedido = motor
+        self.motor = None  # Motor efectivamente cargado: 'numpy', 'tabla' o 'sb3'
+        self.error = None
+        self.segundos_carga = None
+        self.estado_procesos = None  # Estado de la carga en los procesos de inferencia (modo procesos)
         self.model_path = model_path or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'IAs', 'modelo_predictivo')
-        self.load_model()
+        self._cargado = threading.Event()
+        self._lock = threading.Lock()
+        self._hilo = None
+    
+    def esta_listo(self):
+        """True cuando el modelo está cargado y ya hizo la inferencia de calentamiento"""
+        return self._cargado.is_set() and self.model is not None
+    
+    def cargar(self):
+        """Carga el modelo (una sola vez) y hace una inferencia de calentamiento"""
+        with self._lock:
+            if self._cargado.is_set():
+                return self.model is not None
+            
+            inicio = time.monotonic()
+            self.load_model()
+            if self.model is not None:
+                try:
+                    self.model.predict(np.zeros((1, 3), dtype=np.float32), deterministic=True)
+                except Exception as e:
+                    log.error("Error en la inferencia de calentamiento: %s", e)
+                    self.error = str(e)
+                    self.model = None
+            self.segundos_carga = round(time.monotonic() - inicio, 3)
+            self._cargado.set()
+            return self.model is not None
+    
+    def cargar_en_segundo_plano(self):
+        """Inicia la carga en un hilo aparte (una sola vez) para no demorar el arranque"""
+        with self._lock:
+            if self._hilo is None and not self._cargado.is_set():
+                self._hilo = threading.Thread(target=self.cargar, name="carga-modelo", daemon=True)
+                self._hilo.start()
+    
+    def estado(self):
+        """Estado de la carga del modelo para el endpoint de estado"""
+        if self.estado_procesos is not None:
+            return dict(self.estado_procesos)
+        return {
+            'listo': self.esta_listo(),
+            'cargando': self._hilo is not None and not self._cargado.is_set(),
+            'motor': self.motor,
+            'segundos_carga': self.segundos_carga,
+            'error': self.error
+        }
     
     def load_model(self):
-        """Load the PPO model"""
+        """
+        Load the policy with the requested engine:
+        - 'numpy': NumPy export (``.npz``, see IAs/exportar_politica.py), no torch.
+        - 'tabla': distilled action table (``_tabla.npz``, see IAs/destilar_politica.py).
+        - 'sb3': the original PPO model (imports torch).
+        - 'auto': 'numpy' if the export exists, otherwise 'sb3'.
+        """
+        base = os.path.splitext(self.model_path)[0]
+        ruta_npz = base + '.npz'
+        ruta_tabla = base + '_tabla.npz'
+        motor = self.motor_pedido
+        if motor == 'auto':
+            motor = 'numpy' if os.path.exists(ruta_npz) else 'sb3'
         try:
-            self.model = PPO.load(self.model_path)
-            print(f"Modelo cargado exitosamente desde: {self.model_path}")
+            if motor == 'numpy':
+                self.model = MotorNumpy.cargar(ruta_npz)
+                log.info("Modelo cargado exitosamente desde: %s (NumPy)", ruta_npz)
+            elif motor == 'tabla':
+                self.model = MotorTabla.cargar(ruta_tabla)
+                log.info("Modelo cargado exitosamente desde: %s (tabla de acciones)", ruta_tabla)
+            else:
+                from stable_baselines3 import PPO  # Importa torch: solo si no hay exportación
+                self.model = PPO.load(self.model_path)
+                log.info("Modelo cargado exitosamente desde: %s", self.model_path)
+            self.motor = motor
         except Exception as e:
-            print(f"Error al cargar el modelo: {e}")
+            log.error("Error al cargar el modelo: %s", e)
+            self.error = str(e)
             self.model = None
+            self.motor = None
     
     def predict(self, sensor_data):
         """Make a prediction based on sensor data"""
-        if self.model is None:
+        if not self.cargar():
             return {"error": "Modelo no cargado"}
         
         # Convert input to proper format
-        if not isinstance(sensor_data, np.ndarray):
-            sensor_data = np.array([sensor_data], dtype=np.float32)
-        
-        # Create environment with this single data point
-        self.env = EquipoEnt(sensor_data)
-        obs, _ = self.env.reset()
+        observacion = np.asarray(sensor_data, dtype=np.float32).reshape(-1, 3)[0]
         
         # Get model prediction
-        action, _ = self.model.predict(obs, deterministic=True)
+        action = self.predict_batch(observacion)[0]
+        
+        return self.explicar(observacion, action)
+    
+    def predict_batch(self, observaciones):
+        """
+        Predice la acción para un lote de observaciones de forma (N, 3) con una
+        sola llamada al modelo. Devuelve un arreglo de acciones de longitud N.
+        Sirve tanto para los micro-lotes del servidor como para uso offline
+        (si el modelo todavía no se cargó, se carga en ese momento).
+        """
+        if not self.cargar():
+            raise RuntimeError("Modelo no cargado")
         
+        observaciones = np.asarray(observaciones, dtype=np.float32).reshape(-1, 3)
+        if len(observaciones) == 0:
+            return np.empty(0, dtype=np.int64)
+        
+        acciones, _ = self.model.predict(observaciones, deterministic=True)
+        return np.asarray(acciones, dtype=np.int64).reshape(-1)
+    
+    @staticmethod
+    def es_critico(observaciones):
+        """Condición crítica (temperatura > 80 o vibración > 8) para un lote de observaciones"""
+        observaciones = np.asarray(observaciones).reshape(-1, 3)
+        return (observaciones[:, 0] > 80) | (observaciones[:, 1] > 8)
+    
+    @staticmethod
+    def explicar(observacion, action):
+        """Arma el dict de predicción que se envía al dashboard para una observación"""
         # Get action explanation
         action_explanation = "Mantenimiento preventivo" if action == 1 else "Continuar operación normal"
         
         # Check for critical conditions
-        is_critical = False
-        if sensor_data[0][0] > 80 or sensor_data[0][1] > 8:  # temperatura > 80 o vibración > 8
-            is_critical = True
+        is_critical = bool(ModeloPrediccion.es_critico(observacion)[0])  # temperatura > 80 o vibración > 8
         
         return {
-            "raw_data": sensor_data[0].tolist(),
+            "raw_data": np.asarray(observacion, dtype=np.float32).tolist(),
             "action": int(action),
             "action_explanation": action_explanation,
             "is_critical": is_critical
         }
 
 # Singleton instance
-modelo_prediccion = ModeloPrediccion()
+modelo_prediccion = ModeloPrediccion(motor=Config.MOTOR_INFERENCIA)
@@ -1,11 +1,16 @@
 import numpy as np
 from datetime import datetime
 from markov.cadenas_de_markov import CadenaMarkov
+from bitacora import obtener_logger
+
+log = obtener_logger('equipos')
 
 class Equipo:
-    def __init__(self, nombre_equipo, funcion, tiempos_uso, fecha=None):
+    def __init__(self, nombre_equipo, funcion, tiempos_uso, fecha=None, maquina_id=None):
         """
-        Inicializa un equipo con su nombre, función, tiempos de uso y fecha
+        Inicializa un equipo con su nombre, función, tiempos de uso y fecha.
+        ``maquina_id`` es la máquina de Maquinas_Cerveceria cuyas lecturas
+        estiman su cadena (si no se da, se busca por nombre)
         """
         self.nombre_equipo = nombre_equipo
         self.funcion = funcion
@@ -20,21 +25,52 @@ class Equipo:
         self.cadena_markov = None
         self.matriz = None
         self.vector = None
+        self.maquina_id = maquina_id
+        self.matriz_manual = False  # True si la matriz se cargó a mano (no se reemplaza por la estimada)
     
     def asignar_matriz(self, matriz, vector_inicial):
         """
         Asigna una matriz de transición y un vector inicial al equipo
         """
         try:
-            self.matriz = np.array(matriz)
-            self.vector = np.array(vector_inicial)
-            self.cadena_markov = CadenaMarkov(matriz, vector_inicial)
+            # La matriz puede ser densa (lista o arreglo) o una MatrizDispersa
+            self.asignar_cadena(CadenaMarkov(matriz, vector_inicial))
+            self.matriz_manual = True
             return True
         except ValueError as e:
             # Si hay algún error en la validación, mostramos el error pero no asignamos
-            print(f"Error al crear cadena de Markov: {str(e)}")
+            log.warning("Error al crear cadena de Markov: %s", e)
             return False
     
+    def asignar_cadena(self, cadena):
+        """
+        Asigna una cadena de Markov ya construida (y factorizada) al equipo
+        """
+        self.matriz = cadena.matriz_transicion
+        self.vector = cadena.vector_inicial
+        self.cadena_markov = cadena
+    
+    def actualizar_cadena(self, estimador):
+        """
+        Usa la cadena estimada de las lecturas de la máquina, salvo que se
+        haya cargado una matriz a mano. Devuelve True si el equipo tiene cadena
+        """
+        if not self.matriz_manual:
+            maquina_id = self.maquina_id if self.maquina_id is not None else estimador.id_maquina(self.nombre_equipo)
+            cadena = None if maquina_id is None else estimador.cadena(maquina_id)
+            if cadena is not None:
+                self.asignar_cadena(cadena)
+        return self.cadena_markov is not None
+
+    def calcular_trayectoria(self, n_pasos):
+        """
+        Calcula los estados después de 1..n pasos (una fila por paso)
+        """
+        if self.cadena_markov is None:
+            raise ValueError("No se ha asignado una cadena de Markov al equipo")
+        
+        return self.cadena_markov.trayectoria(n_pasos)
+    
     def calcular_estados(self, n_pasos):
         """
         Calcula el estado después de n pasos
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+class MotorNumpy:
+    """
+    Red de política del PPO evaluada solo con NumPy.
+
+    Usa los pesos exportados por ``IAs/exportar_politica.py`` (un ``.npz`` con
+    las capas de ``mlp_extractor.policy_net`` y ``action_net``) y devuelve la
+    acción determinística (argmax de los logits), igual que
+    ``PPO.predict(obs, deterministic=True)``, sin necesitar torch.
+    """
+
+    ACTIVACIONES = {
+        'tanh': np.tanh,
+        'relu': lambda x: np.maximum(x, 0),
+    }
+
+    def __init__(self, pesos, sesgos, activacion='tanh'):
+        if activacion not in self.ACTIVACIONES:
+            raise ValueError(f"Activación no soportada: {activacion}")
+        # Se guardan transpuestos para calcular obs @ W de una vez para todo el lote
+        self.pesos = [np.ascontiguousarray(w, dtype=np.float32).T for w in pesos]
+        self.sesgos = [np.asarray(b, dtype=np.float32) for b in sesgos]
+        self.activacion = activacion
+        self._activar = self.ACTIVACIONES[activacion]
+
+    @classmethod
+    def cargar(cls, ruta):
+        """Carga el motor desde el ``.npz`` exportado"""
+        with np.load(ruta) as archivo:
+            n = int(archivo['n_capas'])
+            pesos = [archivo[f'peso_{i}'] for i in range(n)]
+            sesgos = [archivo[f'sesgo_{i}'] for i in range(n)]
+            activacion = str(archivo['activacion'])
+        return cls(pesos, sesgos, activacion)
+
+    def logits(self, observaciones):
+        """Logits de la política para observaciones de forma (N, 3)"""
+        x = np.asarray(observaciones, dtype=np.float32).reshape(-1, self.pesos[0].shape[0])
+        for w, b in zip(self.pesos[:-1], self.sesgos[:-1]):
+            x = self._activar(x @ w + b)
+        return x @ self.pesos[-1] + self.sesgos[-1]
+
+    def predict(self, observaciones, deterministic=True):
+        """Misma firma que ``PPO.predict``: devuelve ``(acciones, None)``"""
+        return self.logits(observaciones).argmax(axis=1), None
@@ -0,0 +1,37 @@
+import numpy as np
+
+
+class MotorTabla:
+    """
+    Política destilada en una tabla de acciones sobre una grilla del espacio
+    de observación (ver ``IAs/destilar_politica.py``).
+
+    ``predict`` redondea cada observación al punto más cercano de la grilla y
+    devuelve la acción guardada, así que cuesta una indexación por lote. Las
+    observaciones fuera de los límites se recortan al borde de la grilla.
+    """
+
+    def __init__(self, acciones, minimos, maximos):
+        self.acciones = np.ascontiguousarray(acciones, dtype=np.uint8)
+        self.minimos = np.asarray(minimos, dtype=np.float32)
+        self.maximos = np.asarray(maximos, dtype=np.float32)
+        self.ultimo = np.array(self.acciones.shape, dtype=np.int64) - 1
+        self.escala = (self.ultimo / (self.maximos - self.minimos)).astype(np.float32)
+        self._planas = self.acciones.reshape(-1)
+        self._pasos = np.array(self.acciones.strides, dtype=np.int64) // self.acciones.itemsize
+
+    @classmethod
+    def cargar(cls, ruta):
+        """Carga la tabla desde el ``.npz`` generado por la destilación"""
+        with np.load(ruta) as archivo:
+            return cls(archivo['acciones'], archivo['minimos'], archivo['maximos'])
+
+    def indices(self, observaciones):
+        """Índice del punto de la grilla más cercano, forma (N, 3)"""
+        x = np.asarray(observaciones, dtype=np.float32).reshape(-1, len(self.minimos))
+        i = np.rint((x - self.minimos) * self.escala).astype(np.int64)
+        return np.clip(i, 0, self.ultimo, out=i)
+
+    def predict(self, observaciones, deterministic=True):
+        """Misma firma que ``PPO.predict``: devuelve ``(acciones, None)``"""
+        return self._planas[self.indices(observaciones) @ self._pasos].astype(np.int64), None
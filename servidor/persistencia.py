@@ -0,0 +1,233 @@
+"""
+Persistencia diferida (write-behind) de lecturas y decisiones del modelo.
+
+Los handlers solo agregan filas a un buffer en memoria; un hilo aparte las
+escribe en la base de datos en inserciones masivas (SQLAlchemy Core,
+``executemany``) cuando se juntan ``tam_lote`` filas o pasan ``intervalo``
+segundos. Así la latencia de ingesta no depende de la base de datos.
+
+- Cada lectura va a ``Simulacion_estado`` con la acción del modelo (Acc_IA).
+- Cada cambio de la acción recomendada para una máquina va a ``Predice_Estado``.
+
+Si la base de datos va lenta o no responde, las filas se acumulan hasta
+``max_pendientes``; al superar el 80% se avisa con ``al_saturar(True)`` para
+que los sensores frenen (evento 'control_flujo') y al bajar del 50% con
+``al_saturar(False)``. Con el buffer lleno las filas nuevas se descartan y se
+cuentan. Al cerrar el servidor se escribe lo pendiente.
+"""
+import atexit
+import functools
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from bitacora import campos, obtener_logger
+from config import Config
+
+# Modelos de la base de datos (carpeta bd/)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bd'))
+from Modelos import AgregadoHora, AgregadoMinuto, MaquinasCerveceria, PrediceEstado, SimulacionEstado
+
+log = obtener_logger('persistencia')
+
+ACCIONES = {0: 'Continuar operación normal', 1: 'Mantenimiento preventivo'}
+
+
+def url_base_datos():
+    """URL de la base de datos: Config.PERSISTENCIA_URL o la de bd/database.py"""
+    if Config.PERSISTENCIA_URL:
+        return Config.PERSISTENCIA_URL
+    from database import get_database_uri
+    return get_database_uri()
+
+
+@functools.lru_cache(maxsize=1)
+def motor_consultas():
+    """Motor compartido por las consultas de la API (por ejemplo la exportación)"""
+    return create_engine(url_base_datos(), pool_pre_ping=True)
+
+
+class EscritorDiferido:
+    """Buffer de filas en memoria escrito en lotes por un hilo aparte (ver el módulo)"""
+
+    ALTO, BAJO = 0.8, 0.5          # Fracción de max_pendientes para pedir y levantar la pausa
+    REINTENTO_MAX = 30.0           # Segundos máximos de espera entre reintentos si la base falla
+    REFRESCO_MAQUINAS = 30.0       # Segundos mínimos entre consultas de máquinas conocidas
+
+    def __init__(self, url=None, tam_lote=1000, intervalo=1.0, max_pendientes=100000):
+        self.url = url
+        self.tam_lote = tam_lote
+        self.intervalo = intervalo
+        self.max_pendientes = max_pendientes
+        self.al_saturar = None      # callback(saturado: bool, pendientes: int)
+        self.escritas = 0
+        self.descartadas = 0
+        self.saturado = False
+        self._simulaciones = []
+        self._predicciones = []
+        self._ultima_accion = {}    # maquina_id -> última acción registrada
+        self._maquinas = None       # ids de Maquinas_Cerveceria (None = sin consultar)
+        self._consulta_maquinas = 0.0
+        self._condicion = threading.Condition()
+        self._motor = None
+        self._hilo = None
+        self._detenido = False
+        self._fallando = False      # La última escritura falló: se reintenta recién tras la espera
+
+    def iniciar(self):
+        """Crea el motor de la base de datos e inicia el hilo de escritura (una sola vez)"""
+        if self._hilo is not None:
+            return
+        self._motor = create_engine(self.url or url_base_datos(), pool_pre_ping=True)
+        self._hilo = threading.Thread(target=self._bucle, name='persistencia', daemon=True)
+        self._hilo.start()
+        atexit.register(self.detener)
+
+    def pendientes(self):
+        return len(self._simulaciones) + len(self._predicciones)
+
+    def registrar(self, maquina_id, timestamps, observaciones, acciones):
+        """
+        Encola las lecturas de una máquina con la acción del modelo para cada una.
+        ``observaciones`` tiene forma (N, 3): temperatura, vibración, presión.
+        """
+        filas = []
+        for ts, (temperatura, vibracion, presion), accion in zip(timestamps, observaciones, acciones):
+            filas.append({
+                'linea_id': maquina_id,
+                'Fecha': datetime.fromisoformat(ts) if isinstance(ts, str) else ts or datetime.now(),
+                'Acc_IA': ACCIONES.get(int(accion)),
+                'Temperatura': float(temperatura),
+                'vibracion': float(vibracion),
+                'Presion': float(presion),
+            })
+        if not filas:
+            return
+
+        with self._condicion:
+            # Cambio de la acción recomendada para la máquina
+            anterior = self._ultima_accion.get(maquina_id)
+            actual = int(acciones[-1])
+            cambio = None
+            if anterior != actual:
+                self._ultima_accion[maquina_id] = actual
+                cambio = {
+                    'id_linea': maquina_id,
+                    'Estado_espe': ACCIONES.get(anterior),
+                    'Estado_calcu': ACCIONES[actual],
+                    'EstadoCual': float(sum(int(a) for a in acciones)) / len(acciones),
+                }
+
+            libres = self.max_pendientes - self.pendientes() - (cambio is not None)
+            if libres < len(filas):
+                self.descartadas += len(filas) - max(0, libres)
+                filas = filas[:max(0, libres)]
+            self._simulaciones.extend(filas)
+            if cambio is not None:
+                self._predicciones.append(cambio)
+            if len(self._simulaciones) >= self.tam_lote and not self._fallando:
+                self._condicion.notify()
+            saturar = self._revisar_saturacion()
+        self._avisar(saturar)
+
+    def _revisar_saturacion(self):
+        """Devuelve el nuevo estado de saturación si cambió, o None"""
+        pendientes = self.pendientes()
+        if not self.saturado and pendientes >= self.ALTO * self.max_pendientes:
+            self.saturado = True
+            return True
+        if self.saturado and pendientes <= self.BAJO * self.max_pendientes:
+            self.saturado = False
+            return False
+        return None
+
+    def _avisar(self, saturado):
+        if saturado is None:
+            return
+        if saturado:
+            log.warning("Base de datos atrasada: se pide a los sensores que frenen",
+                        extra=campos(pendientes=self.pendientes()))
+        else:
+            log.info("Base de datos al día", extra=campos(pendientes=self.pendientes()))
+        if self.al_saturar is not None:
+            self.al_saturar(saturado, self.pendientes())
+
+    def _bucle(self):
+        espera = self.intervalo
+        while True:
+            with self._condicion:
+                # Tras un error se espera siempre, aunque haya un lote completo pendiente
+                if not self._detenido and (self._fallando or len(self._simulaciones) < self.tam_lote):
+                    self._condicion.wait(espera)
+                if self._detenido:
+                    return
+            self._fallando = not self.escribir()
+            # Si la base no responde, esperar cada vez más antes de reintentar
+            espera = min(espera * 2, self.REINTENTO_MAX) if self._fallando else self.intervalo
+
+    def escribir(self):
+        """Escribe lo pendiente en lotes de ``tam_lote`` filas. Devuelve False si falló"""
+        while True:
+            with self._condicion:
+                simulaciones = self._simulaciones[:self.tam_lote]
+                predicciones = self._predicciones[:self.tam_lote]
+            if not simulaciones and not predicciones:
+                return True
+            try:
+                self._sin_maquinas_desconocidas(simulaciones, predicciones)
+                inicio = time.perf_counter()
+                with self._motor.begin() as conexion:
+                    if simulaciones:
+                        conexion.execute(SimulacionEstado.__table__.insert(), simulaciones)
+                    if predicciones:
+                        conexion.execute(PrediceEstado.__table__.insert(), predicciones)
+            except SQLAlchemyError as e:
+                log.error("No se pudo escribir en la base de datos: %s", e.__class__.__name__,
+                          extra=campos(pendientes=self.pendientes()))
+                return False
+
+            with self._condicion:
+                del self._simulaciones[:len(simulaciones)]
+                del self._predicciones[:len(predicciones)]
+                saturar = self._revisar_saturacion()
+            self.escritas += len(simulaciones) + len(predicciones)
+            log.debug("Lote escrito", extra=campos(filas=len(simulaciones) + len(predicciones),
+                                                  ms=round((time.perf_counter() - inicio) * 1000, 1)))
+            self._avisar(saturar)
+
+    def _sin_maquinas_desconocidas(self, simulaciones, predicciones):
+        """Las lecturas de máquinas que no están en Maquinas_Cerveceria se guardan sin línea (clave foránea)"""
+        ids = {f['linea_id'] for f in simulaciones} | {f['id_linea'] for f in predicciones}
+        ids.discard(None)
+        ahora = time.monotonic()
+        if self._maquinas is None or (not ids <= self._maquinas and
+                                      ahora - self._consulta_maquinas > self.REFRESCO_MAQUINAS):
+            with self._motor.connect() as conexion:
+                self._maquinas = set(conexion.execute(select(MaquinasCerveceria.__table__.c.id)).scalars())
+            self._consulta_maquinas = ahora
+        for fila in simulaciones:
+            if fila['linea_id'] not in self._maquinas:
+                fila['linea_id'] = None
+        for fila in predicciones:
+            if fila['id_linea'] not in self._maquinas:
+                fila['id_linea'] = None
+
+    def detener(self):
+        """Detiene el hilo y escribe lo que quede pendiente"""
+        if self._hilo is None:
+            return
+        with self._condicion:
+            self._detenido = True
+            self._condicion.notify()
+        self._hilo.join(timeout=self.intervalo + 5)
+        self._hilo = None
+        if self.pendientes():
+            log.info("Escribiendo datos pendientes antes de cerrar", extra=campos(filas=self.pendientes()))
+            if not self.escribir():
+                log.error("Se perdieron datos sin escribir", extra=campos(filas=self.pendientes()))
+        self._motor.dispose()
@@ -1,16 +1,159 @@
-from flask import Blueprint, jsonify
+import zlib
+from datetime import datetime
+
+from flask import Blueprint, Response, jsonify, request
+from bitacora import obtener_logger
+from config import Config
+from estado import agregados, alertas, historial, registro
+from modelo_predictivo import modelo_prediccion
+
+log = obtener_logger('api')
 
 # Crear blueprint
 api_blueprint = Blueprint('api', __name__)
 
-# Variable global de datos recientes (será compartida con el archivo principal)
-datos_recientes = []
+# Cantidad de puntos que devuelve /api/datos
+PUNTOS_API = 50
+
+def parametro(*nombres, type=None):
+    """Primer parámetro de la consulta presente entre ``nombres`` (en español o en inglés)"""
+    for nombre in nombres:
+        if request.args.get(nombre):
+            return request.args.get(nombre, type=type)
+    return None
 
 @api_blueprint.route('/datos')
 def obtener_datos():
-    """Endpoint REST para obtener los datos más recientes"""
-    return jsonify(datos_recientes[-50:] if len(datos_recientes) > 50 else datos_recientes)
+    """
+    Endpoint REST para obtener los datos más recientes.
+    Con ?sensor=<id> o ?maquina=<id> devuelve el historial de ese sensor o de
+    todos los sensores de la máquina, ordenado por timestamp y con ``sensor_id``
+    y ``maquina_id`` en cada punto.
+
+    Con ?desde=<ISO>&hasta=<ISO> (o from/to) devuelve esa ventana, reducida a
+    ?max_puntos=<n> (o max_points) puntos por sensor con LTTB; ?campos=temperatura,presion
+    (o fields) limita los campos. Responde 304 si el ETag de If-None-Match no cambió.
+    """
+    fuentes = [(historial, None)]
+    maquina = parametro('maquina', 'machine', type=int)
+    if request.args.get('sensor'):
+        sensor = registro.obtener(request.args['sensor'])
+        if sensor is None:
+            return jsonify({'error': f"Sensor {request.args['sensor']} no registrado"}), 404
+        fuentes = [(sensor.historial, sensor)]
+    elif maquina is not None:
+        sensores = registro.por_maquina(maquina)
+        if not sensores:
+            return jsonify({'error': f"No hay sensores para la máquina {maquina}"}), 404
+        fuentes = [(s.historial, s) for s in sorted(sensores, key=lambda s: s.sensor_id)]
+
+    max_puntos = parametro('max_puntos', 'max_points', type=int)
+    if max_puntos is not None and max_puntos < 1:
+        return jsonify({'error': "max_puntos debe ser al menos 1"}), 400
+
+    # La respuesta solo cambia cuando llegan datos nuevos a alguna de las fuentes
+    version = ','.join(f"{id(fuente):x}-{fuente.total}" for fuente, _ in fuentes)
+    etag = f"{zlib.crc32(version.encode()):x}-{zlib.crc32(request.query_string):x}"
+    if request.if_none_match.contains(etag):
+        respuesta = Response(status=304)
+    else:
+        campos = parametro('campos', 'fields')
+        campos = campos.split(',') if campos else None
+        desde, hasta = parametro('desde', 'from'), parametro('hasta', 'to')
+        ultimos = desde is None and hasta is None and max_puntos is None
+        datos = []
+        for fuente, sensor in fuentes:
+            if ultimos:
+                timestamps, valores = fuente.ventana(PUNTOS_API)
+            else:
+                try:
+                    timestamps, valores = fuente.rango(desde, hasta)
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+                timestamps, valores = fuente.reducir(timestamps, valores, max_puntos or Config.API_MAX_PUNTOS)
+            extra = None if sensor is None else {'sensor_id': sensor.sensor_id, 'maquina_id': sensor.maquina_id}
+            datos.extend(fuente.a_registros(timestamps, valores, campos, extra))
+        if len(fuentes) > 1:
+            # Los timestamps ISO tienen todos el mismo formato: se ordenan como texto
+            datos.sort(key=lambda d: d['timestamp'])
+            if ultimos:
+                datos = datos[-PUNTOS_API:]
+        respuesta = jsonify(datos)
+    respuesta.set_etag(etag)
+    respuesta.cache_control.no_cache = True
+    return respuesta
+
+@api_blueprint.route('/rollups')
+def obtener_rollups():
+    """
+    Agregados por minuto o por hora (min, max, media, n y último valor de cada campo):
+    ?resolucion=1m|1h&maquina=<id>&sensor=<id>&desde=<ISO>&hasta=<ISO>&campos=temperatura,presion
+    """
+    campos = request.args.get('campos')
+    campos = campos.split(',') if campos else historial.CAMPOS
+    try:
+        desde, hasta = [historial.a_ns(request.args[p]) / 1e9 if request.args.get(p) else None
+                        for p in ('desde', 'hasta')]
+        filas = agregados.consultar(request.args.get('resolucion', '1m'), request.args.get('maquina', type=int),
+                                    request.args.get('sensor'), desde, hasta, campos)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(filas)
+
+@api_blueprint.route('/exportar')
+def exportar():
+    """
+    Exportación de la base de datos en streaming (ver bd/exportar_datos.py):
+    ?tipo=lecturas|simulaciones&formato=csv|ndjson&desde=<ISO>&hasta=<ISO>&maquinas=1,2
+    """
+    from sqlalchemy.exc import SQLAlchemyError
+    from persistencia import motor_consultas
+    from exportar_datos import FORMATOS, TIPOS, exportar as generar_exportacion
+
+    tipo = request.args.get('tipo', 'lecturas')
+    formato = request.args.get('formato', 'csv')
+    if tipo not in TIPOS or formato not in FORMATOS:
+        return jsonify({'error': f"Tipos: {', '.join(TIPOS)}; formatos: {', '.join(FORMATOS)}"}), 400
+    try:
+        desde, hasta = [datetime.fromisoformat(request.args[p]) if request.args.get(p) else None
+                        for p in ('desde', 'hasta')]
+        maquinas = [int(m) for m in request.args['maquinas'].split(',')] if request.args.get('maquinas') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        conexion = motor_consultas().connect()
+    except (ImportError, SQLAlchemyError) as e:
+        log.error("Exportación sin base de datos: %s", e.__class__.__name__)
+        return jsonify({'error': 'Base de datos no disponible'}), 503
+
+    def generar():
+        try:
+            yield from generar_exportacion(conexion, tipo, formato, desde, hasta, maquinas)
+        except SQLAlchemyError as e:
+            # La respuesta ya empezó: solo queda cortarla y registrarlo
+            log.error("Exportación de %s interrumpida: %s", tipo, e.__class__.__name__)
+        finally:
+            conexion.close()
 
+    return Response(generar(), mimetype=FORMATOS[formato],
+                    headers={'Content-Disposition': f'attachment; filename={tipo}.{formato}'})
 
+@api_blueprint.route('/alertas')
+def obtener_alertas():
+    """Alertas activas, de todas las máquinas o de ?maquina=<id>"""
+    return jsonify(alertas.activas(request.args.get('maquina', type=int)))
 
+@api_blueprint.route('/sensores')
+def obtener_sensores():
+    """Endpoint REST con el estado de todos los sensores registrados"""
+    return jsonify([s.to_dict() for s in registro.sensores()])
 
+@api_blueprint.route('/estado')
+def obtener_estado():
+    """Estado del servidor: carga del modelo predictivo, sensores e historial"""
+    return jsonify({
+        'modelo': modelo_prediccion.estado(),
+        'sensores': registro.resumen(),
+        'puntos_historial': len(historial)
+    })
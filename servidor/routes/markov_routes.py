@@ -1,12 +1,24 @@
 from flask import Blueprint, jsonify, request, render_template
 from models.equipos import Equipo
-from markov.cadenas_de_markov import CadenaMarkov
+from markov.cadenas_de_markov import CadenaMarkov, en_tres_estados, vector_en_estado
+from markov.dispersa import MatrizDispersa
+from markov.flota import pronosticar_cadenas
+from estado import estimador
+import json
 import numpy as np
 # Crear blueprint
-markov_blueprint = Blueprint('api', __name__)
+markov_blueprint = Blueprint('markov', __name__)
 
 # Almacén en memoria de todos los equipos creados
 equipos_store = [] # Implementar con base de datos en el futuro
+# Índice por nombre de equipos_store (si hay nombres repetidos, el primero)
+equipos_por_nombre = {}
+
+# Horizontes (pasos) por defecto del pronóstico de la flota
+HORIZONTES_FLOTA = (1, 7, 30)
+
+def buscar_equipo(nombre):
+    return equipos_por_nombre.get(nombre)
 
 @markov_blueprint.route('/cadena-markov', methods=['GET', 'POST'])
 def cadena_markov():
@@ -16,13 +28,15 @@ def cadena_markov():
         tiempos_list = request.form.getlist('tiempos_uso')
         fechas = request.form.getlist('fecha')
         estados = request.form.getlist('estado_equipo')
+        maquinas = request.form.getlist('maquina_id')  # Opcional: máquina cuyas lecturas estiman la cadena
         nuevos = []
         
-        for nombre, func, t_str, fecha, est in zip(nombres, funciones, tiempos_list, fechas, estados):
+        for i, (nombre, func, t_str, fecha, est) in enumerate(zip(nombres, funciones, tiempos_list, fechas, estados)):
             if nombre and func and t_str:  # Solo procesar entradas completas
                 try:
                     lista_tiempos = [float(x) for x in t_str.split(',') if x.strip()]
-                    eq = Equipo(nombre, func, lista_tiempos, fecha)
+                    maquina_id = int(maquinas[i]) if i < len(maquinas) and maquinas[i] else None
+                    eq = Equipo(nombre, func, lista_tiempos, fecha, maquina_id)
                     eq.estado = est
                     nuevos.append(eq)
                 except ValueError:
@@ -30,6 +44,8 @@ def cadena_markov():
         
         global equipos_store
         equipos_store.extend(nuevos)
+        for eq in nuevos:
+            equipos_por_nombre.setdefault(eq.nombre_equipo, eq)
         
         return render_template('CadenaMarkov.html', equipos=equipos_store, guardados=len(equipos_store))
     
@@ -42,13 +58,17 @@ def aplicar_markov():
         pasos = int(request.form.get('predictionSteps', 5))
         
         # Buscar la máquina seleccionada
-        maquina = next((eq for eq in equipos_store if eq.nombre_equipo == nombre_maquina), None)
+        maquina = buscar_equipo(nombre_maquina)
         
         if maquina:
             try:
+                # Cadena estimada de las lecturas de la máquina (si no se cargó una a mano)
+                maquina.actualizar_cadena(estimador)
+
                 # Obtener matriz y vector desde el formulario si se proporcionaron
                 matriz_transicion = None
                 vector_inicial = None
+                cadena = None
                 
                 if 'matriz_transicion' in request.form and 'vector_inicial' in request.form:
                     import json
@@ -70,19 +90,28 @@ def aplicar_markov():
                         vector_inicial = np.array([0.0, 1.0, 0.0])  # Comienza en estado medio
                     else:  # malo
                         vector_inicial = np.array([0.0, 0.0, 1.0])  # Comienza en estado malo
+                elif maquina.cadena_markov is not None:
+                    # Reutilizar la cadena ya factorizada del equipo
+                    cadena = maquina.cadena_markov
+                    if maquina.matriz_manual:
+                        vector_inicial = vector_en_estado(cadena.n_estados)  # Por defecto, el mejor estado
+                    else:
+                        vector_inicial = cadena.vector_inicial  # Estado actual según las lecturas
                 else:
                     matriz_transicion = maquina.matriz
                     vector_inicial = np.array([1.0, 0.0, 0.0])  # Por defecto
                 
-                # Crear la cadena de Markov y calcular probabilidades
+                # Crear la cadena de Markov (solo si cambió la matriz) y calcular probabilidades
                 try:
-                    cadena = CadenaMarkov(matriz_transicion, vector_inicial)
-                    probabilidades = cadena.propagar(pasos)
-                    
-                    # Si la matriz es válida, asignarla al objeto Equipo para futuros cálculos
-                    if matriz_transicion is not None and vector_inicial is not None:
-                        maquina.matriz = matriz_transicion
-                        maquina.asignar_matriz(matriz_transicion, vector_inicial)
+                    if cadena is None:
+                        cadena = CadenaMarkov(matriz_transicion, vector_inicial)
+                        # La matriz es válida: asignar la cadena al objeto Equipo para futuros cálculos
+                        maquina.asignar_cadena(cadena)
+                        if 'matriz_transicion' in request.form:
+                            # Matriz enviada a mano: no reemplazarla por la estimada
+                            maquina.matriz_manual = True
+                    # Las cadenas de N estados se resumen en bueno/medio/malo
+                    probabilidades = en_tres_estados(cadena.propagar(pasos, vector_inicial))
                     
                     # Determinar recomendación según probabilidades
                     prob_malo = probabilidades[2]
@@ -109,40 +138,77 @@ def aplicar_markov():
         
     return jsonify({'error': 'Máquina no encontrada o parámetros incorrectos'})
 
+def _json(valor):
+    """Los campos de formulario llegan como texto JSON; los de un cuerpo JSON, ya decodificados"""
+    return json.loads(valor) if isinstance(valor, str) else valor
+
+def leer_cadena(datos):
+    """
+    Matriz y vector de una cadena de N estados (ordenados de mejor a peor):
+    ``matriz`` densa N×N, o ``transiciones`` [[i, j, p], ...] con ``n_estados``
+    para cadenas grandes y dispersas. Sin ``vector`` se parte del estado 0.
+    """
+    if 'transiciones' in datos:
+        tripletas = np.asarray(_json(datos['transiciones']), dtype=float).reshape(-1, 3)
+        if len(tripletas) == 0:
+            raise ValueError("'transiciones' no tiene ninguna tripleta")
+        filas, columnas = tripletas[:, 0].astype(np.int64), tripletas[:, 1].astype(np.int64)
+        n = int(datos.get('n_estados') or max(filas.max(), columnas.max()) + 1)
+        if n < 1:
+            raise ValueError("La cadena necesita al menos un estado")
+        matriz = MatrizDispersa.desde_coordenadas(filas, columnas, tripletas[:, 2], n)
+    else:
+        matriz = np.asarray(_json(datos['matriz']), dtype=float)
+        if matriz.ndim != 2 or matriz.shape[0] < 1:
+            raise ValueError("La cadena necesita al menos un estado")
+    vector = _json(datos['vector']) if datos.get('vector') else vector_en_estado(matriz.shape[0])
+    return matriz, vector
+
 @markov_blueprint.route('/carga-matriz', methods=['GET', 'POST'])
 def carga_matriz():
     if request.method == 'POST':
-        nombre_eq = request.form['maquinaria']
-
-        # Parseo de matriz
-        p_bb = float(request.form.get('p_bb', 0))
-        p_bm = float(request.form.get('p_bm', 0))
-        p_ba = float(request.form.get('p_ba', 0))
-        p_mb = float(request.form.get('p_mb', 0))
-        p_mm = float(request.form.get('p_mm', 0))
-        p_ma = float(request.form.get('p_ma', 0))
-        p_ab = float(request.form.get('p_ab', 0))
-        p_am = float(request.form.get('p_am', 0))
-        p_aa = float(request.form.get('p_aa', 0))
-
-        matriz = [
-            [p_bb, p_bm, p_ba],
-            [p_mb, p_mm, p_ma],
-            [p_ab, p_am, p_aa],
-        ]
-
-        # Parseo de vector
-        v_bueno = float(request.form.get('v_bueno', 0))
-        v_medio = float(request.form.get('v_medio', 0))
-        v_malo  = float(request.form.get('v_malo', 0))
-        vector = [v_bueno, v_medio, v_malo]
+        datos = request.get_json(silent=True) or request.form
+        nombre_eq = datos.get('maquinaria')
+        if not nombre_eq:
+            return jsonify({'success': False, 'mensaje': "Falta 'maquinaria'"}), 400
+
+        if 'matriz' in datos or 'transiciones' in datos:
+            # Cadena de N estados
+            try:
+                matriz, vector = leer_cadena(datos)
+            except (ValueError, TypeError, KeyError) as e:
+                return jsonify({'success': False, 'mensaje': f"Matriz o vector inválidos: {e}"})
+        else:
+            # Parseo de matriz
+            p_bb = float(datos.get('p_bb', 0))
+            p_bm = float(datos.get('p_bm', 0))
+            p_ba = float(datos.get('p_ba', 0))
+            p_mb = float(datos.get('p_mb', 0))
+            p_mm = float(datos.get('p_mm', 0))
+            p_ma = float(datos.get('p_ma', 0))
+            p_ab = float(datos.get('p_ab', 0))
+            p_am = float(datos.get('p_am', 0))
+            p_aa = float(datos.get('p_aa', 0))
+
+            matriz = [
+                [p_bb, p_bm, p_ba],
+                [p_mb, p_mm, p_ma],
+                [p_ab, p_am, p_aa],
+            ]
+
+            # Parseo de vector
+            v_bueno = float(datos.get('v_bueno', 0))
+            v_medio = float(datos.get('v_medio', 0))
+            v_malo  = float(datos.get('v_malo', 0))
+            vector = [v_bueno, v_medio, v_malo]
 
         # Asignación al objeto Equipo
-        for eq in equipos_store:
-            if eq.nombre_equipo == nombre_eq:
-                eq.asignar_matriz(matriz, vector)
-                mensaje = f"Matriz y vector asignados a {nombre_eq}"
-                return jsonify({'success': True, 'mensaje': mensaje})
+        eq = buscar_equipo(nombre_eq)
+        if eq is not None:
+            if not eq.asignar_matriz(matriz, vector):
+                return jsonify({'success': False, 'mensaje': f"La matriz o el vector de {nombre_eq} no son válidos"})
+            mensaje = f"Matriz y vector asignados a {nombre_eq}"
+            return jsonify({'success': True, 'mensaje': mensaje})
         
         return jsonify({'success': False, 'mensaje': f"No se encontró el equipo {nombre_eq}"})
     
@@ -160,10 +226,10 @@ def probabilidades():
             mensaje = "Por favor selecciona una maquinaria."
         else:
             # buscar el objeto Equipo
-            eq = next((e for e in equipos_store if e.nombre_equipo == sel), None)
+            eq = buscar_equipo(sel)
             if not eq:
                 mensaje = f"No existe la maquinaria {sel}."
-            elif eq.cadena_markov is None:
+            elif not eq.actualizar_cadena(estimador):
                 mensaje = f"No has cargado la matriz/vector para {sel}."
             else:
                 # calcular por día
@@ -173,7 +239,11 @@ def probabilidades():
                 # calcular a futuro (estado estacionario)
                 else:
                     vec_res = eq.cadena_markov.calculo_futuro()
-                resultados = eq.matriz.flatten().tolist() + vec_res.tolist()
+                if eq.cadena_markov.n_estados == 3 and not eq.cadena_markov.dispersa:
+                    resultados = eq.matriz.flatten().tolist() + vec_res.tolist()
+                else:
+                    # La vista muestra la matriz de 3×3: de N estados solo el resumen
+                    resultados = [None] * 9 + en_tres_estados(vec_res).tolist()
 
     return render_template('CadenaMarkov.html', 
                           equipos=equipos_store,
@@ -187,3 +257,57 @@ def api_equipos():
     """Endpoint API para obtener los equipos en formato JSON"""
     equipos_json = [eq.to_dict() for eq in equipos_store]
     return jsonify(equipos_json)
+
+@markov_blueprint.route('/api/markov/flota', methods=['GET', 'POST'])
+def api_flota():
+    """
+    Pronóstico de todos los equipos con cadena de Markov para varios
+    horizontes en una sola llamada, y la flota ordenada por probabilidad de
+    fallo ('malo' de ``en_tres_estados``) en el horizonte más lejano.
+    Parámetros: ``horizontes`` (p. ej. ``1,7,30``) y ``equipos`` (nombres; por defecto todos).
+    """
+    datos = request.get_json(silent=True) or request.values
+    horizontes = datos.get('horizontes') or HORIZONTES_FLOTA
+    nombres = datos.get('equipos')
+    try:
+        if isinstance(horizontes, str):
+            horizontes = horizontes.split(',')
+        horizontes = [int(h) for h in horizontes]
+        if not horizontes or min(horizontes) < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({'error': 'horizontes debe ser una lista de enteros >= 0'}), 400
+
+    if nombres:
+        if isinstance(nombres, str):
+            nombres = nombres.split(',')
+        equipos = [eq for eq in map(buscar_equipo, nombres) if eq is not None]
+    else:
+        equipos = equipos_store
+    con_cadena = [eq for eq in equipos if eq.actualizar_cadena(estimador)]
+    pronosticos = pronosticar_cadenas([eq.cadena_markov for eq in con_cadena], horizontes)
+
+    # Probabilidad de 'malo' (la misma que en 'probabilidades') en el horizonte más lejano
+    lejano = int(np.argmax(horizontes))
+    resumenes = [en_tres_estados(p) for p in pronosticos]
+    prob_fallo = np.array([r[lejano, 2] for r in resumenes])
+    resultado = []
+    for eq, resumen, fallo in zip(con_cadena, resumenes, prob_fallo):
+        resumen = resumen.round(4)
+        resultado.append({
+            'nombre_equipo': eq.nombre_equipo,
+            'estado': eq.estado,
+            'n_estados': eq.cadena_markov.n_estados,
+            'probabilidades': {str(h): dict(zip(('bueno', 'medio', 'malo'), fila.tolist()))
+                               for h, fila in zip(horizontes, resumen)},
+            'prob_fallo': round(float(fallo), 4),
+        })
+    ranking = [{'nombre_equipo': resultado[i]['nombre_equipo'], 'prob_fallo': resultado[i]['prob_fallo']}
+               for i in np.argsort(-prob_fallo, kind='stable')]
+
+    return jsonify({
+        'horizontes': horizontes,
+        'equipos': resultado,
+        'ranking': ranking,
+        'sin_cadena': [eq.nombre_equipo for eq in equipos if eq.cadena_markov is None],
+    })
@@ -0,0 +1,199 @@
+import threading
+import time
+from collections import Counter
+
+from historial import HistorialSensores
+
+
+class EstadoSensor:
+    """Estado de un sensor conectado: máquina asociada, vida, encendido e historial propio"""
+
+    def __init__(self, sensor_id, maquina_id=None, sid=None, historial=None):
+        self.sensor_id = sensor_id
+        self.maquina_id = maquina_id  # MaquinasCerveceria.id
+        self.sid = sid                # Sesión de Socket.IO del sensor
+        self.activo = False
+        self.maquina_encendida = True
+        self.ultimo_heartbeat = time.time()
+        self.historial = historial
+
+    def latido(self, instante=None):
+        """Registra un heartbeat del sensor"""
+        self.ultimo_heartbeat = instante or time.time()
+
+    def to_dict(self):
+        """
+        Convierte el estado a un diccionario para serialización JSON
+        """
+        return {
+            'sensor_id': self.sensor_id,
+            'maquina_id': self.maquina_id,
+            'activo': self.activo,
+            'encendida': self.maquina_encendida,
+            'ultimo_heartbeat': self.ultimo_heartbeat,
+            'puntos': len(self.historial) if self.historial is not None else 0
+        }
+
+
+class _MapaFragmentado:
+    """Diccionario repartido en fragmentos, cada uno con su propio lock"""
+
+    def __init__(self, n_fragmentos):
+        self._fragmentos = [({}, threading.Lock()) for _ in range(n_fragmentos)]
+
+    def fragmento(self, clave):
+        return self._fragmentos[hash(clave) % len(self._fragmentos)]
+
+    def get(self, clave, defecto=None):
+        datos, _ = self.fragmento(clave)
+        return datos.get(clave, defecto)
+
+    def pop(self, clave, defecto=None):
+        datos, lock = self.fragmento(clave)
+        with lock:
+            return datos.pop(clave, defecto)
+
+    def valores(self):
+        for datos, lock in self._fragmentos:
+            with lock:
+                copia = list(datos.values())
+            yield from copia
+
+
+class RegistroSensores:
+    """
+    Registro de sensores indexado por ID de sensor, sesión de Socket.IO y máquina.
+
+    Las actualizaciones se reparten en fragmentos con locks independientes
+    (lock striping), de modo que los handlers de sensores distintos no se
+    serializan en un único lock global. Los sensores activos y la cantidad
+    por máquina se llevan aparte al activar o desactivar cada sensor, así que
+    ``resumen()`` y ``activos()`` no recorren todo el registro.
+
+    Cada sensor tiene su propio historial de ``puntos_historial`` lecturas
+    como máximo (la memoria crece con la cantidad de sensores).
+    """
+
+    def __init__(self, n_fragmentos=64, puntos_historial=3600, capacidad_inicial=1024):
+        self.puntos_historial = puntos_historial
+        self.capacidad_inicial = capacidad_inicial
+        self._sensores = _MapaFragmentado(n_fragmentos)
+        self._por_sid = _MapaFragmentado(n_fragmentos)
+        self._por_maquina = _MapaFragmentado(n_fragmentos)
+        self._activos = {}                 # sensor_id -> EstadoSensor de los sensores activos
+        self._maquinas_activas = Counter()  # maquina_id -> sensores activos
+        self._lock_activos = threading.Lock()  # Se toma siempre después del lock del fragmento
+
+    def registrar(self, sensor_id, maquina_id=None, sid=None):
+        """Registra (o reactiva) un sensor y lo asocia a su sesión y su máquina"""
+        datos, lock = self._sensores.fragmento(sensor_id)
+        with lock:
+            sensor = datos.get(sensor_id)
+            if sensor is None:
+                historial = HistorialSensores(self.puntos_historial, self.capacidad_inicial)
+                sensor = EstadoSensor(sensor_id, maquina_id, sid, historial)
+                datos[sensor_id] = sensor
+            anterior_sid, anterior_maquina = sensor.sid, sensor.maquina_id
+            if sensor.activo:
+                self._contar_inactivo(sensor)
+            sensor.sid = sid
+            if maquina_id is not None:
+                sensor.maquina_id = maquina_id
+            sensor.activo = True
+            self._contar_activo(sensor)
+            sensor.latido()
+
+        if anterior_sid is not None and anterior_sid != sid:
+            self._por_sid.pop(anterior_sid)
+        if sid is not None:
+            datos, lock = self._por_sid.fragmento(sid)
+            with lock:
+                datos[sid] = sensor_id
+
+        if anterior_maquina is not None and anterior_maquina != sensor.maquina_id:
+            self._quitar_de_maquina(anterior_maquina, sensor_id)
+        if sensor.maquina_id is not None:
+            datos, lock = self._por_maquina.fragmento(sensor.maquina_id)
+            with lock:
+                datos.setdefault(sensor.maquina_id, set()).add(sensor_id)
+        return sensor
+
+    def _quitar_de_maquina(self, maquina_id, sensor_id):
+        datos, lock = self._por_maquina.fragmento(maquina_id)
+        with lock:
+            sensores = datos.get(maquina_id)
+            if sensores:
+                sensores.discard(sensor_id)
+                if not sensores:
+                    del datos[maquina_id]
+
+    def desactivar(self, sensor_id):
+        """Marca un sensor como inactivo. Devuelve True si estaba activo"""
+        datos, lock = self._sensores.fragmento(sensor_id)
+        with lock:
+            sensor = datos.get(sensor_id)
+            if sensor is None or not sensor.activo:
+                return False
+            sensor.activo = False
+            self._contar_inactivo(sensor)
+            return True
+
+    def _contar_activo(self, sensor):
+        with self._lock_activos:
+            self._activos[sensor.sensor_id] = sensor
+            if sensor.maquina_id is not None:
+                self._maquinas_activas[sensor.maquina_id] += 1
+
+    def _contar_inactivo(self, sensor):
+        with self._lock_activos:
+            self._activos.pop(sensor.sensor_id, None)
+            if sensor.maquina_id is not None:
+                self._maquinas_activas[sensor.maquina_id] -= 1
+                if self._maquinas_activas[sensor.maquina_id] <= 0:
+                    del self._maquinas_activas[sensor.maquina_id]
+
+    def desvincular_sesion(self, sid):
+        """Olvida la sesión de Socket.IO de un sensor desconectado (el sensor sigue registrado)"""
+        sensor_id = self._por_sid.pop(sid)
+        sensor = self.obtener(sensor_id) if sensor_id is not None else None
+        if sensor is not None and sensor.sid == sid:
+            sensor.sid = None
+        return sensor
+
+    def obtener(self, sensor_id):
+        return self._sensores.get(sensor_id)
+
+    def por_sid(self, sid):
+        """Sensor asociado a una sesión de Socket.IO, o None si la sesión no es de un sensor"""
+        sensor_id = self._por_sid.get(sid)
+        return self._sensores.get(sensor_id) if sensor_id is not None else None
+
+    def por_maquina(self, maquina_id):
+        """Sensores registrados para una máquina"""
+        datos, lock = self._por_maquina.fragmento(maquina_id)
+        with lock:
+            ids = list(datos.get(maquina_id, ()))
+        return [s for s in (self._sensores.get(i) for i in ids) if s is not None]
+
+    def sensores(self):
+        return list(self._sensores.valores())
+
+    def activos(self):
+        with self._lock_activos:
+            return list(self._activos.values())
+
+    def vencidos(self, timeout, ahora=None):
+        """Sensores activos cuyo último heartbeat tiene más de ``timeout`` segundos"""
+        ahora = ahora or time.time()
+        return [s for s in self.activos() if ahora - s.ultimo_heartbeat > timeout]
+
+    def resumen(self):
+        """Estado agregado que se envía a los dashboards en 'estado_sensores'"""
+        with self._lock_activos:
+            cantidad = len(self._activos)
+            maquinas = sorted(self._maquinas_activas)
+        return {
+            'activos': bool(cantidad),
+            'cantidad': cantidad,
+            'maquinas': maquinas
+        }
@@ -0,0 +1,557 @@
+"""
+Lógica de los eventos de Socket.IO, independiente del servidor que la ejecuta.
+
+``ServicioSocket`` recibe el sid de la sesión y los datos del evento y usa un
+emisor (ver ``emisores``) para enviar mensajes y manejar salas, así que los
+mismos métodos sirven para el servidor Flask-SocketIO con hilos
+(``socket_events``) y para el servidor asyncio (``asgi_app``).
+
+Con varios procesos, los datos, las predicciones y los cambios de estado de
+los sensores se replican a los demás procesos por el canal 'estado' del bus
+(ver ``bus``), para que cada uno tenga el historial, el registro, las
+anomalías y las alertas activas completos y sus dashboards reciban los datos
+de todos los sensores.
+"""
+import logging
+import struct
+
+import numpy as np
+
+from bitacora import campos, obtener_logger, por_frame
+from formato_binario import FORMATOS, VERSION, DecodificadorBinario
+from modelo_predictivo import modelo_prediccion
+
+log = obtener_logger('socket')
+
+# Flujos a los que se puede suscribir un dashboard, por máquina
+FLUJOS = ('datos', 'predicciones', 'alertas', 'agregados')
+
+def salas(flujo, maquina_id):
+    """Salas de Socket.IO que reciben un mensaje del flujo para una máquina"""
+    return [f"{flujo}:{maquina_id}", f"{flujo}:*"]
+
+def emitir_a_maquina(emisor, evento, datos, flujo, maquina_id):
+    """Envía un evento solo a los clientes suscritos al flujo de esa máquina"""
+    emisor.emit(evento, datos, to=salas(flujo, maquina_id))
+
+def leer_maquinas_y_flujos(data):
+    """Máquinas y flujos de un pedido de (des)suscripción: {'maquinas': [...] | '*', 'flujos': [...]}"""
+    data = data or {}
+    maquinas = data.get('maquinas', '*')
+    maquinas = ['*'] if maquinas in ('*', None) else [m if m == '*' else int(m) for m in maquinas]
+    flujos = [f for f in data.get('flujos', FLUJOS) if f in FLUJOS]
+    return maquinas, flujos
+
+
+class ServicioSocket:
+    """
+    Eventos de Socket.IO del servidor. Cada método recibe ``(sid, datos)`` y
+    devuelve lo que se responde al cliente (ack), si corresponde.
+
+    ``historial`` es el historial general de la planta, ``registro`` el
+    registro de sensores (cada sensor lleva además su propio historial),
+    ``difusor`` reparte los datos a cada dashboard a su propio ritmo,
+    ``inferencia`` ejecuta el modelo predictivo fuera de los handlers y
+    ``vigilancia`` detecta los sensores que dejan de dar señales de vida,
+    ``bus`` (opcional) conecta con los demás procesos del servidor y
+    ``escritor`` (opcional) guarda las lecturas y predicciones en la base de datos,
+    ``agregados`` (opcional) mantiene las estadísticas por minuto y por hora,
+    ``anomalias`` (opcional) puntúa cada lectura contra la historia de su serie y
+    ``alertas`` (opcional) evalúa las reglas de alerta sobre las lecturas.
+    """
+
+    # Evento de Socket.IO -> método que lo atiende
+    EVENTOS = {
+        'connect': 'conectar',
+        'disconnect': 'desconectar',
+        'suscribir': 'suscribir',
+        'desuscribir': 'desuscribir',
+        'negociar_formato': 'negociar_formato',
+        'sensor_activo': 'sensor_activo',
+        'datos_sensor': 'datos_sensor',
+        'datos_sensor_batch': 'datos_sensor_batch',
+        'datos_sensor_bin': 'datos_sensor_bin',
+        'cambiar_estado_maquina': 'cambiar_estado_maquina',
+        'heartbeat': 'heartbeat',
+    }
+
+    # Eventos con trabajo de CPU proporcional al tamaño del mensaje (lotes):
+    # el servidor asyncio los atiende en un executor para no frenar el loop
+    BLOQUEANTES = ('datos_sensor_batch', 'datos_sensor_bin')
+
+    CANAL = 'estado'
+
+    def __init__(self, emisor, historial, registro, difusor, inferencia, vigilancia, bus=None, escritor=None,
+                 agregados=None, anomalias=None, alertas=None, estimador=None):
+        self.emisor = emisor
+        self.historial = historial
+        self.registro = registro
+        self.difusor = difusor
+        self.inferencia = inferencia
+        self.vigilancia = vigilancia
+        self.bus = bus
+        self.escritor = escritor
+        self.agregados = agregados
+        self.anomalias = anomalias
+        self.alertas = alertas
+        self.estimador = estimador
+        self._decodificadores = {}  # Sensores que envían en formato binario, por sesión
+        self._iniciado = False
+        if bus is not None:
+            bus.suscribir(self.CANAL, self.aplicar_remoto)
+            vigilancia.al_perder = self.replicar_sensor
+        if escritor is not None:
+            escritor.al_saturar = self.control_flujo
+        if agregados is not None:
+            agregados.al_cerrar = self.publicar_agregado
+
+    def iniciar(self):
+        """Inicia el bus y los hilos de difusión, inferencia, vigilancia y persistencia (una sola vez)"""
+        if self._iniciado:
+            return
+        self._iniciado = True
+        if self.bus is not None:
+            self.bus.iniciar()
+        self.difusor.iniciar()
+        self.inferencia.iniciar()
+        self.vigilancia.iniciar()
+        if self.escritor is not None:
+            self.escritor.iniciar()
+        if self.agregados is not None:
+            self.agregados.iniciar()
+        if self.estimador is not None:
+            self.estimador.iniciar()
+
+    def sensor_de_sesion(self, sid, datos=None):
+        """Sensor activo que envía el evento (por sesión, o por 'sensor_id' en los datos)"""
+        sensor = self.registro.por_sid(sid)
+        if sensor is None and isinstance(datos, dict) and datos.get('sensor_id') is not None:
+            sensor = self.registro.obtener(str(datos['sensor_id']))
+        return sensor if sensor is not None and sensor.activo else None
+
+    def estado_maquina_global(self):
+        """Estado de encendido para dashboards que no filtran por máquina"""
+        activos = self.registro.activos()
+        return all(s.maquina_encendida for s in activos) if activos else True
+
+    def conectar(self, sid, _=None):
+        """Manejar la conexión de un cliente"""
+        log.info("Cliente conectado", extra=campos(sid=sid))
+
+        # Enviar estado actual de la máquina al cliente que se conecta
+        self.emisor.emit('estado_maquina', {'encendida': self.estado_maquina_global()}, to=sid)
+
+        # Enviar estado actual del sensor al cliente que se conecta
+        self.emisor.emit('estado_sensores', self.registro.resumen(), to=sid)
+
+        # Si hay datos recientes, enviar el último dato
+        ultimo = self.historial.ultimo()
+        if ultimo:
+            self.emisor.emit('nuevos_datos', ultimo, to=sid)
+
+        # Hasta que se suscriba recibe los datos y predicciones de todas las máquinas
+        self.difusor.agregar_cliente(sid)
+
+    def suscribir(self, sid, data=None):
+        """
+        Suscribir al dashboard a flujos de una o varias máquinas:
+        {'maquinas': [1, 2] | '*', 'flujos': ['datos', 'predicciones', 'alertas', 'agregados']}
+        """
+        maquinas, flujos = leer_maquinas_y_flujos(data)
+
+        for flujo in flujos:
+            if flujo in self.difusor.FLUJOS:
+                # Datos y predicciones pasan por el difusor (ritmo por cliente)
+                self.difusor.suscribir(sid, flujo, maquinas)
+            else:
+                for maquina in maquinas:
+                    self.emisor.unirse(sid, f"{flujo}:{maquina}")
+
+        # Sala de estado de cada máquina (encendido/apagado)
+        for maquina in maquinas:
+            self.emisor.unirse(sid, f"maquina:{maquina}")
+
+        return {'success': True, 'maquinas': maquinas, 'flujos': flujos}
+
+    def desuscribir(self, sid, data=None):
+        """Quitar suscripciones: {'maquinas': [...] | '*', 'flujos': [...]}"""
+        maquinas, flujos = leer_maquinas_y_flujos(data)
+
+        for flujo in flujos:
+            if flujo in self.difusor.FLUJOS:
+                self.difusor.desuscribir(sid, flujo, maquinas)
+            else:
+                for maquina in maquinas:
+                    self.emisor.salir(sid, f"{flujo}:{maquina}")
+        return {'success': True}
+
+    def desconectar(self, sid, _=None):
+        # Si la sesión era de un sensor, se olvida la sesión; el sensor se da por
+        # perdido cuando deje de enviar heartbeats
+        self.registro.desvincular_sesion(sid)
+        self.difusor.quitar_cliente(sid)
+        self._decodificadores.pop(sid, None)
+        log.info("Cliente desconectado", extra=campos(sid=sid))
+
+    def sensor_activo(self, sid, data):
+        """Manejar el estado de activación del sensor"""
+        # Sensores sin identificador propio se identifican por su sesión
+        sensor_id = str(data.get('sensor_id') or sid)
+        maquina_id = data.get('maquina_id')
+        maquina_id = int(maquina_id) if maquina_id is not None else None
+
+        if data.get('estado', False):
+            # Sensor activado
+            sensor = self.registro.registrar(sensor_id, maquina_id, sid)
+            self.vigilancia.latido(sensor)
+            self.difusor.quitar_cliente(sid)  # Los sensores no reciben los datos de los dashboards
+            log.info("Sensor activado", extra=campos(sensor_id=sensor_id, maquina_id=maquina_id))
+            if self.escritor is not None and self.escritor.saturado:
+                self.emisor.emit('control_flujo', {'pausar': True, 'pendientes': self.escritor.pendientes()}, to=sid)
+        else:
+            # Sensor desactivado
+            self.registro.desactivar(sensor_id)
+            self.vigilancia.olvidar(sensor_id)
+            sensor = self.registro.obtener(sensor_id)
+            log.info("Sensor desactivado", extra=campos(sensor_id=sensor_id))
+        self.replicar_sensor(sensor)
+
+        # Enviar inmediatamente el estado de los sensores a todos los clientes
+        self.emisor.emit('estado_sensores', self.registro.resumen())
+
+    def publicar_prediccion(self, acciones, criticos, contexto, origen):
+        """
+        Callback del pool de inferencia: envía la predicción como evento propio,
+        etiquetada con el número de secuencia del dato (o del primer dato del lote).
+        """
+        observacion = contexto.pop('observacion')
+        observaciones = contexto.pop('observaciones', None)
+        timestamps = contexto.pop('timestamps', None)
+        prediccion = modelo_prediccion.explicar(observacion, acciones[-1])
+        prediccion.update(contexto, origen=origen)
+        if len(acciones) > 1:
+            prediccion.update(acciones=acciones.tolist(), criticos=criticos.tolist())
+            por_frame(log, logging.INFO, "Predicción de lote", sensor_id=contexto['sensor_id'],
+                      maquina_id=contexto['maquina_id'], seq=contexto['seq'], n=len(acciones),
+                      mantenimiento=int(acciones.sum()), criticos=int(criticos.sum()), origen=origen)
+        else:
+            por_frame(log, logging.INFO, "Predicción", sensor_id=contexto['sensor_id'],
+                      maquina_id=contexto['maquina_id'], seq=contexto['seq'],
+                      temperatura=observacion[0], vibracion=observacion[1], presion=observacion[2],
+                      accion=prediccion['action_explanation'], origen=origen)
+        if prediccion['is_critical']:
+            # Las condiciones críticas se registran aunque los mensajes por dato estén apagados
+            log.warning("¡ALERTA CRÍTICA! Se recomienda intervención inmediata.",
+                        extra=campos(sensor_id=contexto['sensor_id'], maquina_id=contexto['maquina_id'],
+                                     seq=contexto['seq']))
+
+        # Enviar la predicción a los suscritos al flujo de predicciones
+        self.difusor.publicar(prediccion, 'prediccion', 'predicciones', contexto['maquina_id'])
+        self.replicar('prediccion', prediccion)
+
+        # Guardar las lecturas con la decisión del modelo (en segundo plano)
+        if self.escritor is not None:
+            if observaciones is None:
+                observaciones, timestamps = [observacion], [contexto['timestamp']]
+            self.escritor.registrar(contexto['maquina_id'], timestamps, observaciones, acciones)
+
+    def procesar_dato(self, sensor, datos):
+        """Registra una lectura del sensor, la publica y encola su predicción"""
+        # Cada dato cuenta como heartbeat del sensor
+        self.vigilancia.latido(sensor)
+
+        datos['sensor_id'] = sensor.sensor_id
+        datos['maquina_id'] = sensor.maquina_id
+
+        # Agregar al historial del sensor y al general (buffer circular, O(1))
+        datos['seq'] = sensor.historial.agregar(datos)
+        self.historial.agregar(datos)
+        self.agregar_a_rollups(datos)
+        valores = [[v] for v in self.historial.fila(datos)]
+        anomalia = self.analizar(sensor.maquina_id, sensor.sensor_id, [self.historial.a_ns(datos.get('timestamp'))],
+                                 valores, indice=0)
+        if anomalia is not None:
+            datos['anomalia'] = anomalia
+        self.estimar(sensor, valores)
+
+        # Enviar el dato a los dashboards de inmediato (cada uno a su ritmo)
+        self.difusor.publicar(datos, maquina=sensor.maquina_id)
+        self.replicar('dato', datos)
+
+        # La predicción se calcula en el pool de inferencia y se envía después
+        if all(datos.get(campo) is not None for campo in ('temperatura', 'vibracion', 'presion')):
+            sensor_values = [datos['temperatura'], datos['vibracion'], datos['presion']]
+            self.inferencia.enviar(sensor_values, self.publicar_prediccion, {
+                'sensor_id': sensor.sensor_id,
+                'maquina_id': sensor.maquina_id,
+                'seq': datos['seq'],
+                'timestamp': datos.get('timestamp'),
+                'observacion': sensor_values
+            })
+
+    def procesar_lote(self, sensor, timestamps, valores):
+        """
+        Registra un lote de lecturas del sensor (ver ``HistorialSensores.leer_lote``),
+        lo publica y encola una sola predicción
+        """
+        self.vigilancia.latido(sensor)
+        if len(timestamps) == 0:
+            return
+
+        # Agregar todo el lote a los historiales en una sola operación
+        seq = sensor.historial.agregar_lote(timestamps, valores)
+        self.historial.agregar_lote(timestamps, valores)
+        if self.agregados is not None:
+            self.agregados.agregar(sensor.maquina_id, sensor.sensor_id, timestamps, valores)
+
+        salida = {
+            'sensor_id': sensor.sensor_id,
+            'maquina_id': sensor.maquina_id,
+            'seq': seq,
+            'timestamp': self.historial.a_iso(timestamps).tolist(),
+        }
+        for i, campo in enumerate(self.historial.CAMPOS):
+            salida[campo] = self.historial.a_lista(valores[i])
+        anomalia = self.analizar(sensor.maquina_id, sensor.sensor_id, timestamps, valores)
+        if anomalia is not None:
+            salida['anomalia'] = anomalia
+        self.estimar(sensor, valores)
+
+        # Enviar el lote completo a los dashboards suscritos en un solo evento
+        self.difusor.publicar(salida, 'nuevos_datos_lote', maquina=sensor.maquina_id)
+        self.replicar('lote', salida)
+
+        # Una sola inferencia para todo el lote, fuera del handler (solo lecturas completas)
+        completas = ~np.isnan(valores).any(axis=0)
+        if not completas.any():
+            return
+        observaciones = valores[:, completas].T
+        timestamps_iso = salida['timestamp'] if completas.all() else \
+            [ts for ts, completa in zip(salida['timestamp'], completas) if completa]
+        self.inferencia.enviar(observaciones, self.publicar_prediccion, {
+            'sensor_id': sensor.sensor_id,
+            'maquina_id': sensor.maquina_id,
+            'seq': seq,
+            'timestamp': timestamps_iso[-1],
+            'observacion': observaciones[-1],
+            'observaciones': observaciones,
+            'timestamps': timestamps_iso
+        })
+
+    def datos_sensor(self, sid, datos):
+        """Manejar datos recibidos del sensor"""
+        sensor = self.sensor_de_sesion(sid, datos)
+
+        # Solo procesamos datos si el sensor está activo
+        if sensor is not None:
+            self.procesar_dato(sensor, datos)
+
+    def datos_sensor_batch(self, sid, lote):
+        """
+        Manejar un lote de lecturas del sensor, ya sea columnar
+        ({'timestamp': [...], 'temperatura': [...], ...}) o como lista de lecturas.
+        """
+        sensor = self.sensor_de_sesion(sid, lote)
+
+        # Solo procesamos datos si el sensor está activo
+        if sensor is not None:
+            try:
+                timestamps, valores = self.historial.leer_lote(lote)
+            except ValueError as e:
+                log.warning("Lote inválido: %s", e, extra=campos(sid=sid, sensor_id=sensor.sensor_id))
+                return {'success': False, 'mensaje': str(e)}
+            self.procesar_lote(sensor, timestamps, valores)
+
+    def datos_sensor_bin(self, sid, mensaje):
+        """Manejar lecturas del sensor en formato binario (ver formato_binario)"""
+        decodificador = self._decodificadores.setdefault(sid, DecodificadorBinario())
+        try:
+            evento, datos = decodificador.decodificar(mensaje)
+        except (ValueError, struct.error) as e:
+            log.warning("Mensaje binario inválido: %s", e, extra=campos(sid=sid))
+            return {'success': False, 'mensaje': str(e)}
+
+        sensor = self.sensor_de_sesion(sid, datos)
+        if sensor is None:
+            return
+        if evento == 'nuevos_datos':
+            self.procesar_dato(sensor, datos)
+        else:
+            self.procesar_lote(sensor, *self.historial.leer_lote(datos))
+
+    def negociar_formato(self, sid, data=None):
+        """
+        Elegir el formato de los datos y predicciones que recibe el dashboard:
+        {'formatos': ['binario', 'json']} en orden de preferencia. Sin negociar se usa JSON.
+        """
+        preferidos = (data or {}).get('formatos') or ['json']
+        formato = next((f for f in preferidos if f in FORMATOS), 'json')
+        self.difusor.formato(sid, formato)
+        return {'formato': formato, 'version': VERSION}
+
+    def cambiar_estado_maquina(self, sid, data):
+        """
+        Manejar cambios en el estado de la máquina (encendido/apagado).
+        Se puede indicar 'sensor_id' o 'maquina_id'; sin ninguno aplica a todos los sensores activos.
+        """
+        if data.get('sensor_id') is not None:
+            sensor = self.registro.obtener(str(data['sensor_id']))
+            sensores = [sensor] if sensor is not None else []
+        elif data.get('maquina_id') is not None:
+            sensores = self.registro.por_maquina(int(data['maquina_id']))
+        else:
+            sensores = self.registro.activos()
+        sensores = [s for s in sensores if s.activo]
+
+        # Solo permitir cambios si el sensor está activo
+        if not sensores:
+            return {'success': False, 'mensaje': 'No se puede cambiar el estado: sensor inactivo'}
+
+        # Obtener el nuevo estado deseado
+        nuevo_estado = data.get('encender', False)
+
+        # Solo hacer cambios en los sensores cuyo estado es diferente
+        cambiados = [s for s in sensores if s.maquina_encendida != nuevo_estado]
+        if cambiados:
+            for sensor in cambiados:
+                sensor.maquina_encendida = nuevo_estado
+
+                log.info("Estado de la máquina cambiado",
+                         extra=campos(maquina_id=sensor.maquina_id, sensor_id=sensor.sensor_id,
+                                      estado='ENCENDIDA' if nuevo_estado else 'APAGADA'))
+
+                # Notificar a los clientes que siguen esa máquina sobre el cambio
+                self.emisor.emit('estado_maquina', {'encendida': nuevo_estado,
+                                                    'maquina_id': sensor.maquina_id,
+                                                    'sensor_id': sensor.sensor_id},
+                                 to=salas('maquina', sensor.maquina_id))
+
+                # Notificar solo a la sesión del sensor sobre el cambio
+                if sensor.sid is not None:
+                    self.emisor.emit('comando_sensor', {'encender': nuevo_estado, 'sensor_id': sensor.sensor_id},
+                                     to=sensor.sid)
+                self.replicar_sensor(sensor)
+
+            # Devolver confirmación al cliente que envió el comando
+            return {'success': True, 'estado': 'encendida' if nuevo_estado else 'apagada',
+                    'cantidad': len(cambiados)}
+
+        return {'success': False, 'mensaje': 'La máquina ya está en ese estado'}
+
+    def heartbeat(self, sid, _=None):
+        """
+        Manejar los heartbeats del sensor para detectar desconexiones. Los datos
+        también cuentan como heartbeat, así que el sensor solo los envía si está inactivo.
+        """
+        sensor = self.registro.por_sid(sid)
+        if sensor is not None and sensor.activo:
+            self.vigilancia.latido(sensor)
+        # Quietly acknowledge the heartbeat
+        return {'recibido': True}
+
+    def replicar(self, tipo, datos):
+        """Envía un cambio de estado a los demás procesos del servidor (si hay bus)"""
+        if self.bus is not None:
+            self.bus.publicar(self.CANAL, (tipo, datos))
+
+    def replicar_sensor(self, sensor):
+        if sensor is not None:
+            self.replicar('sensor', {'sensor_id': sensor.sensor_id, 'maquina_id': sensor.maquina_id,
+                                     'sid': sensor.sid, 'activo': sensor.activo,
+                                     'encendida': sensor.maquina_encendida})
+
+    def aplicar_remoto(self, mensaje):
+        """
+        Aplica un cambio de estado publicado por otro proceso. Los emit del otro
+        proceso ya llegan a todos los clientes por el bus de Socket.IO; aquí solo
+        se actualizan el historial, el registro, los agregados, las anomalías,
+        las alertas activas y el difusor de este proceso.
+        """
+        tipo, datos = mensaje
+        if tipo == 'sensor':
+            if datos['activo']:
+                sensor = self.registro.registrar(datos['sensor_id'], datos['maquina_id'], datos['sid'])
+                sensor.maquina_encendida = datos['encendida']
+            else:
+                self.registro.desactivar(datos['sensor_id'])
+            self.vigilancia.revisar_reposo()
+            return
+
+        sensor = self.registro.obtener(datos['sensor_id'])
+        if tipo == 'dato':
+            self.historial.agregar(datos)
+            if sensor is not None:
+                sensor.historial.agregar(datos)
+            self.agregar_a_rollups(datos, local=False)
+            valores = [[v] for v in self.historial.fila(datos)]
+            self.analizar(datos['maquina_id'], datos['sensor_id'], [self.historial.a_ns(datos.get('timestamp'))],
+                          valores, indice=0, publicar=False)
+            self.estimar(sensor, valores)
+            self.difusor.publicar(datos, maquina=datos['maquina_id'])
+        elif tipo == 'lote':
+            timestamps, valores = self.historial.leer_lote(datos)
+            self.historial.agregar_lote(timestamps, valores)
+            if sensor is not None:
+                sensor.historial.agregar_lote(timestamps, valores)
+            if self.agregados is not None:
+                self.agregados.agregar(datos['maquina_id'], datos['sensor_id'], timestamps, valores, local=False)
+            self.analizar(datos['maquina_id'], datos['sensor_id'], timestamps, valores, publicar=False)
+            self.estimar(sensor, valores)
+            self.difusor.publicar(datos, 'nuevos_datos_lote', maquina=datos['maquina_id'])
+        elif tipo == 'prediccion':
+            self.difusor.publicar(datos, 'prediccion', 'predicciones', datos['maquina_id'])
+
+    def agregar_a_rollups(self, datos, local=True):
+        """Suma una lectura a los agregados de su serie, con el timestamp del dato"""
+        if self.agregados is not None:
+            valores = [[v] for v in self.historial.fila(datos)]
+            self.agregados.agregar(datos['maquina_id'], datos['sensor_id'],
+                                   [self.historial.a_ns(datos.get('timestamp'))], valores, local)
+
+    def analizar(self, maquina_id, sensor_id, timestamps, valores, indice=None, publicar=True):
+        """
+        Puntúa las lecturas contra la historia de la serie y evalúa las reglas de
+        alerta. Devuelve los puntajes de anomalía para adjuntar a los datos (o None).
+        Con ``publicar=False`` (lecturas de otro proceso) solo se actualiza el
+        estado: las alertas ya las envió el proceso que recibió las lecturas.
+        """
+        z = tasa = resumen = None
+        if self.anomalias is not None:
+            z, tasa, puntaje = self.anomalias.puntuar(maquina_id, sensor_id, timestamps, valores)
+            resumen = self.anomalias.resumen(z, tasa, puntaje, indice)
+        if self.alertas is not None:
+            for alerta in self.alertas.evaluar(maquina_id, sensor_id, timestamps, valores, z, tasa):
+                if publicar:
+                    self.publicar_alerta(alerta)
+        return resumen
+
+    def estimar(self, sensor, valores):
+        """
+        Suma lecturas al estimador de transiciones. Con la máquina apagada los
+        valores decaen hacia 0 y no son estados reales de la máquina: se omiten
+        (también las de sensores que este proceso no conoce).
+        """
+        if self.estimador is not None and sensor is not None and sensor.maquina_encendida:
+            self.estimador.agregar(sensor.maquina_id, sensor.sensor_id, valores)
+
+    def publicar_alerta(self, alerta):
+        """Envía una alerta (activa o resuelta) a los suscritos al flujo de alertas de la máquina"""
+        nivel = logging.WARNING if alerta['estado'] == 'activa' else logging.INFO
+        log.log(nivel, "Alerta %s: %s", alerta['estado'], alerta['regla'],
+                extra=campos(maquina_id=alerta['maquina_id'], sensor_id=alerta['sensor_id'],
+                             campo=alerta['campo'], valor=alerta['valor'], limite=alerta['limite']))
+        emitir_a_maquina(self.emisor, 'alerta', alerta, 'alertas', alerta['maquina_id'])
+
+    def publicar_agregado(self, agregado):
+        """Envía una cubeta terminada a los suscritos al flujo de agregados de la máquina"""
+        emitir_a_maquina(self.emisor, 'agregado', agregado, 'agregados', agregado['maquina_id'])
+
+    def control_flujo(self, pausar, pendientes):
+        """
+        Pide a los sensores conectados a este proceso (los que escriben en su
+        buffer) que frenen o reanuden el envío de datos.
+        """
+        for sensor in self.registro.activos():
+            if sensor.sid is not None:
+                self.emisor.emit('control_flujo', {'pausar': pausar, 'pendientes': pendientes}, to=sensor.sid,
+                                 local=True)
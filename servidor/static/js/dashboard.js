@@ -12,6 +12,15 @@ const socket = io({
     timeout: 5000
 });
 
+// Máquina que muestra este dashboard (?maquina=<id>); sin parámetro se muestran todas
+const MAQUINA_ID = new URLSearchParams(window.location.search).get('maquina');
+
+// Flujos que muestra el dashboard (datos crudos, predicciones del modelo y alertas)
+const FLUJOS_DASHBOARD = ['datos', 'predicciones', 'alertas'];
+
+// Decodificador del formato binario (se reinicia en cada conexión)
+let decodificador = new DecodificadorBinario();
+
 // Variables para almacenar datos
 let tempData = [];
 let vibrationData = [];
@@ -132,7 +141,7 @@ function actualizarPrediccionIA(prediccion) {
 async function cargarDatosIniciales() {
     try {
         console.log("Cargando datos iniciales...");
-        const response = await fetch('/api/datos');
+        const response = await fetch(MAQUINA_ID ? `/api/datos?maquina=${MAQUINA_ID}` : '/api/datos');
         
         if (!response.ok) {
             throw new Error(`Error HTTP: ${response.status}`);
@@ -211,7 +220,9 @@ function toggleMaquina() {
     powerText.textContent = maquinaEncendida ? 'Apagando...' : 'Encendiendo...';
     
     // Enviar comando al servidor
-    socket.emit('cambiar_estado_maquina', { encender: !maquinaEncendida }, (response) => {
+    const comando = { encender: !maquinaEncendida };
+    if (MAQUINA_ID) comando.maquina_id = MAQUINA_ID;
+    socket.emit('cambiar_estado_maquina', comando, (response) => {
         // Callback cuando el servidor responde (opcional)
         if (response && response.success) {
             console.log(`Máquina ${response.estado} correctamente`);
@@ -290,24 +301,6 @@ const pressureChart = new Chart(document.getElementById('pressureChart'), {
     }
 });
 
-/**
- * Umbrales de alerta para los sensores
- */
-const LIMITES = {
-    temperatura: {
-        advertencia: 70,
-        critico: 85
-    },
-    vibracion: {
-        advertencia: 7,
-        critico: 9
-    },
-    presion: {
-        advertencia: 150,
-        critico: 200
-    }
-};
-
 /**
  * Estado de las alertas activas
  */
@@ -315,40 +308,9 @@ let alertaActiva = false;
 let tipoAlerta = null;
 
 /**
- * Verifica si hay valores fuera de rango y muestra alertas
+ * Muestra una alerta en la interfaz (con un mensaje propio si se indica)
  */
-function verificarAlertas(data) {
-    // Verificar temperatura
-    if (data.temperatura >= LIMITES.temperatura.critico) {
-        mostrarAlerta('critico', 'temperatura', data.temperatura);
-    } else if (data.temperatura >= LIMITES.temperatura.advertencia) {
-        mostrarAlerta('advertencia', 'temperatura', data.temperatura);
-    }
-    
-    // Verificar vibración
-    else if (data.vibracion >= LIMITES.vibracion.critico) {
-        mostrarAlerta('critico', 'vibracion', data.vibracion);
-    } else if (data.vibracion >= LIMITES.vibracion.advertencia) {
-        mostrarAlerta('advertencia', 'vibracion', data.vibracion);
-    }
-    
-    // Verificar presión
-    else if (data.presion >= LIMITES.presion.critico) {
-        mostrarAlerta('critico', 'presion', data.presion);
-    } else if (data.presion >= LIMITES.presion.advertencia) {
-        mostrarAlerta('advertencia', 'presion', data.presion);
-    }
-    
-    // Si no hay ninguna alerta pero había una activa, ocultar
-    else if (alertaActiva) {
-        ocultarAlerta();
-    }
-}
-
-/**
- * Muestra una alerta en la interfaz
- */
-function mostrarAlerta(nivel, sensor, valor) {
+function mostrarAlerta(nivel, sensor, valor, detalle = null) {
     // Si ya hay una alerta del mismo tipo, no hacer nada
     if (alertaActiva && tipoAlerta === `${nivel}-${sensor}`) {
         return;
@@ -386,7 +348,7 @@ function mostrarAlerta(nivel, sensor, valor) {
     }[sensor];
     
     // Construir mensaje
-    const mensaje = `${sensorNombre} elevada: <strong>${valor} ${unidad}</strong>`;
+    const mensaje = detalle || `${sensorNombre} elevada: <strong>${valor} ${unidad}</strong>`;
     const accion = nivel === 'critico' 
         ? 'Se recomienda apagar la máquina inmediatamente para prevenir daños.'
         : 'Monitoree la situación y considere reducir la carga de trabajo.';
@@ -479,6 +441,16 @@ socket.on('connect', () => {
     statusIndicator.className = 'w-3 h-3 bg-green-500 rounded-full mr-2';
     connectionStatus.textContent = 'Conectado';
     
+    // Pedir el formato binario (más compacto); si el servidor no lo soporta sigue en JSON
+    decodificador = new DecodificadorBinario();
+    socket.emit('negociar_formato', {formatos: ['binario', 'json']});
+    
+    // Suscribirse solo a los flujos y la máquina que muestra este dashboard
+    socket.emit('suscribir', {
+        maquinas: MAQUINA_ID ? [MAQUINA_ID] : '*',
+        flujos: FLUJOS_DASHBOARD
+    });
+    
     // Cargar datos iniciales cuando se conecta
     cargarDatosIniciales();
 });
@@ -576,17 +548,16 @@ function mostrarNotificacion(mensaje, tipo = 'info') {
     }, 3000);
 }
 
-// Evento para nuevos datos de sensores
-socket.on('nuevos_datos', (data) => {
-    // Limitar actualizaciones de UI para evitar sobrecarga del navegador
+/**
+ * Agrega un dato a los valores actuales y a los arrays de los gráficos
+ * (sin redibujar los gráficos)
+ */
+function agregarDato(data) {
     // Solo actualizar los valores numéricos en cada dato recibido
     tempValue.textContent = `${data.temperatura}°C`;
     vibrationValue.textContent = `${data.vibracion} mm/s`;
     pressureValue.textContent = `${data.presion} bar`;
 
-    // Verificar si hay valores que requieren alertas
-    verificarAlertas(data);
-
     // Actualizar panel de predicción de IA si hay datos de predicción
     if (data.prediccion) {
         actualizarPrediccionIA(data.prediccion);
@@ -606,8 +577,12 @@ socket.on('nuevos_datos', (data) => {
         vibrationData.shift();
         pressureData.shift();
     }
+}
 
-    // Actualizar gráficos con una frecuencia más baja para mejor rendimiento
+/**
+ * Redibuja los gráficos con una frecuencia limitada para mejor rendimiento
+ */
+function refrescarGraficos() {
     // Actualizar cada ~250ms (4 veces por segundo) en lugar de cada mensaje
     if (!window.lastChartUpdate || Date.now() - window.lastChartUpdate > 250) {
         tempChart.update('none');
@@ -615,6 +590,91 @@ socket.on('nuevos_datos', (data) => {
         pressureChart.update('none');
         window.lastChartUpdate = Date.now();
     }
+}
+
+/**
+ * Procesa un dato nuevo (evento 'nuevos_datos' o su versión binaria)
+ */
+function procesarDato(data) {
+    // Limitar actualizaciones de UI para evitar sobrecarga del navegador
+    agregarDato(data);
+    refrescarGraficos();
+}
+
+/**
+ * Procesa un lote de datos en formato columnar (evento 'nuevos_datos_lote' o su versión binaria)
+ */
+function procesarLote(lote) {
+    const n = lote.timestamp.length;
+    for (let i = 0; i < n; i++) {
+        agregarDato({
+            timestamp: lote.timestamp[i],
+            temperatura: lote.temperatura[i],
+            vibracion: lote.vibracion[i],
+            presion: lote.presion[i],
+            // La predicción detallada corresponde al último punto del lote
+            prediccion: i === n - 1 ? lote.prediccion : undefined
+        });
+    }
+    refrescarGraficos();
+}
+
+// Evento para nuevos datos de sensores
+socket.on('nuevos_datos', (data, ack) => {
+    procesarDato(data);
+
+    // Confirmar la recepción para que el servidor regule el ritmo de envío
+    if (ack) ack();
+});
+
+// Evento para las predicciones del modelo (flujo 'predicciones')
+socket.on('prediccion', (prediccion, ack) => {
+    actualizarPrediccionIA(prediccion);
+    if (ack) ack();
+});
+
+// Aviso del servidor cuando este dashboard no alcanza a procesar los datos
+socket.on('cliente_lento', (data) => {
+    console.warn('El servidor reporta que este dashboard va atrasado', data);
+    mostrarNotificacion('Conexión lenta: se muestran datos resumidos', 'warning');
+});
+
+// Alertas del servidor (flujo 'alertas'): se avisan al activarse y al resolverse
+socket.on('alerta', (alerta) => {
+    if (alerta.estado === 'activa') {
+        let detalle = null;
+        if (alerta.tipo === 'anomalia') {
+            detalle = `Comportamiento inusual de ${alerta.campo}: <strong>z = ${alerta.valor}</strong>`;
+        } else if (alerta.tipo === 'tasa') {
+            detalle = `Cambio brusco de ${alerta.campo}: <strong>${alerta.valor} por segundo</strong>`;
+        }
+        mostrarAlerta(alerta.severidad, alerta.campo, alerta.valor, detalle);
+    } else if (tipoAlerta === `${alerta.severidad}-${alerta.campo}`) {
+        ocultarAlerta();
+    }
+});
+
+// Evento para lotes de datos (formato columnar)
+socket.on('nuevos_datos_lote', (lote, ack) => {
+    procesarLote(lote);
+    if (ack) ack();
+});
+
+// Datos en formato binario (un dato o un lote)
+socket.on('datos_bin', (mensaje, ack) => {
+    const {evento, datos} = decodificador.decodificar(mensaje);
+    if (evento === 'nuevos_datos') {
+        procesarDato(datos);
+    } else {
+        procesarLote(datos);
+    }
+    if (ack) ack();
+});
+
+// Predicciones en formato binario
+socket.on('prediccion_bin', (mensaje, ack) => {
+    actualizarPrediccionIA(decodificador.decodificar(mensaje).datos);
+    if (ack) ack();
 });
 
 // Evento del botón de encendido/apagado
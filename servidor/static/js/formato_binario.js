@@ -0,0 +1,167 @@
+/**
+ * Decodificador del formato binario de datos y predicciones
+ * (ver servidor/formato_binario.py para la estructura de los mensajes).
+ *
+ * Guarda el último timestamp y los últimos valores de cada sensor, ya que
+ * el servidor omite los campos que no cambiaron y envía los timestamps como
+ * diferencias. Hay que crear un decodificador nuevo en cada conexión.
+ */
+const FORMATO_BINARIO = {
+    VERSION: 1,
+    TIPO_DATOS: 1,
+    TIPO_PREDICCION: 2,
+    CLAVE: 0x01,
+    RESUMEN: 0x02,
+    LOTE: 0x04,
+    ANOMALIA: 0x08,
+    CAMPOS: ['temperatura', 'vibracion', 'presion'],
+    ORIGENES: ['modelo', 'umbral']
+};
+
+/**
+ * Los timestamps viajan como la hora de pared del sensor en ms (sin zona):
+ * se devuelven como ISO sin zona, igual que en JSON, para que new Date()
+ * los interprete como hora local por los dos caminos.
+ */
+function isoSinZona(ms) {
+    return new Date(ms).toISOString().slice(0, 23);
+}
+
+class DecodificadorBinario {
+    constructor() {
+        this.ultimos = {}; // sensor_id -> {ts, valores}
+    }
+
+    /**
+     * Decodifica un mensaje (ArrayBuffer). Devuelve {evento, datos} con los mismos
+     * campos que los eventos JSON ('nuevos_datos', 'nuevos_datos_lote' o 'prediccion'),
+     * con los timestamps como texto ISO sin zona.
+     */
+    decodificar(buffer) {
+        const vista = buffer instanceof DataView ? buffer : new DataView(buffer.buffer || buffer, buffer.byteOffset || 0);
+        const version = vista.getUint8(0);
+        if (version !== FORMATO_BINARIO.VERSION) {
+            throw new Error(`Versión de formato binario no soportada: ${version}`);
+        }
+        const tipo = vista.getUint8(1);
+        const banderas = vista.getUint8(2);
+        const largo = vista.getUint8(3);
+        const sensor = new TextDecoder().decode(new Uint8Array(vista.buffer, vista.byteOffset + 4, largo));
+        let pos = 4 + largo;
+        const maquina = vista.getInt32(pos, true);
+        const seq = Number(vista.getBigInt64(pos + 4, true));
+        pos += 12;
+
+        const datos = {
+            sensor_id: sensor || null,
+            maquina_id: maquina < 0 ? null : maquina,
+            seq: seq < 0 ? null : seq
+        };
+
+        if (tipo === FORMATO_BINARIO.TIPO_PREDICCION) {
+            return {evento: 'prediccion', datos: this._prediccion(vista, pos, banderas, datos)};
+        }
+
+        const n = vista.getUint16(pos, true);
+        pos += 2;
+        let referencia;
+        let previos;
+        if (banderas & FORMATO_BINARIO.CLAVE) {
+            referencia = Number(vista.getBigInt64(pos, true));
+            pos += 8;
+            previos = FORMATO_BINARIO.CAMPOS.map(() => NaN);
+        } else {
+            const ultimo = this.ultimos[sensor];
+            if (!ultimo) {
+                throw new Error(`Mensaje diferencial sin mensaje clave previo del sensor ${sensor}`);
+            }
+            referencia = ultimo.ts;
+            previos = ultimo.valores;
+        }
+
+        const timestamps = new Array(n);
+        const columnas = FORMATO_BINARIO.CAMPOS.map(() => new Array(n));
+        for (let i = 0; i < n; i++) {
+            referencia += vista.getInt32(pos, true);
+            const mascara = vista.getUint8(pos + 4);
+            pos += 5;
+            const fila = previos.slice();
+            for (let c = 0; c < fila.length; c++) {
+                if (mascara & (1 << c)) {
+                    fila[c] = vista.getFloat32(pos, true);
+                    pos += 4;
+                }
+                columnas[c][i] = Math.round(fila[c] * 10000) / 10000;
+            }
+            timestamps[i] = isoSinZona(referencia);
+            previos = fila;
+        }
+        this.ultimos[sensor] = {ts: referencia, valores: previos};
+
+        let evento;
+        if (n === 1) {
+            evento = 'nuevos_datos';
+            datos.timestamp = timestamps[0];
+            FORMATO_BINARIO.CAMPOS.forEach((campo, c) => { datos[campo] = columnas[c][0]; });
+        } else {
+            evento = 'nuevos_datos_lote';
+            datos.timestamp = timestamps;
+            FORMATO_BINARIO.CAMPOS.forEach((campo, c) => { datos[campo] = columnas[c]; });
+        }
+
+        if (banderas & FORMATO_BINARIO.RESUMEN) {
+            const resumen = {
+                n: vista.getUint32(pos, true),
+                descartados: vista.getUint32(pos + 4, true),
+                min: {},
+                max: {}
+            };
+            pos += 8;
+            ['min', 'max'].forEach((clave) => {
+                FORMATO_BINARIO.CAMPOS.forEach((campo) => {
+                    const valor = vista.getFloat32(pos, true);
+                    pos += 4;
+                    if (!Number.isNaN(valor)) resumen[clave][campo] = valor;
+                });
+            });
+            datos.resumen = resumen;
+        }
+
+        if (banderas & FORMATO_BINARIO.ANOMALIA) {
+            const campos = FORMATO_BINARIO.CAMPOS;
+            const k = 1 + 2 * campos.length;
+            const columnas = Array.from({length: k}, () => new Array(n));
+            for (let i = 0; i < n; i++) {
+                for (let c = 0; c < k; c++) {
+                    columnas[c][i] = Math.round(vista.getFloat32(pos, true) * 1000) / 1000;
+                    pos += 4;
+                }
+            }
+            const valor = (columna) => (n === 1 ? columna[0] : columna);
+            datos.anomalia = {puntaje: valor(columnas[0]), z: {}, tasa: {}};
+            campos.forEach((campo, c) => {
+                datos.anomalia.z[campo] = valor(columnas[1 + c]);
+                datos.anomalia.tasa[campo] = valor(columnas[1 + campos.length + c]);
+            });
+        }
+        return {evento, datos};
+    }
+
+    _prediccion(vista, pos, banderas, datos) {
+        datos.action = vista.getUint8(pos);
+        datos.is_critical = vista.getUint8(pos + 1) === 1;
+        datos.origen = FORMATO_BINARIO.ORIGENES[vista.getUint8(pos + 2)];
+        const n = vista.getUint16(pos + 3, true);
+        const timestamp = Number(vista.getBigInt64(pos + 5, true));
+        datos.timestamp = timestamp < 0 ? null : isoSinZona(timestamp);
+        pos += 13;
+        datos.raw_data = FORMATO_BINARIO.CAMPOS.map((_, c) => vista.getFloat32(pos + 4 * c, true));
+        pos += 4 * FORMATO_BINARIO.CAMPOS.length;
+        datos.action_explanation = datos.action === 1 ? 'Mantenimiento preventivo' : 'Continuar operación normal';
+        if (banderas & FORMATO_BINARIO.LOTE) {
+            datos.acciones = Array.from(new Uint8Array(vista.buffer, vista.byteOffset + pos, n));
+            datos.criticos = Array.from(new Uint8Array(vista.buffer, vista.byteOffset + pos + n, n), (c) => c === 1);
+        }
+        return datos;
+    }
+}
@@ -0,0 +1,94 @@
+"""
+Lanza varios procesos del servidor conectados por el bus (ver bus.py).
+
+Cada trabajador escucha en su propio puerto (PORT, PORT+1, ...) y comparte
+los emit de Socket.IO, el historial y el registro de sensores con los demás
+a través de un broker en un socket Unix, dentro de un directorio temporal
+privado y autenticado con una clave aleatoria que solo conocen los procesos
+lanzados aquí. Delante va un balanceador con
+sesiones persistentes (por ejemplo nginx con ``ip_hash``), necesarias para
+el transporte polling de Socket.IO.
+
+    cd servidor
+    python trabajadores.py -n 4            # servidor Flask-SocketIO (hilos)
+    python trabajadores.py -n 4 --asgi     # servidor asyncio (requiere uvicorn)
+"""
+import argparse
+import multiprocessing
+import os
+import secrets
+import signal
+import shutil
+import sys
+import tempfile
+
+from bitacora import campos, obtener_logger
+from bus import BrokerBus
+from config import Config
+
+log = obtener_logger('trabajadores')
+
+
+
+def trabajador(puerto, url_bus, clave_bus, asgi):
+    """Proceso de un trabajador: usa el bus indicado y atiende en su puerto"""
+    Config.BUS_URL = url_bus
+    Config.BUS_CLAVE = clave_bus
+    if asgi:
+        import uvicorn
+        from asgi_app import asgi as aplicacion
+        uvicorn.run(aplicacion, host=Config.HOST, port=puerto, log_level='warning')
+    else:
+        from app import app, socketio
+        socketio.run(app, host=Config.HOST, port=puerto, debug=False, allow_unsafe_werkzeug=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor con varios procesos trabajadores')
+    parser.add_argument('-n', '--trabajadores', type=int, default=os.cpu_count(), help='Cantidad de procesos')
+    parser.add_argument('--puerto', type=int, default=Config.PORT, help='Puerto del primer trabajador')
+    parser.add_argument('--socket', help='Socket Unix del broker (por defecto, en un directorio temporal privado)')
+    parser.add_argument('--asgi', action='store_true', help='Usar el servidor asyncio (asgi_app.py)')
+    args = parser.parse_args()
+
+    # Directorio 0700 creado por mkdtemp: nadie más puede llegar al socket
+    directorio = None
+    if args.socket is None:
+        directorio = tempfile.mkdtemp(prefix='cbn_bus_')
+        args.socket = os.path.join(directorio, 'bus.sock')
+    clave = secrets.token_bytes(32)
+    broker = BrokerBus(args.socket, clave)
+    broker.iniciar()
+
+    # 'spawn': cada trabajador arranca limpio, sin los hilos de este proceso
+    contexto = multiprocessing.get_context('spawn')
+    procesos = []
+    for i in range(args.trabajadores):
+        puerto = args.puerto + i
+        proceso = contexto.Process(target=trabajador, args=(puerto, f'unix://{args.socket}', clave, args.asgi),
+                                   name=f'trabajador-{i}')
+        proceso.start()
+        procesos.append(proceso)
+        log.info("Trabajador iniciado", extra=campos(pid=proceso.pid, puerto=puerto))
+
+    def detener(*_):
+        for proceso in procesos:
+            proceso.terminate()
+
+    signal.signal(signal.SIGTERM, detener)
+    try:
+        for proceso in procesos:
+            proceso.join()
+    except KeyboardInterrupt:
+        detener()
+        for proceso in procesos:
+            proceso.join()
+    finally:
+        broker.cerrar()
+        if directorio is not None:
+            shutil.rmtree(directorio, ignore_errors=True)
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
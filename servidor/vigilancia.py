@@ -0,0 +1,163 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime
+
+from bitacora import campos, obtener_logger
+
+log = obtener_logger('vigilancia')
+
+
+class PlanificadorPlazos:
+    """
+    Ejecuta una acción cuando vence el plazo de una clave.
+
+    Los plazos se guardan en un heap ordenado por vencimiento y un hilo duerme
+    hasta el más próximo, así que sin plazos pendientes no consume CPU.
+    Postergar un plazo (lo que ocurre con cada heartbeat) solo actualiza un
+    diccionario, O(1): la entrada vieja del heap se revisa al llegar a la cima
+    y, si el plazo se postergó, se vuelve a encolar con el nuevo vencimiento.
+    """
+
+    def __init__(self, nombre='plazos'):
+        self.nombre = nombre
+        self._plazos = {}  # clave -> [vencimiento, acción, vencimiento de su entrada vigente en el heap]
+        self._heap = []
+        self._contador = itertools.count()
+        self._condicion = threading.Condition()
+        self._hilo = None
+
+    def iniciar(self):
+        """Inicia el hilo del planificador (una sola vez)"""
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name=self.nombre, daemon=True)
+            self._hilo.start()
+
+    def programar(self, clave, segundos, accion):
+        """Programa (o posterga) ``accion(clave)`` para dentro de ``segundos``"""
+        vencimiento = time.monotonic() + segundos
+        with self._condicion:
+            plazo = self._plazos.get(clave)
+            if plazo is not None and vencimiento >= plazo[2]:
+                # Postergar: la entrada del heap se corrige cuando llegue a la cima
+                plazo[0], plazo[1] = vencimiento, accion
+                return
+            self._plazos[clave] = [vencimiento, accion, vencimiento]
+            heapq.heappush(self._heap, (vencimiento, next(self._contador), clave))
+            if self._heap[0][2] == clave:
+                self._condicion.notify()
+
+    def cancelar(self, clave):
+        """Cancela el plazo de la clave (su entrada en el heap se descarta al llegar a la cima)"""
+        with self._condicion:
+            return self._plazos.pop(clave, None) is not None
+
+    def pendientes(self):
+        return len(self._plazos)
+
+    def _vencidos(self, ahora):
+        """Saca del heap los plazos vencidos; reencola los que se postergaron"""
+        vencidos = []
+        while self._heap and self._heap[0][0] <= ahora:
+            vencimiento, _, clave = heapq.heappop(self._heap)
+            plazo = self._plazos.get(clave)
+            if plazo is None or plazo[2] != vencimiento:
+                continue  # Cancelado, o entrada reemplazada por una más próxima
+            if plazo[0] > ahora:
+                plazo[2] = plazo[0]
+                heapq.heappush(self._heap, (plazo[0], next(self._contador), clave))
+                continue
+            del self._plazos[clave]
+            vencidos.append((clave, plazo[1]))
+        return vencidos
+
+    def _bucle(self):
+        while True:
+            with self._condicion:
+                vencidos = self._vencidos(time.monotonic())
+                while not vencidos:
+                    espera = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condicion.wait(espera)
+                    vencidos = self._vencidos(time.monotonic())
+
+            for clave, accion in vencidos:
+                try:
+                    accion(clave)
+                except Exception:
+                    log.exception("Error al ejecutar un plazo vencido", extra=campos(clave=clave))
+
+
+class VigilanciaSensores:
+    """
+    Vigila la vida de los sensores con un ``PlanificadorPlazos``.
+
+    Cada heartbeat (o dato recibido, que cuenta como heartbeat implícito)
+    posterga el plazo del sensor. Si vence sin noticias, el sensor se marca
+    inactivo y se publica 'sensor_perdido'. Mientras no hay sensores activos
+    se publica un dato en cero cada ``periodo_reposo`` segundos (None = nunca).
+    ``al_perder(sensor)``, si se asigna, se llama con cada sensor perdido.
+    """
+
+    REPOSO = ('reposo',)
+
+    def __init__(self, emisor, registro, historial, difusor, timeout=5, periodo_reposo=None):
+        self.emisor = emisor
+        self.registro = registro
+        self.historial = historial
+        self.difusor = difusor
+        self.timeout = timeout
+        self.periodo_reposo = periodo_reposo
+        self.planificador = PlanificadorPlazos('vigilancia')
+        self.al_perder = None
+
+    def iniciar(self):
+        self.planificador.iniciar()
+        self.revisar_reposo()
+
+    def latido(self, sensor):
+        """Registra un heartbeat (explícito o por un dato recibido) del sensor"""
+        sensor.latido()
+        self.planificador.programar(sensor.sensor_id, self.timeout, self._sensor_vencido)
+
+    def olvidar(self, sensor_id):
+        """Deja de vigilar un sensor que se desactivó por su cuenta"""
+        self.planificador.cancelar(sensor_id)
+        self.revisar_reposo()
+
+    def revisar_reposo(self):
+        """Programa los datos en cero si no quedan sensores activos"""
+        if self.periodo_reposo and not self.registro.resumen()['activos']:
+            self.planificador.programar(self.REPOSO, self.periodo_reposo, self._reposo)
+
+    def _sensor_vencido(self, sensor_id):
+        sensor = self.registro.obtener(sensor_id)
+        if sensor is None or not self.registro.desactivar(sensor_id):
+            return
+
+        segundos = round(time.time() - sensor.ultimo_heartbeat, 1)
+        log.warning("Sensor perdido: no se ha recibido heartbeat",
+                    extra=campos(sensor_id=sensor_id, maquina_id=sensor.maquina_id, segundos=segundos))
+
+        # Notificar a todos los clientes que el sensor se perdió
+        self.emisor.emit('sensor_perdido', {'sensor_id': sensor_id, 'maquina_id': sensor.maquina_id,
+                                            'segundos': segundos})
+        self.emisor.emit('estado_sensores', self.registro.resumen())
+        if self.al_perder is not None:
+            self.al_perder(sensor)
+        self.revisar_reposo()
+
+    def _reposo(self, _):
+        # Si un sensor se activó mientras tanto, se dejan de enviar datos en cero
+        if self.registro.resumen()['activos']:
+            return
+
+        nuevos_datos = {
+            'timestamp': datetime.now().isoformat(),
+            'temperatura': 0,
+            'vibracion': 0,
+            'presion': 0
+        }
+        self.historial.agregar(nuevos_datos)
+        self.difusor.publicar(nuevos_datos)
+        self.planificador.programar(self.REPOSO, self.periodo_reposo, self._reposo)